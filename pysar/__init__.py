@@ -4,9 +4,20 @@
 miami_path = True    # Package-wide variable, Auto setting for University of Miami
                      # change it to False if you are not using the file structure of University of Miami
 parallel_num = 8     # max core number used in parallel processing
+max_memory = 4.0     # max memory in GB used in block-wise processing, i.e. time series inversion
 figsize_single_min = 6.0        # default min size in inch, for single plot
 figsize_single_max = 12.0        # default min size in inch, for single plot
 figsize_multi = [20.0, 12.0]    # default size in inch, for multiple subplots
+hdf5_layout = 'split'           # HDF5 layout for timeseries / interferograms / coherence files
+                                # split - one 2D dataset per epoch; cube - one 3D dataset in [epoch, y, x]
+                                # all scripts read both layouts; time series inversion and dem_error write in this layout,
+                                # geocode, multilook, remove_plane, tropcor_* and unwrap_error keep the input layout,
+                                # the other scripts always write split
+hdf5_chunks = [16, 128, 128]    # chunk shape in [epoch, y, x], [y, x] for 2D datasets, 'auto' for h5py auto chunking
+                                # overwritten by environment variable PYSAR_HDF5_CHUNKS, i.e. set by pysarApp template
+hdf5_compression = 'gzip'       # compression of HDF5 datasets: none, lzf, gzip, or gzip1 - gzip9 for gzip level
+                                # overwritten by environment variable PYSAR_HDF5_COMPRESSION, i.e. set by pysarApp template
+hdf5_shuffle = False            # apply shuffle filter before compression, overwritten by PYSAR_HDF5_SHUFFLE
 
 
 ###################### Do not change below this line ###################
@@ -23,6 +23,8 @@ import h5py
 import numpy as np
 import matplotlib.dates as mdates
 
+import pysar._readfile as readfile
+
 
 ################################################################
 def yyyymmdd2years(dates):
@@ -82,7 +84,7 @@ def yymmdd(dates):
 #################################################################
 def ifgram_date_list(ifgramFile, fmt='YYYYMMDD'):
     '''Read Date List from Interferogram file
-        for timeseries file, use h5file['timeseries'].keys() directly
+        for timeseries file, use readfile.get_epoch_list(h5file, 'timeseries') directly
     Inputs:
         ifgramFile - string, name/path of interferograms file
         fmt        - string, output date format, choices=['YYYYMMDD','YYMMDD']
@@ -102,7 +104,7 @@ def ifgram_date_list(ifgramFile, fmt='YYYYMMDD'):
 
     # Get date_list in YYMMDD format
     date_list = []
-    ifgram_list = sorted(h5[k].keys())
+    ifgram_list = readfile.get_epoch_list(h5, k)
     for ifgram in  ifgram_list:
         date12 = h5[k][ifgram].attrs['DATE12'].split('-')
         date_list.append(date12[0])
@@ -228,7 +230,7 @@ def list_ifgram2date12(ifgram_list):
         date12_list  - list of string in YYMMDD-YYMMDD format
     Example:
         h5 = h5py.File('unwrapIfgram.h5','r')
-        ifgram_list = sorted(h5['interferograms'].keys())
+        ifgram_list = readfile.get_epoch_list(h5, 'interferograms')
         date12_list = ptime.list_ifgram2date12(ifgram_list)
     '''
     date12_list = [str(re.findall('\d{6}[-_]\d{6}', i)[0]).replace('_','-') for i in ifgram_list]
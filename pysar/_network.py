@@ -101,7 +101,7 @@ def read_igram_pairs(igramFile):
     dateList6 = ptime.yymmdd(dateList)
 
     pairs = []
-    igramList=h5file[k[0]].keys()
+    igramList = readfile.get_epoch_list(h5file, k[0])
     for igram in igramList:
         date12 = h5file[k[0]][igram].attrs['DATE12'].split('-')
         pairs.append([dateList6.index(date12[0]),dateList6.index(date12[1])])
@@ -188,13 +188,7 @@ def get_date12_list(File):
     date12_list = []
     ext = os.path.splitext(File)[1].lower()
     if ext == '.h5':
-        k = readfile.read_attribute(File)['FILE_TYPE']
-        h5 = h5py.File(File, 'r')
-        epochList = sorted(h5[k].keys())
-        for epoch in epochList:
-            date12 = h5[k][epoch].attrs['DATE12']
-            date12_list.append(date12)
-        h5.close()
+        date12_list = list(readfile.read_hdf5_metadata(File)['DATE12'])
     else:
         date12_list = np.loadtxt(File, dtype=str).tolist()
     
@@ -208,7 +202,7 @@ def igram_perp_baseline_list(File):
     p_baseline_list = []
     k = readfile.read_attribute(File)['FILE_TYPE']
     h5 = h5py.File(File, 'r')
-    epochList = sorted(h5[k].keys())
+    epochList = readfile.get_epoch_list(h5, k)
     for epoch in epochList:
         p_baseline = (float(h5[k][epoch].attrs['P_BASELINE_BOTTOM_HDR'])+\
                       float(h5[k][epoch].attrs['P_BASELINE_TOP_HDR']))/2
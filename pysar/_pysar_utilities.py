@@ -49,9 +49,12 @@ import time
 import datetime
 import glob
 import warnings
+import collections
 
 import h5py
 import numpy as np
+from scipy import sparse
+from scipy.spatial import cKDTree
 import multiprocessing
 
 import pysar
@@ -148,7 +151,7 @@ def get_residual_std(timeseries_resid_file, mask_file='maskTempCoh.h5', ramp_typ
         if update_file(deramp_file, timeseries_resid_file):
             if not os.path.isfile(timeseries_resid_file):
                 msg = 'Can not find input timeseries residual file: '+timeseries_resid_file
-                msg += '\nRe-run dem_error.py to generate it.'
+                msg += '\nRe-run dem_error.py with --residual-cube to generate it.'
                 raise Exception(msg)
             else:
                 print 'removing a '+ramp_type+' ramp from file: '+timeseries_resid_file
@@ -185,7 +188,7 @@ def timeseries_std(inFile, maskFile='maskTempCoh.h5', outFile=None):
         raise Exception('Only timeseries file is supported, input file is: '+k)
 
     h5 = h5py.File(inFile, 'r')
-    date_list = sorted(h5[k].keys())
+    date_list = readfile.get_epoch_list(h5, k)
     date_num = len(date_list)
 
     f = open(outFile, 'w')
@@ -195,7 +198,7 @@ def timeseries_std(inFile, maskFile='maskTempCoh.h5', outFile=None):
     f.write('# Date      STD(m)\n')
     for i in range(date_num):
         date = date_list[i]
-        data = h5[k].get(date)[:]
+        data = readfile.read_hdf5_epoch(h5, k, date)
         if maskFile:
             data[mask==0] = np.nan
         std = np.nanstd(data)
@@ -235,7 +238,7 @@ def get_residual_rms(timeseries_resid_file, mask_file='maskTempCoh.h5', ramp_typ
         if update_file(deramp_file, timeseries_resid_file):
             if not os.path.isfile(timeseries_resid_file):
                 msg = 'Can not find input timeseries residual file: '+timeseries_resid_file
-                msg += '\nRe-run dem_error.py to generate it.'
+                msg += '\nRe-run dem_error.py with --residual-cube to generate it.'
                 raise Exception(msg)
             else:
                 print 'removing a '+ramp_type+' ramp from file: '+timeseries_resid_file
@@ -272,7 +275,7 @@ def timeseries_rms(inFile, maskFile='maskTempCoh.h5', outFile=None, dimension=2)
         raise Exception('Only timeseries file is supported, input file is: '+k)
 
     h5 = h5py.File(inFile, 'r')
-    date_list = sorted(h5[k].keys())
+    date_list = readfile.get_epoch_list(h5, k)
     date_num = len(date_list)
 
     f = open(outFile, 'w')
@@ -283,7 +286,7 @@ def timeseries_rms(inFile, maskFile='maskTempCoh.h5', outFile=None, dimension=2)
         f.write('# Date      RMS(m)\n')
         for i in range(date_num):
             date = date_list[i]
-            data = h5[k].get(date)[:]
+            data = readfile.read_hdf5_epoch(h5, k, date)
             if maskFile:
                 data[mask==0] = np.nan
             rms = np.sqrt(np.nanmean(np.square(data)))
@@ -300,7 +303,7 @@ def timeseries_rms(inFile, maskFile='maskTempCoh.h5', outFile=None, dimension=2)
         width = int(atr['WIDTH'])
         ts_data = np.zeros((date_num, length*width))
         for i in range(date_num):
-            data = h5[k].get(date_list[i])[:]
+            data = readfile.read_hdf5_epoch(h5, k, date_list[i])
             if maskFile:
                 data[mask==0] = np.nan
             ts_data[i,:] = data.flatten()
@@ -334,14 +337,14 @@ def timeseries_coherence(inFile, maskFile='maskTempCoh.h5', outFile=None):
     range2phase = -4*np.pi/float(atr['WAVELENGTH'])
 
     h5 = h5py.File(inFile, 'r')
-    date_list = sorted(h5[k].keys())
+    date_list = readfile.get_epoch_list(h5, k)
     date_num = len(date_list)
 
     f = open(outFile, 'w')
     f.write('# Date      spatial_average_coherence\n')
     for i in range(date_num):
         date = date_list[i]
-        data = h5[k].get(date)[:]
+        data = readfile.read_hdf5_epoch(h5, k, date)
         data = np.exp(1j*range2phase*data)
         if maskFile:
             data[mask==0] = np.nan
@@ -452,7 +455,7 @@ def add_attribute(File, atr_new=dict()):
         update = update_attribute_or_not(atr_new, atr, update)
     elif k in multi_group_hdf5_file:
         h5 = h5py.File(File, 'r')
-        epochList = h5[k].keys()
+        epochList = readfile.get_epoch_list(h5, k)
         for epoch in epochList:
             atr = h5[k][epoch].attrs
             update = update_attribute_or_not(atr_new, atr, update)
@@ -475,7 +478,7 @@ def add_attribute(File, atr_new=dict()):
             else:
                 h5[k].attrs[key] = value
     elif k in multi_group_hdf5_file:
-        epochList = h5[k].keys()
+        epochList = readfile.get_epoch_list(h5, k)
         for epoch in epochList:
             for key, value in atr_new.iteritems():
                 if value == 'None':
@@ -484,6 +487,7 @@ def add_attribute(File, atr_new=dict()):
                 else:
                     h5[k][epoch].attrs[key] = value
     h5.close()
+    readfile.clear_metadata_cache(File)
     return File
 
 
@@ -522,6 +526,36 @@ def check_parallel(file_num=1):
         return num_cores, enable_parallel, None, None
 
 
+def bounded_imap(pool, func, arg_list, ahead):
+    '''Apply func to each item of arg_list over pool and yield results in order, with at most ahead
+    results computed in advance of the caller, so that memory of pending results is bounded.
+    Items are processed in the current process if pool is None.
+    The pool is terminated if any worker raises, the exception is re-raised in the caller.
+    Example:
+        pool = multiprocessing.Pool(num_cores)
+        for box, data in bounded_imap(pool, calc_block_star, arg_list, 2*num_cores):
+            write_block(data, box)
+        pool.close()
+        pool.join()
+    '''
+    if pool is None:
+        for args in arg_list:
+            yield func(args)
+        return
+
+    result_queue = collections.deque()
+    i = 0
+    try:
+        while i < len(arg_list) or result_queue:
+            while len(result_queue) < ahead and i < len(arg_list):
+                result_queue.append(pool.apply_async(func, (arg_list[i],)))
+                i += 1
+            yield result_queue.popleft().get()
+    except:
+        pool.terminate()
+        raise
+
+
 def perp_baseline_timeseries(atr, dimension=1):
     '''Calculate perpendicular baseline for each acquisition within timeseries
     Inputs:
@@ -716,11 +750,14 @@ def check_drop_ifgram(h5, atr, ifgram_list, print_message=True):
     if 'drop_ifgram' not in atr.keys():
         return ifgram_list
 
-    ifgram_list_out = list(ifgram_list)
     k = atr['FILE_TYPE']
-    for ifgram in ifgram_list:
-        if h5[k][ifgram].attrs['drop_ifgram'] == 'yes':
-            ifgram_list_out.remove(ifgram)
+    if h5.mode == 'r':
+        # use cached drop_ifgram of all interferograms in file
+        meta = readfile.read_hdf5_metadata(h5.filename)
+        drop_ifgram = dict(zip(meta['epoch_list'], meta['drop_ifgram']))
+    else:
+        drop_ifgram = dict([(ifgram, h5[k][ifgram].attrs['drop_ifgram']) for ifgram in ifgram_list])
+    ifgram_list_out = [ifgram for ifgram in ifgram_list if drop_ifgram[ifgram] != 'yes']
     
     if len(ifgram_list) > len(ifgram_list_out) and print_message:
         print "remove interferograms with 'drop_ifgram'='yes'"
@@ -737,13 +774,13 @@ def nonzero_mask(File, outFile='mask.h5'):
     mask = np.ones([length, width])
     
     h5 = h5py.File(File,'r')
-    igramList = sorted(h5[k].keys())
+    igramList = readfile.get_epoch_list(h5, k)
     igramList = check_drop_ifgram(h5, atr, igramList)
     date12_list = ptime.list_ifgram2date12(igramList)
     prog_bar = ptime.progress_bar(maxValue=len(igramList), prefix='loading: ')
     for i in range(len(igramList)):
         igram = igramList[i]
-        data = h5[k][igram].get(igram)[:]
+        data = readfile.read_hdf5_epoch(h5, k, igram)
         mask[data==0] = 0
         prog_bar.update(i+1, suffix=date12_list[i])
     prog_bar.close()
@@ -827,20 +864,14 @@ def spatial_average(File, mask=None, box=None, saveList=False):
     # Calculate mean coherence list
     if k in multi_group_hdf5_file+multi_dataset_hdf5_file:
         h5file = h5py.File(File,'r')
-        epochList = sorted(h5file[k].keys())
+        epochList = readfile.get_epoch_list(h5file, k)
         epochNum  = len(epochList)
 
         meanList   = []
         prog_bar = ptime.progress_bar(maxValue=epochNum, prefix='calculating: ')
         for i in range(epochNum):
             epoch = epochList[i]
-            if k in multi_group_hdf5_file:
-                dset = h5file[k][epoch].get(epoch)
-            elif k in multi_dataset_hdf5_file:
-                dset = h5file[k].get(epoch)
-            else:  print 'Unrecognized group type: '+k
-            
-            data = dset[box[1]:box[3],box[0]:box[2]]
+            data = readfile.read_hdf5_epoch(h5file, k, epoch, box)
             if not mask is None:
                 data[mask==0] = np.nan
             ## supress warning 
@@ -891,7 +922,7 @@ def temporal_average(File, outFile=None):
     length = int(atr['FILE_LENGTH'])
 
     h5file = h5py.File(File)
-    epochList = sorted(h5file[k].keys())
+    epochList = readfile.get_epoch_list(h5file, k)
     epochList = check_drop_ifgram(h5file, atr, epochList)
     epochNum = len(epochList)
 
@@ -900,10 +931,8 @@ def temporal_average(File, outFile=None):
     prog_bar = ptime.progress_bar(maxValue=epochNum, prefix='calculating: ')
     for i in range(epochNum):
         epoch = epochList[i]
-        if k in multi_group_hdf5_file:
-            d = h5file[k][epoch].get(epoch)[:]
-        elif k in ['timeseries']:
-            d = h5file[k].get(epoch)[:]
+        if k in multi_group_hdf5_file+['timeseries']:
+            d = readfile.read_hdf5_epoch(h5file, k, epoch)
         else: print k+' type is not supported currently.'; sys.exit(1)
         dMean += d
         prog_bar.update(i+1)
@@ -918,7 +947,7 @@ def temporal_average(File, outFile=None):
     print 'writing >>> '+outFile
     h5mean = h5py.File(outFile, 'w')
     group  = h5mean.create_group('mask')
-    dset = group.create_dataset(os.path.basename('mask'), data=dMean, compression='gzip')
+    dset = group.create_dataset(os.path.basename('mask'), data=dMean, **writefile.storage_option(shape=dMean.shape))
     for key,value in atr.iteritems():
         group.attrs[key] = value
     h5mean.close()
@@ -997,6 +1026,81 @@ def azimuth_resolution(atr):
     return az_step
 
 
+#########################################################################
+class CoordConverter(object):
+    '''Convert coordinates between geo and radar using range/azimuth lookup table, i.e. geomap*.trans
+    The lookup table is memory-mapped once; the KD-tree of its radar coordinates for radar to geo
+    conversion is built at the first use. Use get_coord_converter() to share it within one process.
+    Example:
+        coord = get_coord_converter('geomap_4rlks.trans')
+        rg, az = coord.geo2radar(lat, lon)
+        lat, lon = coord.radar2geo(az, rg)
+    '''
+    def __init__(self, transFile):
+        self.file = transFile
+        self.atr = readfile.read_attribute(transFile)
+        self.width = int(self.atr['WIDTH'])
+        self.length = int(self.atr['FILE_LENGTH'])
+        data = np.memmap(transFile, dtype=np.float32, mode='r', shape=(self.length, 2*self.width))
+        self.rg = data[:, :self.width]
+        self.az = data[:, self.width:]
+        self.lat_first = float(self.atr['Y_FIRST'])
+        self.lon_first = float(self.atr['X_FIRST'])
+        self.lat_step = float(self.atr['Y_STEP'])
+        self.lon_step = float(self.atr['X_STEP'])
+        self.tree = None
+        self.tree_idx = None
+
+    def geo2radar(self, lat, lon):
+        '''Range/azimuth pixel number of lookup table at the nearest geo pixel of lat/lon, NaN if out of lookup table'''
+        lat = np.array(lat, np.float64)
+        row = np.rint((lat.flatten() - self.lat_first) / self.lat_step)
+        col = np.rint((np.array(lon, np.float64).flatten() - self.lon_first) / self.lon_step)
+        inside = (row >= 0) & (row < self.length) & (col >= 0) & (col < self.width)
+        rg = np.full(row.shape, np.nan, np.float32)
+        az = np.full(row.shape, np.nan, np.float32)
+        rg[inside] = self.rg[row[inside].astype(int), col[inside].astype(int)]
+        az[inside] = self.az[row[inside].astype(int), col[inside].astype(int)]
+        if lat.ndim == 0:
+            return rg[0], az[0]
+        return rg.reshape(lat.shape), az.reshape(lat.shape)
+
+    def radar2geo(self, az, rg, max_dist=np.inf):
+        '''Latitude/longitude of geo pixel whose range/azimuth is the nearest to az/rg, NaN if farther than max_dist'''
+        if self.tree is None:
+            print 'building KD-tree of lookup table: '+self.file
+            # zero value for area not covered by radar data
+            self.tree_idx = np.flatnonzero((np.array(self.rg) >= 0.5) & (np.array(self.az) >= 0.5))
+            self.tree = cKDTree(np.vstack((self.az.flatten()[self.tree_idx], self.rg.flatten()[self.tree_idx])).T)
+
+        az = np.array(az, np.float64)
+        rg = np.array(rg, np.float64)
+        dist, i = self.tree.query(np.vstack((az.flatten(), rg.flatten())).T, distance_upper_bound=max_dist)
+        found = np.isfinite(dist)
+        idx = self.tree_idx[np.minimum(i, self.tree_idx.size-1)]
+        lat = (idx // self.width) * self.lat_step + self.lat_first
+        lon = (idx %  self.width) * self.lon_step + self.lon_first
+        lat[~found] = np.nan
+        lon[~found] = np.nan
+        if az.ndim == 0:
+            return lat[0], lon[0]
+        return lat.reshape(az.shape), lon.reshape(az.shape)
+
+
+# Coordinate converter of lookup table, keyed by path, size and modification time of file
+coord_converter_cache = dict()
+
+def get_coord_converter(transFile):
+    '''Get CoordConverter of lookup table, reused by all calls within one process'''
+    transFile = os.path.abspath(transFile)
+    stat = os.stat(transFile)
+    key = (transFile, stat.st_size, stat.st_mtime)
+    if key not in coord_converter_cache:
+        coord_converter_cache.clear()
+        coord_converter_cache[key] = CoordConverter(transFile)
+    return coord_converter_cache[key]
+
+
 #########################################################################
 def glob2radar(lat, lon, transFile='geomap*.trans', atr_rdr=dict()):
     '''Convert geo coordinates into radar coordinates.
@@ -1016,9 +1120,8 @@ def glob2radar(lat, lon, transFile='geomap*.trans', atr_rdr=dict()):
     if transFile:
         # Get lat/lon resolution/step in meter
         earth_radius = 6371.0e3;    # in meter
-        print 'reading file: '+transFile
-        trans_rg, trans_atr = readfile.read(transFile, (), 'range')
-        trans_az = readfile.read(transFile, (), 'azimuth')[0]
+        coord = get_coord_converter(transFile)
+        trans_atr = coord.atr
         lat_first = float(trans_atr['Y_FIRST'])
         lon_first = float(trans_atr['X_FIRST'])
         lat_center = lat_first + float(trans_atr['Y_STEP'])*float(trans_atr['FILE_LENGTH'])/2
@@ -1044,11 +1147,11 @@ def glob2radar(lat, lon, transFile='geomap*.trans', atr_rdr=dict()):
             az0 = 0
             rg0 = 0
 
-        width  = int(trans_atr['WIDTH'])
-        row = np.rint((lat - lat_first)/lat_step_deg).astype(int)
-        col = np.rint((lon - lon_first)/lon_step_deg).astype(int)
-        rg = np.rint(trans_rg[row, col]).astype(int) - rg0
-        az = np.rint(trans_az[row, col]).astype(int) - az0
+        trans_rg, trans_az = coord.geo2radar(lat, lon)
+        if np.any(np.isnan(trans_rg)):
+            raise ValueError('Input lat/lon is out of lookup table: '+transFile)
+        rg = np.rint(trans_rg).astype(int) - rg0
+        az = np.rint(trans_az).astype(int) - az0
         rg_resid = x_factor
         az_resid = y_factor
 
@@ -1101,7 +1204,8 @@ def radar2glob(az, rg, transFile='geomap*.trans', atr_rdr=dict()):
     Inputs:
         rg/az      - np.array, int, range/azimuth pixel number
         transFile - string, trans/look up file
-        atr_rdr    - dict, attributes of file in radar coord, optional but recommended.
+        atr_rdr    - dict, attributes of file in radar coord, optional but recommended,
+                     rg/az are in the coord of subsetted file if subset_x0/y0 exists.
     Output:
         lon/lat    - np.array, float, longitude/latitude of input point (rg,az)
         latlon_res - float, residul/uncertainty of coordinate conversion
@@ -1110,21 +1214,12 @@ def radar2glob(az, rg, transFile='geomap*.trans', atr_rdr=dict()):
     except: transFile = None
 
     ##### Use geomap*.trans file for precious (pixel-level) coord conversion
-    def get_trans_row_col4radar(az, rg, trans_az, trans_rg, x_factor=10, y_factor=10):
-        mask_rg = np.multiply(trans_rg>=max(rg-x_factor,0.5), trans_rg<=rg+x_factor)
-        mask_az = np.multiply(trans_az>=max(az-y_factor,0.5), trans_az<=az+y_factor)
-        idx = np.where(np.multiply(mask_rg, mask_az))
-        trans_row, trans_col = np.mean(idx,1)
-        return trans_row, trans_col
-
-
-    ## by searching pixels in trans file with value falling buffer lat/lon value
+    ## by searching the pixel in trans file with the nearest range/azimuth value
     if transFile:
         # Get lat/lon resolution/step in meter
         earth_radius = 6371.0e3;    # in meter
-        print 'reading file: '+transFile
-        trans_rg, trans_atr = readfile.read(transFile, (), 'range')
-        trans_az = readfile.read(transFile, (), 'azimuth')[0]
+        coord = get_coord_converter(transFile)
+        trans_atr = coord.atr
         lat_first = float(trans_atr['Y_FIRST'])
         lon_first = float(trans_atr['X_FIRST'])
         lat_center = lat_first + float(trans_atr['Y_STEP'])*float(trans_atr['FILE_LENGTH'])/2
@@ -1140,20 +1235,17 @@ def radar2glob(az, rg, transFile='geomap*.trans', atr_rdr=dict()):
 
             x_factor = 2*np.ceil(abs(lon_step)/rg_step)
             y_factor = 2*np.ceil(abs(lat_step)/az_step)
+            try:    az0 = int(atr_rdr['subset_y0'])
+            except: az0 = 0
+            try:    rg0 = int(atr_rdr['subset_x0'])
+            except: rg0 = 0
         else:
             x_factor = 10
             y_factor = 10
+            az0 = 0
+            rg0 = 0
 
-        trans_row = np.zeros(rg.shape)
-        trans_col = np.zeros(rg.shape)
-        if rg.size == 1:
-            trans_row, trans_col = get_trans_row_col4radar(az, rg, trans_az, trans_rg, x_factor, y_factor)
-        else:
-            for i in range(rg.size):
-                trans_row[i], trans_col[i] = get_trans_row_col4radar(az[i], rg[i], trans_az, trans_rg, x_factor, y_factor)
-
-        lat = trans_row*lat_step_deg + lat_first
-        lon = trans_col*lon_step_deg + lon_first
+        lat, lon = coord.radar2geo(np.array(az)+az0, np.array(rg)+rg0, max_dist=np.hypot(x_factor, y_factor))
         lat_resid = y_factor*lat_step_deg
         lon_resid = x_factor*lon_step_deg
 
@@ -1234,7 +1326,7 @@ def date_list(h5file):
     k = h5file.keys()
     if 'interferograms' in k: k[0] = 'interferograms'
     elif 'coherence'    in k: k[0] = 'coherence'
-    ifgram_list = sorted(h5file[k[0]].keys())
+    ifgram_list = readfile.get_epoch_list(h5file, k[0])
     for ifgram in  ifgram_list:
         dates = h5file[k[0]][ifgram].attrs['DATE12'].split('-')
         dates1= h5file[k[0]][ifgram].attrs['DATE12'].split('-')
@@ -1305,14 +1397,451 @@ def design_matrix(ifgramFile=None, date12_list=[]):
 
 
 ######################################
-def timeseries_inversion(ifgramFile, timeseriesFile):
+def get_row_block_list(length, width, layer_num, max_memory=None, item_size=4, min_block_num=1):
+    '''Split image into row blocks, so that layer_num layers of one block fit into max_memory.
+    Inputs:
+        length/width - int, size of the whole image
+        layer_num    - int, number of 2D layers of one block held in memory at the same time
+                       i.e. ifgram_num + 3*date_num for timeseries inversion
+        max_memory   - float, max memory in GB, default is pysar.max_memory
+        item_size    - int, number of bytes of each pixel, i.e. 4 for float32
+        min_block_num - int, min number of blocks, i.e. to keep all cores busy in parallel processing
+    Output:
+        box_list - list of 4-tuple of int, defined in (x0, y0, x1, y1) in pixel coordinate
+    Example:
+        box_list = get_row_block_list(length, width, ifgram_num+3*date_num, max_memory=2)
+    '''
+    if not max_memory:
+        max_memory = pysar.max_memory
+    row_size = float(layer_num) * width * item_size
+    row_step = int(max_memory * 1024**3 / row_size)
+    row_step = min(row_step, int(np.ceil(float(length) / min_block_num)))
+    row_step = min(max(row_step, 1), length)
+
+    box_list = []
+    for y0 in range(0, length, row_step):
+        box_list.append((0, y0, width, min(y0+row_step, length)))
+    return box_list
+
+
+def ts_inverse(data, B_inv, dt):
+    '''Inverse interferograms into time series with shared inverse of design matrix.
+    Inputs:
+        data  - 2D np.array in size of (ifgram_num, pixel_num), unwrapped phase referenced in space
+        B_inv - 2D np.array in size of (date_num-1, ifgram_num), pseudo-inverse of velocity design matrix
+        dt    - 2D np.array in size of (date_num-1, 1), temporal baseline between consecutive dates
+    Output:
+        defo - 2D np.array in size of (date_num, pixel_num), phase time series with 1st date as zero
+    '''
+    defo = np.zeros((B_inv.shape[0]+1, data.shape[1]), np.float32)
+    tmp_rate = np.dot(B_inv, data)
+    tmp_rate *= dt
+    np.cumsum(tmp_rate, axis=0, out=defo[1:,:])
+    return defo
+
+
+# Cache of pseudo-inverse of design matrix for each missing-data pattern, shared by
+# all blocks processed in the same (worker) process. Cleared when it exceeds 1/4 of pysar.max_memory.
+pinv_cache = dict()
+
+def group_pixel_pattern(valid):
+    '''Group pixels by their pattern of valid observations.
+    Input:
+        valid - 2D np.array of bool in size of (obs_num, pixel_num)
+    Outputs:
+        pattern      - 1D np.array of np.void in size of (pixel_num,), packed pattern of each pixel
+        idx_first    - 1D np.array of int, index of the first pixel of each unique pattern
+        idx_inv      - 1D np.array of int in size of (pixel_num,), index of unique pattern for each pixel
+        pixel_order  - 1D np.array of int, pixel index sorted by unique pattern
+        group_bound  - 1D np.array of int, pixel_order[group_bound[i]:group_bound[i+1]] for the i-th pattern
+    '''
+    pattern = np.ascontiguousarray(np.packbits(valid, axis=0).T)
+    pattern = pattern.view(np.dtype((np.void, pattern.shape[1]))).flatten()
+    idx_first, idx_inv = np.unique(pattern, return_index=True, return_inverse=True)[1:]
+    pixel_order = np.argsort(idx_inv, kind='mergesort')
+    group_bound = np.searchsorted(idx_inv[pixel_order], np.arange(len(idx_first)+1))
+    return pattern, idx_first, idx_inv, pixel_order, group_bound
+
+
+def ts_inverse_skip_missing(data, valid, B, dt):
+    '''Inverse interferograms into time series, excluding missing observations pixel by pixel.
+    Pixels are grouped by their missing-data pattern, and the pseudo-inverse of design matrix is
+    computed once per unique pattern and cached, so the number of factorizations equals the number
+    of distinct patterns instead of the number of pixels.
+    Inputs:
+        data  - 2D np.array in size of (ifgram_num, pixel_num), unwrapped phase referenced in space
+        valid - 2D np.array of bool in size of (ifgram_num, pixel_num), False for missing observation
+        B     - 2D np.array in size of (ifgram_num, date_num-1), velocity design matrix
+        dt    - 2D np.array in size of (date_num-1, 1), temporal baseline between consecutive dates
+    Output:
+        defo - 2D np.array in size of (date_num, pixel_num), phase time series with 1st date as zero
+    '''
+    global pinv_cache
+    ifgram_num, pixel_num = data.shape
+    date_num = B.shape[1] + 1
+    B_key = B.tostring()
+
+    # Group pixels with the same missing-data pattern
+    pattern, idx_first, idx_inv, pixel_order, group_bound = group_pixel_pattern(valid)
+
+    cache_max = 0.25 * pysar.max_memory * 1024**3 / (B.size*4)
+    defo = np.zeros((date_num, pixel_num), np.float32)
+    for i in range(len(idx_first)):
+        valid_i = valid[:, idx_first[i]]
+        if not np.any(valid_i):
+            continue
+        key = (B_key, pattern[idx_first[i]].tostring())
+        if key not in pinv_cache:
+            if len(pinv_cache) > cache_max:
+                pinv_cache.clear()
+            pinv_cache[key] = np.array(np.linalg.pinv(B[valid_i,:]), np.float32)
+        pixel_idx = pixel_order[group_bound[i]:group_bound[i+1]]
+        tmp_rate = np.dot(pinv_cache[key], data[np.ix_(valid_i, pixel_idx)])
+        tmp_rate *= dt
+        defo[1:, pixel_idx] = np.cumsum(tmp_rate, axis=0)
+    return defo
+
+
+def coherence2weight(coh, weight_func='var'):
+    '''Convert spatial coherence into weight for time series inversion.
+    Inputs:
+        coh - np.array, spatial coherence in [0, 1]
+        weight_func - string, var - inverse of phase variance from Cramer-Rao bound, gamma^2/(1-gamma^2),
+                                    constant number of looks is omitted as it does not change the solution
+                              coh - spatial coherence itself
+    Output:
+        weight - np.array in float64, same size as input
+    '''
+    coh = np.clip(np.array(coh, np.float64), 0., 0.999)
+    coh[np.isnan(coh)] = 0.
+    if weight_func == 'var':
+        coh *= coh
+        weight = coh / (1. - coh)
+    elif weight_func == 'coh':
+        weight = coh
+    else:
+        raise ValueError('Un-recognized weight function: '+str(weight_func))
+    return weight
+
+
+def full_rank_pixel(valid, B):
+    '''Check whether observations of each pixel constrain all dates, once per unique pattern.
+    Inputs:
+        valid - 2D np.array of bool in size of (ifgram_num, pixel_num), True for observation with non-zero weight
+        B     - 2D np.array in size of (ifgram_num, date_num-1), velocity design matrix
+    Output:
+        full_rank - 1D np.array of bool in size of (pixel_num,)
+    '''
+    idx_first, idx_inv = group_pixel_pattern(valid)[1:3]
+    rank_ok = [np.linalg.matrix_rank(B[valid[:,i],:]) == B.shape[1] for i in idx_first]
+    return np.array(rank_ok, np.bool_)[idx_inv]
+
+
+def weighted_lstsq(data, weight, B, chunk_size=None, full_rank=None):
+    '''Solve weighted least squares of B * x = data for each pixel, batched over pixels.
+    Normal equations of all pixels are formed with two matrix products, using the outer product
+    of each row of the design matrix, then solved in batch. Pseudo-inverse is used for pixels whose
+    observations with non-zero weight do not constrain all unknowns.
+    Inputs:
+        data   - 2D np.array in size of (ifgram_num, pixel_num)
+        weight - 2D np.array in size of (ifgram_num, pixel_num), weight of each observation, 0 for missing
+        B      - 2D np.array in size of (ifgram_num, param_num), design matrix
+        chunk_size - int, number of pixels solved at once, to limit memory of normal matrices
+        full_rank  - 1D np.array of bool in size of (pixel_num,), output of full_rank_pixel()
+    Output:
+        x - 2D np.array in size of (param_num, pixel_num)
+    '''
+    ifgram_num, pixel_num = data.shape
+    m = B.shape[1]
+    BB = np.einsum('ij,ik->ijk', B, B).reshape(ifgram_num, m*m)
+    if not chunk_size:
+        chunk_size = pixel_num
+    if full_rank is None:
+        full_rank = full_rank_pixel(weight > 0., B)
+
+    x = np.zeros((m, pixel_num))
+    for c0 in range(0, pixel_num, chunk_size):
+        c1 = min(c0+chunk_size, pixel_num)
+        w = weight[:, c0:c1]
+        N = np.dot(w.T, BB).reshape(-1, m, m)
+        rhs = np.dot((w*data[:, c0:c1]).T, B)
+        fr = full_rank[c0:c1]
+        x_c = np.zeros(rhs.shape)
+        if np.any(fr):
+            x_c[fr] = np.linalg.solve(N[fr], rhs[fr][:,:,np.newaxis])[:,:,0]
+        if not np.all(fr):
+            x_c[~fr] = np.einsum('pjk,pk->pj', np.linalg.pinv(N[~fr], rcond=1e-12), rhs[~fr])
+        x[:, c0:c1] = x_c.T
+    return x
+
+
+def ts_inverse_weighted(data, weight, B, dt, chunk_size=None):
+    '''Inverse interferograms into time series with weighted least squares, batched over pixels.
+    Inputs:
+        data   - 2D np.array in size of (ifgram_num, pixel_num), unwrapped phase referenced in space
+        weight - 2D np.array in size of (ifgram_num, pixel_num), weight of each observation, 0 for missing
+        B      - 2D np.array in size of (ifgram_num, date_num-1), velocity design matrix
+        dt     - 2D np.array in size of (date_num-1, 1), temporal baseline between consecutive dates
+        chunk_size - int, number of pixels solved at once, to limit memory of normal matrices
+    Output:
+        defo - 2D np.array in size of (date_num, pixel_num), phase time series with 1st date as zero
+    '''
+    tmp_rate = weighted_lstsq(data, weight, B, chunk_size)
+    tmp_rate *= dt
+    defo = np.zeros((B.shape[1]+1, data.shape[1]), np.float32)
+    defo[1:,:] = np.cumsum(tmp_rate, axis=0)
+    return defo
+
+
+def ts_inverse_l1(data, weight, B, dt, chunk_size=None, max_iter=50, tol=1e-4, eps=1e-3):
+    '''Inverse interferograms into time series with L1-norm minimization, batched over pixels.
+    Iteratively Reweighted Least Squares (IRLS) runs on all pixels simultaneously, starting from the
+    (weighted) L2 solution; pixels are removed from the active set once converged.
+    Inputs:
+        data   - 2D np.array in size of (ifgram_num, pixel_num), unwrapped phase referenced in space
+        weight - 2D np.array in size of (ifgram_num, pixel_num), a priori weight, 0 for missing observation
+        B      - 2D np.array in size of (ifgram_num, date_num-1), velocity design matrix
+        dt     - 2D np.array in size of (date_num-1, 1), temporal baseline between consecutive dates
+        max_iter - int, max number of iterations
+        tol      - float, convergence threshold of relative change of solution
+        eps      - float, min absolute residual in radian, to avoid infinite weight
+    Output:
+        defo      - 2D np.array in size of (date_num, pixel_num), phase time series with 1st date as zero
+        converged - 1D np.array of bool in size of (pixel_num,), False for pixels with L2 / unconverged solution
+    '''
+    pixel_num = data.shape[1]
+    full_rank = full_rank_pixel(weight > 0., B)
+    tmp_rate = weighted_lstsq(data, weight, B, chunk_size, full_rank)
+
+    converged = np.zeros(pixel_num, np.bool_)
+    active = np.arange(pixel_num)
+    for i in range(max_iter):
+        resid = np.abs(data[:,active] - np.dot(B, tmp_rate[:,active]))
+        w = weight[:,active] / np.maximum(resid, eps)
+        del resid
+        rate_new = weighted_lstsq(data[:,active], w, B, chunk_size, full_rank[active])
+        del w
+        change = np.sqrt(np.sum(np.square(rate_new - tmp_rate[:,active]), axis=0))
+        done = change <= tol * np.sqrt(np.sum(np.square(rate_new), axis=0))
+        tmp_rate[:,active] = rate_new
+        converged[active[done]] = True
+        active = active[~done]
+        if active.size == 0:
+            break
+
+    tmp_rate *= dt
+    defo = np.zeros((B.shape[1]+1, pixel_num), np.float32)
+    defo[1:,:] = np.cumsum(tmp_rate, axis=0)
+    return defo, converged
+
+
+def ts_residual(data, ts_data, A, valid=None):
+    '''Calculate temporal coherence and residual statistics of time series against interferograms.
+    Inputs:
+        data    - 2D np.array in size of (ifgram_num, pixel_num), unwrapped phase referenced in space
+        ts_data - 2D np.array in size of (date_num, pixel_num), phase time series with 1st date as zero
+        A       - 2D np.array in size of (ifgram_num, date_num-1), design matrix from design_matrix()
+        valid   - 2D np.array of bool in size of (ifgram_num, pixel_num), False for missing observation
+                  None to use all finite observations
+    Outputs:
+        temp_coh  - 1D np.array in size of (pixel_num,), temporal coherence in float32
+        res_stat  - dict of 1D np.array in size of (ifgram_num,), residual sum, square sum and pixel
+                    number of each interferogram, with keys: residual_sum, residual_sqsum, residual_num
+    Reference:
+        Tizzani, P., et al. (2007), Remote Sens. Environ., 108(3), 277-289.
+    '''
+    residual = data - np.dot(A, ts_data[1:,:])
+    if valid is None:
+        valid = np.isfinite(residual)
+    residual[~valid] = 0.
+    obs_num = np.sum(valid, axis=0)
+
+    temp_coh = np.square(np.sum(np.cos(residual)*valid, axis=0))
+    temp_coh += np.square(np.sum(np.sin(residual)*valid, axis=0))
+    temp_coh = np.sqrt(temp_coh) / np.maximum(obs_num, 1)
+
+    res_stat = dict()
+    res_stat['residual_sum'] = np.sum(residual, axis=1, dtype=np.float64)
+    res_stat['residual_sqsum'] = np.sum(np.square(residual), axis=1, dtype=np.float64)
+    res_stat['residual_num'] = np.sum(valid, axis=1)
+    return np.array(temp_coh, np.float32), res_stat
+
+
+def ts_inverse_block(box, inps_dict):
+    '''Read interferograms within box and inverse them into time series in meters.
+    Each call opens input files by itself, so that it can run in a worker process.
+    Inputs:
+        box       - 4-tuple of int, area to process, defined in (x0, y0, x1, y1) in pixel coordinate
+        inps_dict - dict, with the following items:
+                    ifgramFile, ifgram_list, ref_value, B, B_inv, dt, phase2range,
+                    skip_missing   - bool, exclude zero/NaN (masked) observations pixel by pixel
+                                     instead of using them as valid observations
+                    coherenceFile  - string, coherence file for weighted inversion, None for no weight
+                    coherence_list - list of string, group name in coherenceFile matching ifgram_list
+                    weight_func    - string, var or coh, see coherence2weight()
+                    chunk_size     - int, number of pixels solved at once for weighted / L1 inversion
+                    inversion_method - string, l2 or l1
+                    A              - 2D np.array, design matrix, to calculate residual
+                    calc_residual  - bool, calculate temporal coherence and residual statistics
+                    maskFile       - string, mask file, only pixels with non-zero value are processed,
+                                     and the others are filled with NaN, None for all pixels
+    Output:
+        box     - 4-tuple of int, same as input
+        ts_data - 3D np.array in size of (date_num, box_length, box_width)
+        aux     - dict of 2D np.array in size of (box_length, box_width), auxiliary products, i.e.
+                  L1orL2 - 1 for pixel with converged L1 solution, 0 for L2 / unconverged, for L1 only
+                  temporal_coherence - temporal coherence, with calc_residual only
+                  and 1D np.array in size of (ifgram_num,) of residual statistics within box, i.e.
+                  residual_sum, residual_sqsum, residual_num, with calc_residual only, see ts_residual()
+    '''
+    ifgram_list = inps_dict['ifgram_list']
+    ifgram_num = len(ifgram_list)
+    date_num = inps_dict['B'].shape[1]+1
+    box_length, box_width = box[3]-box[1], box[2]-box[0]
+
+    # Valid pixels, only them are processed
+    pixel_idx = None
+    if inps_dict['maskFile']:
+        mask = readfile.read(inps_dict['maskFile'], box)[0]
+        pixel_idx = np.flatnonzero(mask != 0)
+        del mask
+
+    aux = dict()
+    if pixel_idx is not None and pixel_idx.size == 0:
+        ts_data = np.zeros((date_num, 0), np.float32)
+        if inps_dict['inversion_method'] == 'l1':
+            aux['L1orL2'] = np.zeros(0, np.float32)
+        if inps_dict['calc_residual']:
+            aux['temporal_coherence'] = np.zeros(0, np.float32)
+            for key in ['residual_sum','residual_sqsum','residual_num']:
+                aux[key] = np.zeros(ifgram_num)
+    else:
+        h5ifgram = h5py.File(inps_dict['ifgramFile'], 'r')
+        data = readfile.read_hdf5_stack(h5ifgram, 'interferograms', ifgram_list, box)
+        h5ifgram.close()
+        data = np.array(data.reshape(ifgram_num, -1), np.float32)
+        if pixel_idx is not None:
+            data = data[:, pixel_idx]
+        ts_data, aux = ts_inverse_pixel(data, box, inps_dict, pixel_idx)
+        del data
+
+    ts_data *= inps_dict['phase2range']
+    # Scatter valid pixels back to the whole box, with NaN for masked out pixels
+    if pixel_idx is not None:
+        ts_data = scatter_pixel(ts_data, pixel_idx, box_length*box_width)
+        for key in ['L1orL2', 'temporal_coherence']:
+            if key in aux.keys():
+                aux[key] = scatter_pixel(aux[key], pixel_idx, box_length*box_width)
+    for key in ['L1orL2', 'temporal_coherence']:
+        if key in aux.keys():
+            aux[key] = aux[key].reshape(box_length, box_width)
+    return box, ts_data.reshape(-1, box_length, box_width), aux
+
+
+def scatter_pixel(data, pixel_idx, pixel_num, fill_value=np.nan):
+    '''Scatter data of valid pixels back into all pixels, along the last axis.
+    Inputs:
+        data      - np.array in size of (..., valid_pixel_num)
+        pixel_idx - 1D np.array of int, index of valid pixels
+        pixel_num - int, number of all pixels
+    Output:
+        data_out  - np.array in size of (..., pixel_num) in float32, filled with fill_value for invalid pixels
+    '''
+    data_out = np.zeros(data.shape[:-1]+(pixel_num,), np.float32)
+    data_out[:] = fill_value
+    data_out[..., pixel_idx] = data
+    return data_out
+
+
+def ts_inverse_pixel(data, box, inps_dict, pixel_idx=None):
+    '''Inverse interferograms of pixels into time series in radian, see ts_inverse_block() for inputs.
+    Inputs:
+        data      - 2D np.array in size of (ifgram_num, pixel_num), unwrapped phase of interferograms
+        box       - 4-tuple of int, area of data, to read coherence
+        pixel_idx - 1D np.array of int, index of pixels in box, to read coherence, None for all pixels
+    Outputs:
+        ts_data - 2D np.array in size of (date_num, pixel_num)
+        aux     - dict, auxiliary products in 1D np.array, see ts_inverse_block()
+    '''
+    ifgram_num = data.shape[0]
+    valid = None
+    if inps_dict['skip_missing']:
+        valid = ~np.isnan(data)
+        valid[valid] = data[valid] != 0.
+    data -= inps_dict['ref_value']
+    if valid is not None:
+        data[~valid] = 0.
+
+    aux = dict()
+    if inps_dict['coherenceFile'] or inps_dict['inversion_method'] == 'l1':
+        if inps_dict['coherenceFile']:
+            h5coh = h5py.File(inps_dict['coherenceFile'], 'r')
+            coh = readfile.read_hdf5_stack(h5coh, 'coherence', inps_dict['coherence_list'], box)
+            h5coh.close()
+            coh = coh.reshape(ifgram_num, -1)
+            if pixel_idx is not None:
+                coh = coh[:, pixel_idx]
+            weight = coherence2weight(coh, inps_dict['weight_func'])
+            del coh
+        else:
+            weight = np.ones(data.shape)
+        if valid is not None:
+            weight[~valid] = 0.
+
+        if inps_dict['inversion_method'] == 'l1':
+            ts_data, converged = ts_inverse_l1(data, weight, inps_dict['B'], inps_dict['dt'], inps_dict['chunk_size'])
+            aux['L1orL2'] = np.array(converged, np.float32)
+        else:
+            ts_data = ts_inverse_weighted(data, weight, inps_dict['B'], inps_dict['dt'], inps_dict['chunk_size'])
+        del weight
+    elif valid is not None:
+        ts_data = ts_inverse_skip_missing(data, valid, inps_dict['B'], inps_dict['dt'])
+    else:
+        ts_data = ts_inverse(data, inps_dict['B_inv'], inps_dict['dt'])
+
+    if inps_dict['calc_residual']:
+        temp_coh, res_stat = ts_residual(data, ts_data, inps_dict['A'], valid)
+        aux['temporal_coherence'] = temp_coh
+        aux.update(res_stat)
+    return ts_data, aux
+
+
+def ts_inverse_block_star(args):
+    '''Unpack arguments of ts_inverse_block(), for multiprocessing.Pool.apply_async()'''
+    return ts_inverse_block(*args)
+
+
+def timeseries_inversion(ifgramFile, timeseriesFile, max_memory=None, parallel_num=None, skip_missing=False,\
+                         coherenceFile=None, weight_func='var', inversion_method='l2',\
+                         temp_coh_file=None, residual_file=None, maskFile=None):
     '''Implementation of the SBAS algorithm.
     modified from sbas.py written by scott baker, 2012 
     
+    Interferograms are read, inverted and written in row blocks, so that peak memory
+    is bounded by max_memory instead of the size of the whole data stack.
+    Blocks are inverted by a pool of worker processes, while the main process is the
+    only writer of the output file.
+
     Usage:
     timeseries_inversion(h5flat,h5timeseries)
       h5flat: hdf5 file with the interferograms 
       h5timeseries: hdf5 file with the output from the inversion
+      max_memory: float, max memory in GB shared by all workers, default is pysar.max_memory
+      parallel_num: int, number of worker processes, default is pysar.parallel_num
+      skip_missing: bool, exclude zero/NaN observations (i.e. masked during unwrapping) pixel by pixel,
+                    with one pseudo-inverse per unique missing-data pattern.
+                    Default is False: all observations are used with one shared pseudo-inverse.
+      coherenceFile: string, coherence file for weighted least squares inversion, None for no weight
+      weight_func: string, var or coh, convert coherence into weight, see coherence2weight()
+      inversion_method: string, l2 - (weighted) least squares
+                                l1 - L1-norm minimization with IRLS, with L1orL2.h5 written next to
+                                     the output file, 1 for converged L1 solution, 0 otherwise
+      temp_coh_file: string, output file of temporal coherence, calculated in the same pass over
+                     interferograms as the inversion, None to skip
+      residual_file: string, output text file of spatial mean and RMS of residual phase in radian
+                     for each interferogram, calculated in the same pass, None to skip
+      maskFile: string, mask file, only pixels with non-zero value are inverted,
+                and the others are filled with NaN in output files, None for all pixels
     '''
     total = time.time()
 
@@ -1323,7 +1852,7 @@ def timeseries_inversion(ifgramFile, timeseriesFile):
     pixel_num = length * width
 
     h5ifgram = h5py.File(ifgramFile,'r')
-    ifgram_list = sorted(h5ifgram['interferograms'].keys())
+    ifgram_list = readfile.get_epoch_list(h5ifgram, 'interferograms')
     ifgram_list = check_drop_ifgram(h5ifgram, atr, ifgram_list)
     ifgram_num = len(ifgram_list)
 
@@ -1334,7 +1863,7 @@ def timeseries_inversion(ifgramFile, timeseriesFile):
     date8_list = ptime.yyyymmdd(sorted(list(set(m_dates + s_dates))))
     date_num = len(date8_list)
     tbase_list = ptime.date_list2tbase(date8_list)[0]
-    dt = np.diff(tbase_list).reshape((date_num-1,1))
+    dt = np.array(np.diff(tbase_list).reshape((date_num-1,1)), np.float32)
 
     print 'number of interferograms : '+str(ifgram_num)
     print 'number of pixels in space: '+str(pixel_num)
@@ -1353,65 +1882,125 @@ def timeseries_inversion(ifgramFile, timeseriesFile):
         print 'ERROR: No ref_x/y found! Can not inverse interferograms without reference in space.'
         print 'run seed_data.py '+ifgramFile+' --mark-attribute for a quick referencing.'
         sys.exit(1)
-
-    ##### Inversion Function
-    def ts_inverse(dataLine, B_inv, dt, date_num):
-        numPoint = dataLine.shape[1]
-        tmp_rate = np.dot(B_inv, dataLine)
-        defo1 = tmp_rate * np.tile(dt,(1,numPoint))
-        defo0 = np.array([0.]*numPoint,np.float32)
-        defo  = np.vstack((defo0, np.cumsum(defo1,axis=0)))
-        return defo
-
-    ##### Read Interferograms
-    print 'Reading interferograms ...'
-    data = np.zeros((ifgram_num,pixel_num), np.float32)
-    prog_bar = ptime.progress_bar(maxValue=ifgram_num, prefix='loading: ')
-    for j in range(ifgram_num):
-        ifgram = ifgram_list[j]
-        group = h5ifgram['interferograms'][ifgram]
-        d = group.get(ifgram)[:]
-        d -= d[ref_y, ref_x]
-        data[j] = d.flatten(1)
-        prog_bar.update(j+1, suffix=date12_list[j])
+    ref_value = readfile.read_hdf5_stack(h5ifgram, 'interferograms', ifgram_list,\
+                                         box=(ref_x, ref_y, ref_x+1, ref_y+1)).reshape(ifgram_num, 1)
     h5ifgram.close()
-    prog_bar.close()
 
-    ##### Inversion
+    # Coherence for weighted inversion, matched with interferograms by date12
+    coherence_list = None
+    if coherenceFile:
+        print 'weighted least squares inversion with weight from file: '+coherenceFile
+        print 'weight function: '+weight_func
+        h5coh = h5py.File(coherenceFile, 'r')
+        coh_list_all = readfile.get_epoch_list(h5coh, 'coherence')
+        h5coh.close()
+        coh_date12_list = ptime.list_ifgram2date12(coh_list_all)
+        try:
+            coherence_list = [coh_list_all[coh_date12_list.index(i)] for i in date12_list]
+        except ValueError:
+            raise ValueError('Not all interferograms have coherence in file: '+coherenceFile)
+
+    # Row blocks, memory is shared by all workers and blocks waiting for writing
+    if not max_memory:
+        max_memory = pysar.max_memory
+    if not parallel_num:
+        parallel_num = pysar.parallel_num
+    num_cores = max(min(multiprocessing.cpu_count(), parallel_num), 1)
+    worker_memory = max_memory/(2.*num_cores)
+    layer_num = ifgram_num+3*date_num
+    chunk_size = None
+    if coherenceFile or inversion_method == 'l1':
+        # 1/4 of worker memory for normal matrices in float64 (2 copies), the rest for data and weight
+        layer_num += 2*ifgram_num
+        if inversion_method == 'l1':
+            layer_num += 4*ifgram_num
+        chunk_size = max(int(0.25*worker_memory*1024**3/(16.*(date_num-1)**2)), 1)
+        worker_memory *= 0.75
+    calc_residual = bool(temp_coh_file or residual_file)
+    if calc_residual:
+        layer_num += 2*ifgram_num
+    box_list = get_row_block_list(length, width, layer_num, worker_memory, min_block_num=4*num_cores)
+    block_num = len(box_list)
+    num_cores = min(num_cores, block_num)
+    print 'number of row blocks     : '+str(block_num)
+    print 'number of processes      : '+str(num_cores)
+    phase2range = -1*float(atr['WAVELENGTH'])/(4.*np.pi)
+
+    ##### Read and Inverse Block by Block in worker(s), Write in main process
     print 'Inversing time series ...'
-    dataPoint = np.zeros((ifgram_num,1),np.float32)
-    dataLine  = np.zeros((ifgram_num,width),np.float32)
-    tempDeformation = np.zeros((date_num,pixel_num),np.float32)
-
-    prog_bar = ptime.progress_bar(maxValue=length, prefix='calculating: ')
-    for i in range(length):
-        dataLine = data[:,i*width:(i+1)*width]
-        defoLine = ts_inverse(dataLine, B_inv, dt, date_num)
-        tempDeformation[:,i*width:(i+1)*width] = defoLine
-        prog_bar.update(i+1, every=length/100)
-    prog_bar.close()
-    del data
+    if skip_missing:
+        print 'exclude zero/NaN observations pixel by pixel'
+    if maskFile:
+        print 'skip pixels with zero value in mask file: '+maskFile
+    inps_dict = {'ifgramFile':ifgramFile, 'ifgram_list':ifgram_list, 'ref_value':ref_value,\
+                 'B':B, 'B_inv':B_inv, 'dt':dt, 'phase2range':phase2range, 'skip_missing':skip_missing,\
+                 'coherenceFile':coherenceFile, 'coherence_list':coherence_list,\
+                 'weight_func':weight_func, 'chunk_size':chunk_size, 'inversion_method':inversion_method,\
+                 'A':A, 'calc_residual':calc_residual, 'maskFile':maskFile}
+    arg_list = [(box, inps_dict) for box in box_list]
+    # pool is created before opening output HDF5 files, which are not fork-safe
+    if num_cores > 1:
+        pool = multiprocessing.Pool(num_cores)
+    else:
+        pool = None
 
-    ##### Time Series Data Preparation
-    print 'converting phase to range'
-    timeseries = np.zeros((date_num,length,width),np.float32)
-    phase2range = -1*float(atr['WAVELENGTH'])/(4.*np.pi)
-    for i in range(date_num):
-        timeseries[i] = tempDeformation[i].reshape(width,length).T
-        timeseries[i] *= phase2range
-    del tempDeformation
-  
     ##### Output Time Series File
     print 'writing >>> '+timeseriesFile
     print 'number of dates: '+str(date_num)
     h5timeseries = h5py.File(timeseriesFile,'w')
-    group = h5timeseries.create_group('timeseries')
-    prog_bar = ptime.progress_bar(maxValue=date_num, prefix='writing: ')
-    for i in range(date_num):
-        date = date8_list[i]
-        dset = group.create_dataset(date, data=timeseries[i], compression='gzip')
-        prog_bar.update(i+1, suffix=date)
+    writefile.create_hdf5_stack(h5timeseries, 'timeseries', date8_list, length, width)
+
+    # Auxiliary products in single dataset file
+    aux_file_dict = dict()
+    aux_type_dict = {'L1orL2':'mask', 'temporal_coherence':'temporal_coherence'}
+    if inversion_method == 'l1':
+        print 'L1-norm minimization with Iteratively Reweighted Least Squares'
+        aux_file_dict['L1orL2'] = os.path.join(os.path.dirname(timeseriesFile), 'L1orL2.h5')
+    if temp_coh_file:
+        aux_file_dict['temporal_coherence'] = temp_coh_file
+    h5aux = dict()
+    for key, fname in aux_file_dict.iteritems():
+        k = aux_type_dict[key]
+        print 'writing >>> '+fname
+        h5aux[key] = h5py.File(fname, 'w')
+        group = h5aux[key].create_group(k)
+        group.create_dataset(k, shape=(length, width), dtype=np.float32,\
+                             **writefile.storage_option(shape=(length, width)))
+        atr_aux = dict(atr)
+        atr_aux['FILE_TYPE'] = k
+        atr_aux['UNIT'] = '1'
+        for key2, value in atr_aux.iteritems():
+            group.attrs[key2] = value
+
+    res_stat = dict()
+    prog_bar = ptime.progress_bar(maxValue=block_num, prefix='calculating: ')
+    # keep at most 2*num_cores blocks inversed ahead of writing
+    block_results = bounded_imap(pool, ts_inverse_block_star, arg_list, 2*num_cores)
+    for i, (box, ts_data, aux) in enumerate(block_results):
+        writefile.write_hdf5_block(h5timeseries, 'timeseries', ts_data, box)
+        for key, value in aux.iteritems():
+            if key in h5aux.keys():
+                k = aux_type_dict[key]
+                h5aux[key][k][k][box[1]:box[3], box[0]:box[2]] = value
+            elif key.startswith('residual'):
+                res_stat[key] = res_stat.get(key, 0) + value
+        prog_bar.update(i+1, suffix='rows %d-%d' % (box[1], box[3]))
     prog_bar.close()
+    if pool:
+        pool.close()
+        pool.join()
+
+    if residual_file:
+        res_num = np.maximum(res_stat['residual_num'], 1)
+        res_mean = res_stat['residual_sum'] / res_num
+        res_rms = np.sqrt(res_stat['residual_sqsum'] / res_num)
+        print 'writing >>> '+residual_file
+        f = open(residual_file, 'w')
+        f.write('# spatial mean and RMS of residual phase (radian) between interferograms and time series\n')
+        f.write('# DATE12\tMEAN\tRMS\n')
+        for i in range(ifgram_num):
+            f.write('%s\t%.6f\t%.6f\n' % (date12_list[i], res_mean[i], res_rms[i]))
+        f.close()
 
     ## Attributes
     print 'calculating perpendicular baseline timeseries'
@@ -1424,191 +2013,40 @@ def timeseries_inversion(ifgramFile, timeseriesFile):
     atr['P_BASELINE_TOP_TIMESERIES'] = pbase_top
     atr['P_BASELINE_BOTTOM_TIMESERIES'] = pbase_bottom
     atr['ref_date'] = date8_list[0]
+    group = h5timeseries['timeseries']
     for key,value in atr.iteritems():
         group.attrs[key] = value
     h5timeseries.close()
+    # close auxiliary files after time series file, so they are not older than it
+    for key in h5aux.keys():
+        h5aux[key].close()
     print 'Time series inversion took ' + str(time.time()-total) +' secs\nDone.'
     return timeseriesFile
 
     
 ###################################################
-def timeseries_inversion_FGLS(h5flat,h5timeseries):
-    '''Implementation of the SBAS algorithm.
+def timeseries_inversion_FGLS(ifgramFile, timeseriesFile, max_memory=None, parallel_num=None):
+    '''Implementation of the SBAS algorithm, excluding missing (zero/NaN) observations pixel by pixel.
+    Same as timeseries_inversion(ifgramFile, timeseriesFile, skip_missing=True).
     
     Usage:
-    timeseries_inversion(h5flat,h5timeseries)
+    timeseries_inversion_FGLS(h5flat,h5timeseries)
       h5flat: hdf5 file with the interferograms 
       h5timeseries: hdf5 file with the output from the inversion
-    ##################################################'''
-  
-    total = time.time()
-    A,B = design_matrix(h5flat)
-    tbase,dateList,dateDict,dateDict2 = date_list(h5flat)
-    dt = np.diff(tbase)
-    B1 = np.linalg.pinv(B)
-    B1 = np.array(B1,np.float32)
-    ifgram_list = h5flat['interferograms'].keys()
-    ifgram_num = len(ifgram_list)
-    #dset = h5flat[ifgram_list[0]].get(h5flat[ifgram_list[0]].keys()[0])
-    #data = dset[0:dset.shape[0],0:dset.shape[1]]
-    dset=h5flat['interferograms'][ifgram_list[0]].get(ifgram_list[0])
-    data = dset[0:dset.shape[0],0:dset.shape[1]] 
-    pixel_num = np.shape(data)[0]*np.shape(data)[1]
-    print 'Reading in the interferograms'
-    #print ifgram_num,pixel_num
-    print 'number of interferograms: '+str(ifgram_num)
-    print 'number of pixels: '+str(pixel_num)
-    pixel_num_step = int(pixel_num/10)
-  
-    data = np.zeros((ifgram_num,pixel_num),np.float32)
-    for ni in range(ifgram_num):
-        dset=h5flat['interferograms'][ifgram_list[ni]].get(ifgram_list[ni])
-        #dset = h5flat[ifgram_list[ni]].get(h5flat[ifgram_list[ni]].keys()[0])
-        d = dset[0:dset.shape[0],0:dset.shape[1]]
-        #print np.shape(d)
-
-    del d
-    dataPoint = np.zeros((ifgram_num,1),np.float32)
-    modelDimension = np.shape(B)[1]
-    tempDeformation = np.zeros((date_num,pixel_num),np.float32)
-    for ni in range(pixel_num):
-        dataPoint = data[:,ni]
-        nan_ndx = dataPoint == 0.
-        fin_ndx = dataPoint != 0.
-        nan_fin = dataPoint.copy()
-        nan_fin[nan_ndx] = 1
-        if not nan_fin.sum() == len(nan_fin):
-            B1tmp = np.dot(B1,np.diag(fin_ndx))
-            tmpe_ratea = np.dot(B1tmp,dataPoint)
-            zero = np.array([0.],np.float32)
-            defo = np.concatenate((zero,np.cumsum([tmpe_ratea*dt])))
-            tempDeformation[:,ni] = defo
-        #if not np.remainder(ni,10000): print 'Processing point: %7d of %7d ' % (ni,pixel_num)
-        if not np.remainder(ni,pixel_num_step):
-            print 'Processing point: %8d of %8d, %3d' % (ni,pixel_num,(10*ni/pixel_num_step))+'%'
-    del data
-    timeseries = np.zeros((date_num,np.shape(dset)[0],np.shape(dset)[1]),np.float32)
-    factor = -1*float(h5flat['interferograms'][ifgram_list[0]].attrs['WAVELENGTH'])/(4.*np.pi)
-    for ni in range(date_num):
-        timeseries[ni] = tempDeformation[ni].reshape(np.shape(dset)[1],np.shape(dset)[0]).T
-        timeseries[ni] = timeseries[ni]*factor
-    del tempDeformation
-    timeseriesDict = {}
-    for key, value in h5flat['interferograms'][ifgram_list[0]].attrs.iteritems():
-        timeseriesDict[key] = value 
-  
-    dateIndex={}
-    for ni in range(len(dateList)):
-        dateIndex[dateList[ni]]=ni
-    if not 'timeseries' in h5timeseries:
-        group = h5timeseries.create_group('timeseries')
-        for key,value in timeseriesDict.iteritems():
-            group.attrs[key] = value
-    
-    for date in dateList:
-        if not date in h5timeseries['timeseries']:
-            dset = group.create_dataset(date, data=timeseries[dateIndex[date]], compression='gzip')
-    print 'Time series inversion took ' + str(time.time()-total) +' secs'
-
+    '''
+    return timeseries_inversion(ifgramFile, timeseriesFile, max_memory, parallel_num, skip_missing=True)
 
 
-def timeseries_inversion_L1(h5flat,h5timeseries):
-    try:
-        from l1 import l1
-        from cvxopt import normal,matrix
-    except:
-        print '-----------------------------------------------------------------------'
-        print 'cvxopt should be installed to be able to use the L1 norm minimization.'
-        print '-----------------------------------------------------------------------'
-        sys.exit(1)
-        #modified from sbas.py written by scott baker, 2012 
-  
+def timeseries_inversion_L1(ifgramFile, timeseriesFile, max_memory=None, parallel_num=None):
+    '''Implementation of the SBAS algorithm with L1-norm minimization.
+    Same as timeseries_inversion(ifgramFile, timeseriesFile, inversion_method='l1').
     
-    total = time.time()
-    A,B = design_matrix(h5flat)
-    tbase,dateList,dateDict,dateDict2 = date_list(h5flat)
-    dt = np.diff(tbase)
-    BL1 = matrix(B)
-    B1 = np.linalg.pinv(B)
-    B1 = np.array(B1,np.float32)
-    ifgram_list = h5flat['interferograms'].keys()
-    ifgram_num = len(ifgram_list)
-    #dset = h5flat[ifgram_list[0]].get(h5flat[ifgram_list[0]].keys()[0])
-    #data = dset[0:dset.shape[0],0:dset.shape[1]]
-    dset=h5flat['interferograms'][ifgram_list[0]].get(ifgram_list[0]) 
-    data = dset[0:dset.shape[0],0:dset.shape[1]] 
-    pixel_num = np.shape(data)[0]*np.shape(data)[1]
-    print 'Reading in the interferograms'
-    print ifgram_num,pixel_num
-  
-    #data = np.zeros((ifgram_num,pixel_num),np.float32)
-    data = np.zeros((ifgram_num,pixel_num))
-    for ni in range(ifgram_num):
-        dset=h5flat['interferograms'][ifgram_list[ni]].get(ifgram_list[ni])
-        #dset = h5flat[ifgram_list[ni]].get(h5flat[ifgram_list[ni]].keys()[0])
-        d = dset[0:dset.shape[0],0:dset.shape[1]]
-        #print np.shape(d)
-    
-        data[ni] = d.flatten(1)
-    del d
-    dataPoint = np.zeros((ifgram_num,1),np.float32)
-    modelDimension = np.shape(B)[1]
-    tempDeformation = np.zeros((date_num,pixel_num),np.float32)
-    print data.shape
-    DataL1=matrix(data)
-    L1ORL2=np.ones((pixel_num,1))
-    for ni in range(pixel_num):
-        print ni
-        dataPoint = data[:,ni]
-        nan_ndx = dataPoint == 0.
-        fin_ndx = dataPoint != 0.
-        nan_fin = dataPoint.copy()
-        nan_fin[nan_ndx] = 1
-        if not nan_fin.sum() == len(nan_fin):
-          
-            B1tmp = np.dot(B1,np.diag(fin_ndx))
-            #tmpe_ratea = np.dot(B1tmp,dataPoint)
-            try:
-                tmpe_ratea=np.array(l1(BL1,DataL1[:,ni]))
-                zero = np.array([0.],np.float32)
-                defo = np.concatenate((zero,np.cumsum([tmpe_ratea[:,0]*dt])))
-            except:
-                tmpe_ratea = np.dot(B1tmp,dataPoint)
-                L1ORL2[ni]=0      
-                zero = np.array([0.],np.float32)
-                defo = np.concatenate((zero,np.cumsum([tmpe_ratea*dt])))
-    
-            tempDeformation[:,ni] = defo
-        if not np.remainder(ni,10000): print 'Processing point: %7d of %7d ' % (ni,pixel_num)
-    del data
-    timeseries = np.zeros((date_num,np.shape(dset)[0],np.shape(dset)[1]),np.float32)
-    factor = -1*float(h5flat['interferograms'][ifgram_list[0]].attrs['WAVELENGTH'])/(4.*np.pi)
-    for ni in range(date_num):
-        timeseries[ni] = tempDeformation[ni].reshape(np.shape(dset)[1],np.shape(dset)[0]).T
-        timeseries[ni] = timeseries[ni]*factor
-    del tempDeformation
-    L1ORL2=np.reshape(L1ORL2,(np.shape(dset)[1],np.shape(dset)[0])).T
-    
-    timeseriesDict = {}
-    for key, value in h5flat['interferograms'][ifgram_list[0]].attrs.iteritems():
-            timeseriesDict[key] = value
-  
-    dateIndex={}
-    for ni in range(len(dateList)):
-        dateIndex[dateList[ni]]=ni
-    if not 'timeseries' in h5timeseries:
-        group = h5timeseries.create_group('timeseries')
-        for key,value in timeseriesDict.iteritems():
-            group.attrs[key] = value
-  
-    for date in dateList:
-        if not date in h5timeseries['timeseries']:
-            dset = group.create_dataset(date, data=timeseries[dateIndex[date]], compression='gzip')
-    print 'Time series inversion took ' + str(time.time()-total) +' secs'
-    L1orL2h5=h5py.File('L1orL2.h5','w')
-    gr=L1orL2h5.create_group('mask') 
-    dset=gr.create_dataset('mask',data=L1ORL2,compression='gzip')
-    L1orL2h5.close()
+    Usage:
+    timeseries_inversion_L1(h5flat,h5timeseries)
+      h5flat: hdf5 file with the interferograms 
+      h5timeseries: hdf5 file with the output from the inversion
+    '''
+    return timeseries_inversion(ifgramFile, timeseriesFile, max_memory, parallel_num, inversion_method='l1')
 
 
 def perp_baseline_ifgram2timeseries(ifgramFile, ifgram_list=[]):
@@ -1626,7 +2064,7 @@ def perp_baseline_ifgram2timeseries(ifgramFile, ifgram_list=[]):
     h5file = h5py.File(ifgramFile,'r')
 
     if not ifgram_list:
-        ifgram_list = sorted(h5file[k].keys())
+        ifgram_list = readfile.get_epoch_list(h5file, k)
 
     # P_BASELINE of all interferograms
     pbase_ifgram = []
@@ -1668,7 +2106,7 @@ def dBh_dBv_timeseries(ifgramFile):
     k=h5file.keys()
     if 'interferograms' in k: k[0] = 'interferograms'
     elif 'coherence'    in k: k[0] = 'coherence'
-    igramList = h5file[k[0]].keys()
+    igramList = readfile.get_epoch_list(h5file, k[0])
     dBh_igram=[]
     dBv_igram=[]
     for igram in igramList:
@@ -1696,7 +2134,7 @@ def Bh_Bv_timeseries(ifgramFile):
     k=h5file.keys()
     if 'interferograms' in k: k[0] = 'interferograms'
     elif 'coherence'    in k: k[0] = 'coherence'
-    igramList = h5file[k[0]].keys()
+    igramList = readfile.get_epoch_list(h5file, k[0])
     Bh_igram=[]
     Bv_igram=[]
     for igram in igramList:
@@ -1735,13 +2173,12 @@ def stacking(File):
     if k in ['timeseries','interferograms','wrapped','coherence']:
         ##### Input File Info
         h5file = h5py.File(File,'r')
-        epochList = sorted(h5file[k].keys())
+        epochList = readfile.get_epoch_list(h5file, k)
         epochNum  = len(epochList)
         prog_bar = ptime.progress_bar(maxValue=epochNum, prefix='calculating: ')
         for i in range(epochNum):
             epoch = epochList[i]
-            if k == 'timeseries':  data = h5file[k].get(epoch)[:]
-            else:                  data = h5file[k][epoch].get(epoch)[:]
+            data = readfile.read_hdf5_epoch(h5file, k, epoch)
             stack += data
             prog_bar.update(i+1)
         prog_bar.close()
@@ -1778,94 +2215,84 @@ def yymmdd(dates):
     return datesOut
 
 
-def make_triangle(dates12,igram1,igram2,igram3):
-    dates=[]
-    dates.append(igram1.split('-')[0])
-    dates.append(igram1.split('-')[1])
-    dates.append(igram2.split('-')[1])
-    datesyy=[]
-    for d in dates:
-        datesyy.append(yymmdd2YYYYMMDD(d))
-  
-    datesyy.sort()
-    Igramtriangle=[]
-    Igramtriangle.append(datesyy[0][2:]+'-'+datesyy[1][2:])
-    Igramtriangle.append(datesyy[0][2:]+'-'+datesyy[2][2:])
-    Igramtriangle.append(datesyy[1][2:]+'-'+datesyy[2][2:])
-  
-    IgramtriangleIndexes=[dates12.index(Igramtriangle[0]),dates12.index(Igramtriangle[1]),dates12.index(Igramtriangle[2])]
-    return Igramtriangle,IgramtriangleIndexes
-
 def get_triangles(h5file):
-    k=h5file.keys()
-    igramList=h5file[k[0]].keys()
-   
-    dates12=[]
-    for igram in igramList:
-        dates12.append(h5file[k[0]][igram].attrs['DATE12'])
-    Triangles=[]
-    Triangles_indexes=[]
-    for igram1 in dates12:
-        igram1_date1=igram1.split('-')[0]
-        igram1_date2=igram1.split('-')[1]
-  
-        igram2=[]
-        igram2_date2=[]
-        for d in dates12:
-            if igram1_date2==d.split('-')[0]:
-                igram2.append(d)
-                igram2_date2.append(d.split('-')[1])
-    
-        igram3=[]
-        igram3_date2=[]
-        for d in dates12:
-            if igram1_date1==d.split('-')[0] and d != igram1:
-                igram3.append(d)
-                igram3_date2.append(d.split('-')[1])
-  
-        for date in  igram2_date2:
-            if date in igram3_date2:
-                Igramtriangle,IgramtriangleIndexes = make_triangle(dates12,igram1,igram2[igram2_date2.index(date)],\
-                                                                                  igram3[igram3_date2.index(date)])
-                if not Igramtriangle in Triangles:
-                    Triangles.append(Igramtriangle)
-                    Triangles_indexes.append(IgramtriangleIndexes)
-  
-    numTriangles = np.shape(Triangles_indexes)[0]
-    curls=np.zeros([numTriangles,3],dtype=np.int)
-    for i in range(numTriangles):
-        curls[i][:]=Triangles_indexes[i]
- 
-    numIgrams=len(igramList)
-    C=np.zeros([numTriangles,numIgrams])
-    for ni in range(numTriangles):
-        C[ni][curls[ni][0]]=1
-        C[ni][curls[ni][1]]=-1
-        C[ni][curls[ni][2]]=1
- 
+    '''Get all triangles of interferograms network, i.e. date1-date2, date1-date3 and date2-date3
+    Triangles are enumerated with an index of interferograms by their first date, so that each pair
+    of adjacent interferograms is only checked once.
+    Input:
+        h5file - HDF5 file object of interferograms
+    Outputs:
+        curls     - 2D np.array of int in size of (triangle_num, 3), index of interferograms
+                    date1-date2, date1-date3, date2-date3 in each triangle
+        Triangles - list of list of 3 string, DATE12 of the interferograms in each triangle
+        C         - scipy.sparse.csr_matrix in size of (triangle_num, ifgram_num), closure matrix
+                    of date1-date2 - date1-date3 + date2-date3
+    '''
+    k = 'interferograms'
+    igramList = readfile.get_epoch_list(h5file, k)
+    dates12 = [h5file[k][igram].attrs['DATE12'] for igram in igramList]
+
+    # index of interferograms by DATE12 and by their first date
+    date12_idx = dict()
+    date1_igram = dict()
+    for i in range(len(dates12)):
+        date1, date2 = dates12[i].split('-')
+        date12_idx[dates12[i]] = i
+        date1_igram.setdefault(date1, []).append((date2, i))
+
+    Triangles = []
+    curl_list = []
+    for i in range(len(dates12)):
+        date1, date2 = dates12[i].split('-')
+        for date3, j in date1_igram.get(date2, []):
+            date13 = date1+'-'+date3
+            if date13 in date12_idx:
+                Triangles.append([dates12[i], date13, dates12[j]])
+                curl_list.append([i, date12_idx[date13], j])
+
+    numTriangles = len(curl_list)
+    curls = np.array(curl_list, dtype=np.int).reshape(numTriangles, 3)
+
+    numIgrams = len(igramList)
+    C = sparse.csr_matrix((np.tile([1., -1., 1.], numTriangles),\
+                           (np.repeat(np.arange(numTriangles), 3), curls.flatten())),\
+                          shape=(numTriangles, numIgrams))
     return curls,Triangles,C
 
 
-def generate_curls(curlfile,h5file,Triangles,curls):
-    ifgram_list = h5file['interferograms'].keys()
-    h5curlfile=h5py.File(curlfile,'w')
-    gg = h5curlfile.create_group('interferograms')
+def generate_curls(curlfile,h5file,Triangles,curls,max_memory=None):
+    '''Write closure phase of all triangles into HDF5 file, block by block.
+    Each row block of interferograms is read once and used by all triangles.
+    Inputs:
+        curlfile  - string, output file name, i.e. curls.h5
+        h5file    - HDF5 file object of interferograms
+        Triangles/curls - output of get_triangles()
+        max_memory - float, max memory in GB, default is pysar.max_memory
+    '''
+    k = 'interferograms'
+    ifgram_list = readfile.get_epoch_list(h5file, k)
+    atr = readfile.read_attribute(h5file.filename)
+    length = int(atr['FILE_LENGTH'])
+    width = int(atr['WIDTH'])
     lcurls=np.shape(curls)[0]
-    for i in range(lcurls):
-        d1=h5file['interferograms'][ifgram_list[curls[i,0]]].get(ifgram_list[curls[i,0]])
-        d2=h5file['interferograms'][ifgram_list[curls[i,1]]].get(ifgram_list[curls[i,1]])
-        d3=h5file['interferograms'][ifgram_list[curls[i,2]]].get(ifgram_list[curls[i,2]])
-        data1=d1[0:d1.shape[0],0:d1.shape[1]]
-        data2=d2[0:d2.shape[0],0:d2.shape[1]]
-        data3=d3[0:d3.shape[0],0:d3.shape[1]]
- 
-        print i
-        group = gg.create_group(Triangles[i][0]+'_'+Triangles[i][1]+'_'+Triangles[i][2])
-        dset = group.create_dataset(Triangles[i][0]+'_'+Triangles[i][1]+'_'+Triangles[i][2],\
-                                    data=data1+data3-data2, compression='gzip')
-        for key, value in h5file['interferograms'][ifgram_list[curls[i,0]]].attrs.iteritems():
-            group.attrs[key] = value
- 
+
+    curl_list = [t[0]+'_'+t[1]+'_'+t[2] for t in Triangles]
+    atr_list = [dict(h5file[k][ifgram_list[curls[i,0]]].attrs) for i in range(lcurls)]
+    h5curlfile=h5py.File(curlfile,'w')
+    writefile.create_hdf5_stack(h5curlfile, k, curl_list, length, width, atr_list=atr_list)
+
+    # interferograms, curls and one temporary of interferograms picked by triangle
+    box_list = get_row_block_list(length, width, len(ifgram_list)+2*lcurls, max_memory)
+    prog_bar = ptime.progress_bar(maxValue=len(box_list), prefix='generating curls: ')
+    for i in range(len(box_list)):
+        box = box_list[i]
+        data = readfile.read_hdf5_stack(h5file, k, ifgram_list, box)
+        curl = np.take(data, curls[:,0], axis=0)
+        curl += np.take(data, curls[:,2], axis=0)
+        curl -= np.take(data, curls[:,1], axis=0)
+        writefile.write_hdf5_block(h5curlfile, k, curl, box)
+        prog_bar.update(i+1, suffix='rows %d-%d' % (box[1], box[3]))
+    prog_bar.close()
     h5curlfile.close()
 
 
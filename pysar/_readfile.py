@@ -58,6 +58,18 @@ multi_group_hdf5_file=['interferograms','coherence','wrapped','snaphu_connect_co
 multi_dataset_hdf5_file=['timeseries']
 single_dataset_hdf5_file=['dem','mask','rmse','temporal_coherence', 'velocity']
 
+'''Two storage layouts for multi_group and multi_dataset HDF5 files
+split: one 2D dataset per epoch, h5[k][epoch] for multi_dataset, h5[k][epoch][epoch] for multi_group
+cube : one 3D dataset h5[k][k] in [epoch, y, x] with tunable chunk shape, and one 1D index dataset
+       h5[k]['epoch'] with epoch names, i.e. date for timeseries, group name for interferograms.
+       Attributes are kept as they are: h5[k].attrs for multi_dataset, h5[k][epoch].attrs for
+       multi_group (the per-epoch group is kept for attributes only).
+Use get_epoch_list(), read_hdf5_epoch() and read_hdf5_stack() to read both layouts transparently,
+never h5[k].keys(), which lists the index and 3D dataset of cube layout as epochs.
+Writers using _writefile.create_hdf5_stack() honour the layout, the others write split layout.
+'''
+cube_index_name = 'epoch'
+
 
 #########################################################################
 def read(File, box=(), epoch=''):
@@ -111,7 +123,7 @@ def read(File, box=(), epoch=''):
 
         # Read Dataset
         if k in multi_group_hdf5_file+multi_dataset_hdf5_file:
-            epochList = sorted(h5file[k].keys())
+            epochList = get_epoch_list(h5file, k)
 
             if not epoch in epochList:
                 print 'input epoch is not included in file: '+File
@@ -119,21 +131,17 @@ def read(File, box=(), epoch=''):
                 print 'epoch in file '+File
                 print epochList
 
-            if k in multi_dataset_hdf5_file:
-                dset = h5file[k].get(epoch)
-            else:
-                dset = h5file[k][epoch].get(epoch)
+            data = read_hdf5_epoch(h5file, k, epoch, box)
 
         elif k in single_dataset_hdf5_file:
             dset = h5file[k].get(k)
+            # Crop
+            if box:
+                data = dset[box[1]:box[3],box[0]:box[2]]
+            else:
+                data = dset[:,:]
         else: print 'Unrecognized h5 file type: '+k
 
-        # Crop
-        if box:
-            data = dset[box[1]:box[3],box[0]:box[2]]
-        else:
-            data = dset[:,:]
-
         h5file.close()
         return data, atr
 
@@ -147,88 +155,148 @@ def read(File, box=(), epoch=''):
     ##### ISCE
     elif processor == 'isce':
         if   ext in ['.flat']:
-            amp, data, atr = read_complex_float32(File)
+            data, atr = read_complex_float32(File, box=box, output='phase')
         elif ext in ['.cor']:
-            data, atr = read_real_float32(File)
+            data, atr = read_real_float32(File, box=box)
         elif ext in ['.slc']:
-            data, pha, atr = read_complex_float32(File)
+            data, atr = read_complex_float32(File, box=box, output='amplitude')
             #ind = np.nonzero(data)
             #data[ind] = np.log10(data[ind])     # dB
             #atr['UNIT'] = 'dB'
         else: print 'Un-supported '+processfor+' file format: '+ext
   
-        if box:  data = data[box[1]:box[3],box[0]:box[2]]
         return data, atr
 
     ##### ROI_PAC
     elif processor in ['roipac']:
         if ext in ['.unw','.cor','.hgt', '.msk']:
-            if box:
-                amp,pha,atr = read_float32(File,box)
-            else:
-                amp,pha,atr = read_float32(File)
+            pha, atr = read_float32(File, box, output='phase')
             return pha, atr
 
         elif ext in ['.dem']:
-            dem,atr = read_real_int16(File)
-            if box:  dem = dem[box[1]:box[3],box[0]:box[2]]
+            dem,atr = read_real_int16(File, box)
             return dem, atr
   
         elif ext in ['.int']:
-            amp, pha, atr = read_complex_float32(File)
-            if box:
-                pha = pha[box[1]:box[3],box[0]:box[2]]
+            pha, atr = read_complex_float32(File, box=box, output='phase')
             return pha, atr
         elif ext in ['.amp']:
-            masterAmplitude, slaveAmplitude, atr = read_complex_float32(File, real_imag=True)
-            if box:
-                masterAmplitude = masterAmplitude[box[1]:box[3],box[0]:box[2]]
-                slaveAmplitude = slaveAmplitude[box[1]:box[3],box[0]:box[2]]
-            return masterAmplitude, slaveAmplitude, atr
+            data, atr = read_complex_float32(File, real_imag=True, box=box)
+            return data.real, data.imag, atr
         elif ext in ['.flg', '.byt']:
-            flag, atr = read_flag(File)
+            flag, atr = read_flag(File, box)
             return flag, atr
   
         elif ext == '.trans':
-            if box:
-                rg,az,atr = read_float32(File,box)
-            else:
-                rg,az,atr = read_float32(File)
-
             if not epoch:
                 #print 'read range and azimuth from '+File
+                rg,az,atr = read_float32(File, box)
                 return rg, az, atr
             elif epoch in ['rg','range']:
                 #print 'read range from '+File
+                rg,atr = read_float32(File, box, output='amplitude')
                 return rg, atr
             elif epoch in ['az','azimuth']:
                 #print 'read azimuth from '+File
+                az,atr = read_float32(File, box, output='phase')
                 return az, atr
 
         ##### Gamma
     elif processor == 'gamma':
         if ext in ['.unw','.cor','.hgt_sim']:
-            data, atr = read_real_float32(File, byteorder='ieee-be')
-            if box: data = data[box[1]:box[3],box[0]:box[2]]
+            data, atr = read_real_float32(File, byteorder='ieee-be', box=box)
             return data, atr
 
         elif ext == '.mli':
-            data,atr = read_real_float32(File)
-            if box: data = data[box[1]:box[3],box[0]:box[2]]
+            data,atr = read_real_float32(File, box=box)
             return data, atr
 
         elif ext == '.slc':
-            if box:
-                amplitude, phase,atr = read_complex_int16(File, box)
-            else:
-                amplitude, phase, atr = read_complex_int16(File)
-            del phase
+            amplitude, atr = read_complex_int16(File, box, output='amplitude')
             return amplitude, atr
 
         else: print 'Un-supported '+processfor+' file format: '+ext
     else: print 'Unrecognized file format: '+ext; return 0
 
 
+#########################################################################
+# Metadata of HDF5 files read in the current process, keyed by absolute path
+metadata_cache = dict()
+
+def file_status(File):
+    '''Modification time and size of file, to validate cached metadata'''
+    stat = os.stat(File)
+    return (stat.st_mtime, stat.st_size)
+
+
+def clear_metadata_cache(File=None):
+    '''Remove cached metadata of File, or of all files if File is None. Called after writing files.'''
+    if File is None:
+        metadata_cache.clear()
+    else:
+        metadata_cache.pop(os.path.abspath(File), None)
+
+
+def attribute2dict(attrs):
+    '''Convert HDF5 attributes into dict of string'''
+    atr = dict()
+    for key, value in attrs.iteritems():  atr[key] = str(value)
+    return atr
+
+
+def read_hdf5_metadata(File):
+    '''Read metadata of PySAR HDF5 file, cached in the current process and re-read only after the file
+    is modified (mtime or size changed) or clear_metadata_cache() is called.
+    Input  : string, file name
+    Output : dict, with the following items (shared by all callers, do not modify):
+             FILE_TYPE   - string, file type / group name, i.e. timeseries, interferograms
+             epoch_list  - list of string, sorted epoch names, empty for single-dataset files
+             atr         - dict, attributes of the file, or of the first epoch for multi-group files
+             epoch_atr   - dict of dict, attributes of epochs read so far, for multi-group files
+             DATE12      - list of string, DATE12 of each epoch, for multi-group files
+             drop_ifgram - list of string, drop_ifgram of each epoch ('no' if not existed), for multi-group files
+    Example:
+        meta = read_hdf5_metadata('unwrapIfgram.h5')
+        ifgram_list = [meta['epoch_list'][i] for i in range(len(meta['epoch_list']))
+                       if meta['drop_ifgram'][i] == 'no']
+    '''
+    File = os.path.abspath(File)
+    status = file_status(File)
+    if File in metadata_cache.keys() and metadata_cache[File]['status'] == status:
+        return metadata_cache[File]
+
+    h5f = h5py.File(File,'r')
+    k = h5f.keys()
+    if   'interferograms' in k: k[0] = 'interferograms'
+    elif 'coherence'      in k: k[0] = 'coherence'
+    elif 'timeseries'     in k: k[0] = 'timeseries'
+    k = str(k[0])
+
+    meta = dict()
+    meta['status'] = status
+    meta['FILE_TYPE'] = k
+    meta['epoch_list'] = []
+    meta['epoch_atr'] = dict()
+    if   k in multi_group_hdf5_file:
+        meta['epoch_list'] = get_epoch_list(h5f, k)
+        attrs_list = [h5f[k][epoch].attrs for epoch in meta['epoch_list']]
+        meta['DATE12'] = [str(attrs.get('DATE12', '')) for attrs in attrs_list]
+        meta['drop_ifgram'] = [str(attrs.get('drop_ifgram', 'no')) for attrs in attrs_list]
+        meta['atr'] = attribute2dict(attrs_list[0])
+        meta['epoch_atr'][meta['epoch_list'][0]] = meta['atr']
+    elif k in multi_dataset_hdf5_file+single_dataset_hdf5_file:
+        if k in multi_dataset_hdf5_file:
+            meta['epoch_list'] = get_epoch_list(h5f, k)
+        meta['atr'] = attribute2dict(h5f[k].attrs)
+    else:
+        print 'Unrecognized h5 file key: '+k
+        meta['atr'] = dict()
+    h5f.close()
+
+    metadata_cache[File] = meta
+    return meta
+
+
 #########################################################################
 def read_attribute(File, epoch=''):
     '''Read attributes of input file into a dictionary
@@ -243,30 +311,22 @@ def read_attribute(File, epoch=''):
 
     ##### PySAR
     if ext in ['.h5','.he5']:
-        h5f = h5py.File(File,'r')
-        k = h5f.keys()
-        if   'interferograms' in k: k[0] = 'interferograms'
-        elif 'coherence'      in k: k[0] = 'coherence'
-        elif 'timeseries'     in k: k[0] = 'timeseries'
-        if   k[0] in multi_group_hdf5_file:
-            if epoch:
-                attrs  = h5f[k[0]][epoch].attrs
-            else:
-                attrs  = h5f[k[0]][h5f[k[0]].keys()[0]].attrs
-        elif k[0] in multi_dataset_hdf5_file+single_dataset_hdf5_file:
-            attrs  = h5f[k[0]].attrs
-        else: print 'Unrecognized h5 file key: '+k[0]
-
-        atr = dict()
-        for key, value in attrs.iteritems():  atr[key] = str(value)
+        meta = read_hdf5_metadata(File)
+        k = meta['FILE_TYPE']
+        if k in multi_group_hdf5_file and epoch:
+            if epoch not in meta['epoch_atr'].keys():
+                h5f = h5py.File(File,'r')
+                meta['epoch_atr'][epoch] = attribute2dict(h5f[k][epoch].attrs)
+                h5f.close()
+            atr = dict(meta['epoch_atr'][epoch])
+        else:
+            atr = dict(meta['atr'])
         atr['PROCESSOR'] = 'pysar'
-        atr['FILE_TYPE'] = str(k[0])
+        atr['FILE_TYPE'] = k
 
-        if k[0] == 'timeseries':
+        if k == 'timeseries':
             try: atr['ref_date']
-            except: atr['ref_date'] = sorted(h5f[k[0]].keys())[0]
-
-        h5f.close()
+            except: atr['ref_date'] = meta['epoch_list'][0]
 
     else:
         # attribute file list
@@ -313,6 +373,92 @@ def read_attribute(File, epoch=''):
     return atr
 
 
+#########################################################################
+def is_cube_hdf5(h5file, k):
+    '''Check whether group k of opened HDF5 file is stored in cube layout'''
+    return k in multi_group_hdf5_file+multi_dataset_hdf5_file and\
+           isinstance(h5file[k].get(k), h5py.Dataset) and cube_index_name in h5file[k]
+
+
+def get_epoch_list(h5file, k):
+    '''Get list of epoch names of group k in opened HDF5 file, for both split and cube layout
+    Inputs:
+        h5file - HDF5 file object
+        k      - string, file type / group name, i.e. timeseries, interferograms
+    Output:
+        epochList - list of string, sorted date for timeseries, sorted group name for interferograms
+    Example:
+        h5 = h5py.File('timeseries.h5','r')
+        dateList = get_epoch_list(h5, 'timeseries')
+    '''
+    if is_cube_hdf5(h5file, k):
+        return [str(i) for i in h5file[k][cube_index_name][:]]
+    return sorted(h5file[k].keys())
+
+
+def read_hdf5_epoch(h5file, k, epoch, box=None):
+    '''Read 2D matrix of one epoch from group k of opened HDF5 file, for both split and cube layout
+    Inputs:
+        h5file - HDF5 file object
+        k      - string, file type / group name, i.e. timeseries, interferograms
+        epoch  - string, date for timeseries, group name for interferograms
+        box    - 4-tuple of int, area to read, defined in (x0, y0, x1, y1) in pixel coordinate
+    Output:
+        data - 2D np.array
+    '''
+    if is_cube_hdf5(h5file, k):
+        dset = h5file[k].get(k)
+        idx = get_epoch_list(h5file, k).index(epoch)
+        if box:
+            return dset[idx, box[1]:box[3], box[0]:box[2]]
+        return dset[idx, :, :]
+
+    if k in multi_dataset_hdf5_file:
+        dset = h5file[k].get(epoch)
+    else:
+        dset = h5file[k][epoch].get(epoch)
+    if box:
+        return dset[box[1]:box[3],box[0]:box[2]]
+    return dset[:,:]
+
+
+def read_hdf5_stack(h5file, k, epoch_list=None, box=None):
+    '''Read 3D matrix in [epoch, y, x] from group k of opened HDF5 file, for both split and cube layout
+    Cube layout is read with one hyperslab selection, which is much cheaper for row block and point reading.
+    Inputs:
+        h5file     - HDF5 file object
+        k          - string, file type / group name, i.e. timeseries, interferograms
+        epoch_list - list of string, epochs to read, all epochs by default
+        box        - 4-tuple of int, area to read, defined in (x0, y0, x1, y1) in pixel coordinate
+    Output:
+        data - 3D np.array in size of (epoch_num, box_length, box_width)
+    Example:
+        h5 = h5py.File('timeseries.h5','r')
+        d_ts = read_hdf5_stack(h5, 'timeseries', box=(x, y, x+1, y+1)).flatten()
+    '''
+    epochListAll = get_epoch_list(h5file, k)
+    if not epoch_list:
+        epoch_list = epochListAll
+    if is_cube_hdf5(h5file, k):
+        dset = h5file[k].get(k)
+        if not box:
+            box = (0, 0, dset.shape[2], dset.shape[1])
+        if list(epoch_list) == epochListAll:
+            return dset[:, box[1]:box[3], box[0]:box[2]]
+        # h5py fancy indexing requires increasing index
+        idx = [epochListAll.index(i) for i in epoch_list]
+        idx_sort = sorted(idx)
+        data = dset[idx_sort, box[1]:box[3], box[0]:box[2]]
+        return data[[idx_sort.index(i) for i in idx]]
+
+    d0 = read_hdf5_epoch(h5file, k, epoch_list[0], box)
+    data = np.zeros((len(epoch_list), d0.shape[0], d0.shape[1]), d0.dtype)
+    data[0] = d0
+    for i in range(1, len(epoch_list)):
+        data[i] = read_hdf5_epoch(h5file, k, epoch_list[i], box)
+    return data
+
+
 #########################################################################
 def check_variable_name(path):
     s=path.split("/")[0]
@@ -479,7 +625,27 @@ def merge_attribute(atr1,atr2):
 
 
 #########################################################################
-def read_float32(File, box=None):
+def read_binary(File, shape, box=None, dtype=np.float32):
+    '''Read window of 2D matrix from flat binary file using memory map, so that only the bytes
+    of rows within the window are read from disk.
+    Inputs:
+        File  - string, path of binary file
+        shape - 2-tuple of int, number of rows and columns of matrix in file, in unit of dtype
+        box   - 4-tuple of int, window to read, defined in (x0, y0, x1, y1) in matrix column/row number
+        dtype - data type in file, i.e. '>f4' for big-endian float32
+    Output:
+        data  - 2D np.array in native byte order
+    '''
+    if not box:
+        box = (0, 0, shape[1], shape[0])
+    data = np.memmap(File, dtype=dtype, mode='r', shape=tuple(shape))
+    data = np.array(data[box[1]:box[3], box[0]:box[2]])
+    if not data.dtype.isnative:
+        data = data.astype(data.dtype.newbyteorder('='))
+    return data
+
+
+def read_float32(File, box=None, output='amplitude_phase'):
     '''Reads roi_pac data (RMG format, interleaved line by line)
     should rename it to read_rmg_float32()
     
@@ -497,9 +663,12 @@ def read_float32(File, box=None):
     ......
     
        box  : 4-tuple defining the left, upper, right, and lower pixel coordinate.
+       output : string, amplitude_phase, amplitude or phase, to read only the needed band,
+                i.e. 1st / 2nd band for amplitude / phase
     Example:
        a,p,r = read_float32('100102-100403.unw')
        a,p,r = read_float32('100102-100403.unw',(100,1200,500,1500))
+       p,r   = read_float32('100102-100403.unw', output='phase')
     '''
 
     atr = read_attribute(File)
@@ -508,19 +677,20 @@ def read_float32(File, box=None):
     if not box:
         box = [0,0,width,length]
 
-    data = np.fromfile(File,np.float32,box[3]*2*width).reshape(box[3],2*width)
-    amplitude = data[box[1]:box[3],box[0]:box[2]]
-    phase     = data[box[1]:box[3],width+box[0]:width+box[2]]
+    if output != 'phase':
+        amplitude = read_binary(File, (length, 2*width), (box[0], box[1], box[2], box[3]), np.float32)
+    if output != 'amplitude':
+        phase     = read_binary(File, (length, 2*width), (width+box[0], box[1], width+box[2], box[3]), np.float32)
 
-    #oddindices = np.where(np.arange(length*2)&1)[0]
-    #data = np.fromfile(File,np.float32,length*2*width).reshape(length*2,width)
-    #amplitude = np.array([data.take(oddindices-1,axis=0)]).reshape(length,width)
-    #phase     = np.array([data.take(oddindices,  axis=0)]).reshape(length,width)
-
-    return amplitude, phase, atr
+    if output == 'amplitude':
+        return amplitude, atr
+    elif output == 'phase':
+        return phase, atr
+    else:
+        return amplitude, phase, atr
 
 
-def read_complex_float32(File, real_imag=False):
+def read_complex_float32(File, real_imag=False, box=None, output='amplitude_phase'):
     '''Read complex float 32 data matrix, i.e. roi_pac int or slc data.
     old name: read_complex64()
     
@@ -536,47 +706,53 @@ def read_complex_float32(File, real_imag=False):
         real_imag : flag for output format, 
                     0 for amplitude and phase [by default], 
                     non-0 : for real and imagery
+        box  : 4-tuple defining the left, upper, right, and lower pixel coordinate.
+        output : string, amplitude_phase, amplitude or phase, to calculate only the needed
+                 matrix for real_imag == 0
     
     Example:
         amp, phase, atr = read_complex_float32('geo_070603-070721_0048_00018.int')
-        data, atr       = read_complex_float32('150707.slc', 1)
+        phase, atr      = read_complex_float32('geo_070603-070721_0048_00018.int', output='phase')
+        data, atr       = read_complex_float32('150707.slc', 1, (100,1200,500,1500))
     '''
 
     atr = read_attribute(File)
     width = int(float(atr['WIDTH']))
     length = int(float(atr['FILE_LENGTH']))
-    ##data = np.fromfile(File,np.complex64,length*2*width).reshape(length,width)
-    data = np.fromfile(File,np.complex64,length*width).reshape(length,width)
+    data = read_binary(File, (length, width), box, np.complex64)
 
-    if not real_imag:
-        amplitude = np.array([np.hypot(  data.real,data.imag)]).reshape(length,width)
-        phase     = np.array([np.arctan2(data.imag,data.real)]).reshape(length,width)
-        return amplitude, phase, atr
-    else:
+    if real_imag:
         return data, atr
+    elif output == 'amplitude':
+        return np.abs(data), atr
+    elif output == 'phase':
+        return np.angle(data), atr
+    else:
+        return np.abs(data), np.angle(data), atr
 
 
-def read_real_float32(fname, byteorder=None):
+def read_real_float32(fname, byteorder=None, box=None):
     '''Read real float 32 data matrix, i.e. GAMMA .mli file
     Parameters: fname     : str, path, filename to be read
                 byteorder : str, optional, order of reading byte in the file
+                box       : 4-tuple of int, optional, area to read in (x0, y0, x1, y1)
     Returns: data : 2D np.array, data matrix 
              atr  : dict, attribute dictionary
     Usage: data, atr = read_real_float32('20070603.mli')
-           data, atr = read_real_float32('diff_filt_130118-130129_4rlks.unw')
+           data, atr = read_real_float32('diff_filt_130118-130129_4rlks.unw', byteorder='ieee-be')
     '''
     atr = read_attribute(fname)
     width = int(float(atr['WIDTH']))
     length = int(float(atr['FILE_LENGTH']))
 
     if byteorder in ['big-endian','b','ieee-be']:
-        data = np.fromfile(fname, dtype='>f4').reshape(length, width)
+        data = read_binary(fname, (length, width), box, '>f4')
     else:
-        data = np.fromfile(fname, dtype=np.float32).reshape(length, width)
+        data = read_binary(fname, (length, width), box, np.float32)
     return data, atr
 
 
-def read_complex_int16(File, box=None, real_imag=False):
+def read_complex_int16(File, box=None, real_imag=False, output='amplitude_phase'):
     '''Read complex int 16 data matrix, i.e. GAMMA SCOMPLEX file (.slc)
     
     Gamma file: .slc
@@ -584,9 +760,12 @@ def read_complex_int16(File, box=None, real_imag=False):
     Inputs:
        file: complex data matrix (cpx_int16)
        box: 4-tuple defining the left, upper, right, and lower pixel coordinate.
+       output: string, amplitude_phase, amplitude or phase, to calculate only the needed
+               matrix for real_imag == False
     Example:
-       data,rsc = read_complex_int16('100102.slc')
-       data,rsc = read_complex_int16('100102.slc',(100,1200,500,1500))
+       amp, pha, atr = read_complex_int16('100102.slc')
+       amp, pha, atr = read_complex_int16('100102.slc',(100,1200,500,1500))
+       amp, atr      = read_complex_int16('100102.slc', output='amplitude')
     '''
 
     atr = read_attribute(File)
@@ -595,30 +774,23 @@ def read_complex_int16(File, box=None, real_imag=False):
     if not box:
         box = [0,0,width,length]
 
-    data = np.fromfile(File,np.int16,box[3]*2*width).reshape(box[3],2*width)
-    data = data[box[1]:box[3],2*box[0]:2*box[2]].flatten()
-    odd_idx = np.arange(1, len(data), 2)
-    real = data[odd_idx-1].reshape(box[3]-box[1],box[2]-box[0])
-    imag = data[odd_idx].reshape(box[3]-box[1],box[2]-box[0])
+    data = read_binary(File, (length, 2*width), (2*box[0], box[1], 2*box[2], box[3]), np.int16)
+    real = data[:, 0::2]
+    imag = data[:, 1::2]
 
     if real_imag:
         return real, imag, atr
+    real = np.array(real, np.float32)
+    imag = np.array(imag, np.float32)
+    if output == 'amplitude':
+        return np.hypot(imag,real), atr
+    elif output == 'phase':
+        return np.arctan2(imag,real), atr
     else:
-        amplitude = np.array([np.hypot(imag,real)]).reshape(length,width)
-        phase = np.array([np.arctan2(imag,real)]).reshape(length,width)
-        return amplitude, phase, atr
-
-    #data = np.fromfile(File,np.int16,length*2*width).reshape(length*2,width)
-    #oddindices = np.where(np.arange(length*2)&1)[0]
-    #real = np.array([data.take(oddindices-1,axis=0)]).reshape(length,width)
-    #imag = np.array([data.take(oddindices,  axis=0)]).reshape(length,width)
-
-    #amplitude = np.array([np.hypot(  real,imag)]).reshape(length,width)
-    #phase     = np.array([np.arctan2(imag,real)]).reshape(length,width)
-    #return amplitude, phase, parContents
+        return np.hypot(imag,real), np.arctan2(imag,real), atr
 
 
-def read_dem(File):
+def read_dem(File, box=None):
     '''Read real int 16 data matrix, i.e. ROI_PAC .dem file.
     Input:  roi_pac format dem file
     Usage:  dem, atr = read_real_int16('gsi10m_30m.dem')
@@ -626,20 +798,16 @@ def read_dem(File):
     atr = read_attribute(File)
     width = int(float(atr['WIDTH']))
     length = int(float(atr['FILE_LENGTH'])) 
-    dem = np.fromfile(File, dtype=np.int16).reshape(length, width)
+    dem = read_binary(File, (length, width), box, np.int16)
     return dem, atr
 
 
-def read_real_int16(File):
+def read_real_int16(File, box=None):
     '''Same as read_dem() above'''
-    atr = read_attribute(File)
-    width = int(float(atr['WIDTH']))
-    length = int(float(atr['FILE_LENGTH'])) 
-    dem = np.fromfile(File, dtype=np.int16).reshape(length, width)
-    return dem, atr
+    return read_dem(File, box)
 
 
-def read_flag(File):
+def read_flag(File, box=None):
     '''Read binary file with flags, 1-byte values with flags set in bits
     For ROI_PAC .flg, *_snap_connect.byt file.    
     '''
@@ -652,7 +820,7 @@ def read_flag(File):
     width = int(float(atr['WIDTH']))
     length = int(float(atr['FILE_LENGTH'])) 
     
-    flag = np.fromfile(File, dtype=bool).reshape(length, width)
+    flag = read_binary(File, (length, width), box, np.bool_)
     
     return flag, atr
 
@@ -690,7 +858,7 @@ def read_multiple(File,box=''):  # Not ready yet
     ##### Bounding Box
     if box == '':  box = [0,0,width,length]
 
-    epochList = h5file[k].keys()
+    epochList = get_epoch_list(h5file, k)
     epochNum  = len(epochList)
     if epochNum == 0:   print "There is no data in the file";  sys.exit(1)
  
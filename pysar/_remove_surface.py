@@ -7,96 +7,163 @@
 # Yunjun, Jun 2016: merge functions for interferograms, timeseries
 #                   into one, and use read() for all the others
 # Yunjun, Aug 2016: add remove*multiple_surface()
+# Estimate surfaces of all epochs with one shared pseudo-inverse of design matrix
 # Recommend usage:
 #     import pysar._remove_surface as rm
 
 
 import os
 import time
+import hashlib
 
 import h5py
 import numpy as np
 
+import pysar
 import pysar._datetime as ptime
 import pysar._readfile as readfile
 import pysar._writefile as writefile
+from pysar._readfile import multi_group_hdf5_file, multi_dataset_hdf5_file
 
 
 ##################################################################
-def remove_data_surface(data, mask, surf_type='plane'):
-    '''Remove surface from input data matrix based on pixel marked by mask'''
-    mask[np.isnan(data)] = 0
-    mask = mask.flatten(1) 
-    z = data.flatten(1)
-    ndx= mask !=0
-    x = range(0,np.shape(data)[1])
-    y = range(0,np.shape(data)[0])
-    x1,y1 = np.meshgrid(x,y)
-    points = np.vstack((y1.flatten(1),x1.flatten(1))).T
-    if surf_type=='quadratic':
-        G = np.array([points[:,0]**2,points[:,1]**2,points[:,0],points[:,1],points[:,0]*points[:,1],\
-                     np.ones(np.shape(points)[0])],np.float32).T
-    elif surf_type=='plane':
-        G = np.array([points[:,0],points[:,1],\
-                     np.ones(np.shape(points)[0])],np.float32).T
-    elif surf_type == 'quadratic_range':
-        G = np.array([points[:,1]**2,points[:,1],\
-                     np.ones(np.shape(points)[0])],np.float32).T
-    elif surf_type == 'quadratic_azimuth':
-        G = np.array([points[:,0]**2,points[:,0],\
-                     np.ones(np.shape(points)[0])],np.float32).T
-    elif surf_type=='plane_range':
-        G = np.array([points[:,1],\
-                     np.ones(np.shape(points)[0])],np.float32).T
-    elif surf_type=='plane_azimuth':
-        G = np.array([points[:,0],\
-                     np.ones(np.shape(points)[0])],np.float32).T
-  
-    z = z[ndx]
-    G = G[ndx]
-    G1=np.linalg.pinv(G)
-    plane = np.dot(G1,z)
-  
-    if   surf_type == 'quadratic':
-        zplane = plane[0]*y1**2 + plane[1]*x1**2 + plane[2]*y1 + plane[3]*x1 + plane[4]*y1*x1 + plane[5]
-    elif surf_type =='plane':
-        zplane = plane[0]*y1 + plane[1]*x1 + plane[2]
-    elif surf_type == 'quadratic_range':
-        zplane = plane[0]*x1**2  + plane[1]*x1 + plane[2]
-    elif surf_type == 'quadratic_azimuth':
-        zplane = plane[0]*y1**2  + plane[1]*y1 + plane[2]
-    elif surf_type == 'plane_range':
-        zplane = plane[0]*x1 + plane[1]
-    elif surf_type == 'plane_azimuth':
-        zplane = plane[0]*y1 + plane[1]
+# Exponents of y and x of each term of surface, in the column order of design matrix
+surface_terms = {'quadratic'        : [(2,0), (0,2), (1,0), (0,1), (1,1), (0,0)],
+                 'plane'            : [(1,0), (0,1), (0,0)],
+                 'quadratic_range'  : [(0,2), (0,1), (0,0)],
+                 'quadratic_azimuth': [(2,0), (1,0), (0,0)],
+                 'plane_range'      : [(0,1), (0,0)],
+                 'plane_azimuth'    : [(1,0), (0,0)]}
+
 
+def surface_design_matrix(y, x, surf_type='plane', dtype=np.float64):
+    '''Design matrix of surface in pixel coordinates
+    Inputs:
+        y/x       - 1D np.array, row/column number of pixels
+        surf_type - string, quadratic, plane, quadratic_range, quadratic_azimuth, plane_range, plane_azimuth
+    Output:
+        G - 2D np.array in size of (pixel_num, param_num)
     '''
-    ## Some notes from _pysar_utilities.py remove_surface_velocity()
-    print '%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%'
-    print 'Plane parameters:'
-    if surf_type == 'plane_range':
-       print 'range gradient = ' + str(1000*plane[0][0]) + ' mm/yr/pixel'
-       width= float(h5file['velocity'].attrs['WIDTH'])
-       MaxRamp=width*1000*plane[0][0]
-       print 'Maximum ramp in range direction = ' + str(MaxRamp) + ' mm/yr'
-       h5flat['velocity'].attrs['Range_Gradient'] = str(1000*plane[0][0]) + '   mm/yr/pixel'
-       h5flat['velocity'].attrs['Range_Ramp'] = str(MaxRamp) + '   mm/yr'
-    elif surf_type == 'plane_azimuth':
-       print 'azimuth gradient = ' + str(1000*plane[0][0]) + ' mm/yr/pixel'
-       length= float(h5file['velocity'].attrs['FILE_LENGTH'])
-       MaxRamp=length*1000*plane[0][0]
-       h5flat['velocity'].attrs['Azimuth_Gradient'] = str(1000*plane[0][0]) + '   mm/yr/pixel'
-       h5flat['velocity'].attrs['Azimuth_Ramp'] = str(MaxRamp) +'   mm/yr'
-       print 'Maximum ramp in azimuth direction = '+ str(MaxRamp) + ' mm/yr'
-    print '%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%'
+    if surf_type not in surface_terms.keys():
+        raise ValueError('Un-recognized surface type: '+surf_type)
+    y = np.array(y, np.float64)
+    x = np.array(x, np.float64)
+    G = np.array([y**i * x**j for i, j in surface_terms[surf_type]], dtype).T
+    return G
+
+
+def surface_ramp(coef, length, width, surf_type='plane', dtype=np.float32):
+    '''Evaluate surface of each epoch on the whole grid, by broadcasting row and column terms,
+    without the full-size design matrix.
+    Inputs:
+        coef  - 2D np.array in size of (epoch_num, param_num), output of estimate_surface()
+        length/width - int, size of grid
+    Output:
+        ramp  - 3D np.array in size of (epoch_num, length, width)
     '''
-  
-    data_n = data - zplane
+    y = np.arange(length, dtype=np.float64).reshape(-1, 1)
+    x = np.arange(width, dtype=np.float64).reshape(1, -1)
+    ramp = np.zeros((coef.shape[0], length, width), dtype)
+    for n in range(len(surface_terms[surf_type])):
+        i, j = surface_terms[surf_type][n]
+        term = np.array((y**i) * (x**j), dtype)
+        for e in range(coef.shape[0]):
+            ramp[e] += coef[e, n] * term
+    return ramp
+
+
+# Pseudo-inverse of design matrix of each mask, missing-data pattern and surface type, shared by all
+# epochs/blocks, i.e. one per sub-area for multiple surfaces, cleared when exceeding 1/4 of pysar.max_memory
+surface_pinv_cache = dict()
+# Mask of the last call, with its pixel index and checksum, so that the same mask object is hashed once
+surface_mask_memo = dict()
+
+def estimate_surface(data, mask, surf_type='plane'):
+    '''Estimate surface coefficients of all epochs at once, using pixels marked by mask
+    The pseudo-inverse of design matrix is computed once for the mask and shared by all epochs;
+    epochs with NaN within the mask are grouped by their missing-data pattern, with one cached
+    pseudo-inverse per pattern.
+    Inputs:
+        data  - 3D np.array in size of (epoch_num, length, width)
+        mask  - 2D np.array in size of (length, width), pixels with non-zero value are used,
+                should not be modified in place between calls
+        surf_type - string, surface type, see surface_design_matrix()
+    Output:
+        coef  - 2D np.array in float64 in size of (epoch_num, param_num)
+    '''
+    global surface_pinv_cache, surface_mask_memo
+    epoch_num, length, width = data.shape
+    if surface_mask_memo.get('mask') is mask:
+        idx = surface_mask_memo['idx']
+        mask_key = surface_mask_memo['key']
+    else:
+        idx = np.flatnonzero(np.array(mask).flatten() != 0)
+        mask_key = hashlib.md5(idx.tostring()).hexdigest()
+        surface_mask_memo = {'mask':mask, 'idx':idx, 'key':mask_key}
+    z = np.array(data.reshape(epoch_num, -1)[:, idx], np.float64)
+
+    # Group epochs by missing-data pattern, None for epochs without NaN
+    nan_flag = np.isnan(z)
+    nan_epoch = np.any(nan_flag, axis=1)
+    epoch_group = dict()
+    if not np.all(nan_epoch):
+        epoch_group[None] = np.flatnonzero(~nan_epoch)
+    for e in np.flatnonzero(nan_epoch):
+        pattern_key = hashlib.md5(np.packbits(nan_flag[e]).tostring()).hexdigest()
+        epoch_group.setdefault(pattern_key, []).append(e)
+
+    G = None
+    coef = np.zeros((epoch_num, len(surface_terms[surf_type])))
+    for pattern_key, epochs in epoch_group.iteritems():
+        epochs = np.array(epochs)
+        valid = ~nan_flag[epochs[0]]
+        if not np.any(valid):
+            continue
+        key = (surf_type, length, width, mask_key, pattern_key)
+        if key not in surface_pinv_cache:
+            if G is None:
+                G = surface_design_matrix(idx // width, idx % width, surf_type)
+            if pattern_key is None:
+                G_inv = np.linalg.pinv(G)
+            else:
+                G_inv = np.linalg.pinv(G[valid])
+            cache_size = sum([i.nbytes for i in surface_pinv_cache.values()]) + G_inv.nbytes
+            if cache_size > 0.25 * pysar.max_memory * 1024**3:
+                surface_pinv_cache.clear()
+            surface_pinv_cache[key] = G_inv
+        if pattern_key is None:
+            z_group = z[epochs]
+        else:
+            z_group = z[np.ix_(epochs, valid)]
+        coef[epochs] = np.dot(z_group, surface_pinv_cache[key].T)
+    return coef
+
+
+def remove_data_surface_stack(data, mask, surf_type='plane'):
+    '''Remove surface from each epoch of 3D data matrix based on pixels marked by mask
+    Inputs:
+        data  - 3D np.array in size of (epoch_num, length, width)
+        mask  - 2D np.array in size of (length, width), pixels with non-zero value are used
+        surf_type - string, surface type, see surface_design_matrix()
+    Outputs:
+        data_n - 3D np.array, data with surface removed, pixels with zero value are kept as zero
+        ramp   - 3D np.array, surface of each epoch
+        coef   - 2D np.array in size of (epoch_num, param_num), surface coefficients of each epoch,
+                 in the order of surface_terms[surf_type]
+    '''
+    coef = estimate_surface(data, mask, surf_type)
+    ramp = surface_ramp(coef, data.shape[1], data.shape[2], surf_type, data.dtype)
+    data_n = data - ramp
     data_n[data == 0.] = 0.
-    data_n = np.array(data_n,data.dtype)
-    zplane = np.array(zplane,data.dtype)
-  
-    return data_n, zplane
+    return data_n, ramp, coef
+
+
+def remove_data_surface(data, mask, surf_type='plane'):
+    '''Remove surface from input data matrix based on pixel marked by mask'''
+    mask = np.array(mask)
+    mask[np.isnan(data)] = 0
+    data_n, zplane = remove_data_surface_stack(data[np.newaxis,:,:], mask, surf_type)[0:2]
+    return data_n[0], zplane[0]
 
 
 ##################################################################
@@ -134,9 +201,22 @@ def remove_data_multiple_surface(data, mask, surf_type, ysub):
 
 
 ##################################################################
-def remove_surface(File, surf_type, maskFile=None, outFile=None, ysub=None):
+def remove_surface(File, surf_type, maskFile=None, outFile=None, ysub=None, max_memory=None):
+    '''Remove surface from file, epochs of multi-epoch file are processed in chunks
+    Inputs:
+        File       - string, path of file to remove surface from
+        surf_type  - string, surface type, see surface_design_matrix()
+        maskFile   - string, path of mask file, pixels with non-zero value are used for estimation
+        outFile    - string, path of output file
+        ysub       - list of int, row number of sub-areas to estimate multiple surfaces
+        max_memory - float, max memory in GB for each chunk of epochs, default is pysar.max_memory
+    Output:
+        outFile    - string, path of output file
+    '''
     start = time.time()
     atr = readfile.read_attribute(File)
+    length = int(atr['FILE_LENGTH'])
+    width = int(atr['WIDTH'])
     
     # Output File Name
     if not outFile:
@@ -146,59 +226,58 @@ def remove_surface(File, surf_type, maskFile=None, outFile=None, ysub=None):
         Mask = readfile.read(maskFile)[0]
         print 'read mask file: '+maskFile
     else:
-        Mask = np.ones((int(atr['FILE_LENGTH']), int(atr['WIDTH'])))
+        Mask = np.ones((length, width))
         print 'use mask of the whole area'
     
     ##### Input File Info
-    atr = readfile.read_attribute(File)
     k = atr['FILE_TYPE']
     print 'Input file is '+k
     print 'remove ramp type: '+surf_type
     
     ## Multiple Datasets File
-    if k in ['interferograms','coherence','wrapped','timeseries']:
+    if k in multi_group_hdf5_file+multi_dataset_hdf5_file:
         h5file = h5py.File(File,'r')
-        epochList = sorted(h5file[k].keys())
+        epochList = readfile.get_epoch_list(h5file, k)
         epoch_num = len(epochList)
-        prog_bar = ptime.progress_bar(maxValue=epoch_num)
+        if readfile.is_cube_hdf5(h5file, k):  layout = 'cube'
+        else:  layout = 'split'
+        if k in multi_group_hdf5_file:
+            print 'number of interferograms: '+str(epoch_num)
+            atr_list = [dict(h5file[k][epoch].attrs) for epoch in epochList]
+            suffix_list = ptime.list_ifgram2date12(epochList)
+        else:
+            print 'number of acquisitions: '+str(epoch_num)
+            atr_list = None
+            suffix_list = epochList
+        dtype = readfile.read_hdf5_epoch(h5file, k, epochList[0], box=(0,0,1,1)).dtype
 
         h5flat = h5py.File(outFile,'w')
-        group  = h5flat.create_group(k)
+        writefile.create_hdf5_stack(h5flat, k, epochList, length, width, atr, atr_list=atr_list,\
+                                    layout=layout, dtype=dtype)
         print 'writing >>> '+outFile
 
-    if k in ['timeseries']:
-        print 'number of acquisitions: '+str(len(epochList))
-        for i in range(epoch_num):
-            epoch = epochList[i]
-            data = h5file[k].get(epoch)[:]
-            
-            if not ysub:
-                data_n,ramp = remove_data_surface(data, Mask, surf_type) 
-            else:
-                data_n = remove_data_multiple_surface(data, Mask, surf_type, ysub)
-  
-            dset = group.create_dataset(epoch, data=data_n, compression='gzip')
-            prog_bar.update(i+1, suffix=epoch)
-        for key,value in h5file[k].attrs.iteritems():
-            group.attrs[key] = value
-  
-    elif k in ['interferograms','wrapped','coherence']:
-        print 'number of interferograms: '+str(len(epochList))
-        date12_list = ptime.list_ifgram2date12(epochList)
-        for i in range(epoch_num):
-            epoch = epochList[i]
-            data = h5file[k][epoch].get(epoch)[:]
-            
+        # Chunk of epochs, holding data, ramp, output and the masked copy before float64 conversion in dtype,
+        # masked pixels and their copy per missing-data pattern in float64, NaN flags and zero mask in bool
+        if not max_memory:
+            max_memory = pysar.max_memory
+        epoch_size = length * width * (4. * np.dtype(dtype).itemsize + 2*8 + 2)
+        epoch_step = int(max_memory * 1024**3 / epoch_size)
+        epoch_step = min(max(epoch_step, 1), epoch_num)
+
+        prog_bar = ptime.progress_bar(maxValue=epoch_num)
+        for i0 in range(0, epoch_num, epoch_step):
+            i1 = min(i0+epoch_step, epoch_num)
+            data = readfile.read_hdf5_stack(h5file, k, epochList[i0:i1])
             if not ysub:
-                data_n,ramp = remove_data_surface(data,Mask,surf_type)
+                data = remove_data_surface_stack(data, Mask, surf_type)[0]
             else:
-                data_n = remove_data_multiple_surface(data, Mask, surf_type, ysub)
-  
-            gg   = group.create_group(epoch)
-            dset = gg.create_dataset(epoch, data=data_n, compression='gzip')
-            for key,value in h5file[k][epoch].attrs.iteritems():
-                gg.attrs[key] = value
-            prog_bar.update(i+1, suffix=date12_list[i])
+                for i in range(i1-i0):
+                    data[i] = remove_data_multiple_surface(data[i], Mask, surf_type, ysub)
+            writefile.write_hdf5_block(h5flat, k, data, epoch_list=epochList[i0:i1])
+            prog_bar.update(i1, suffix=suffix_list[i1-1])
+        prog_bar.close()
+        h5file.close()
+        h5flat.close()
 
     ## Single Dataset File
     else:
@@ -213,12 +292,5 @@ def remove_surface(File, surf_type, maskFile=None, outFile=None, ysub=None):
         print 'writing >>> '+outFile
         writefile.write(data_n,atr,outFile)
   
-    try:
-        h5file.close()
-        h5flat.close()
-        prog_bar.close()
-    except: pass
-  
     print 'Remove '+surf_type+' took ' + str(time.time()-start) +' secs'
     return outFile
-
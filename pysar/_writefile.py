@@ -15,19 +15,29 @@ import h5py
 import numpy as np
 from PIL import Image
 
+import pysar
+import pysar._readfile as readfile
+from pysar._readfile import multi_group_hdf5_file, multi_dataset_hdf5_file, cube_index_name
 
-def write(*args):
+
+def write(*args, **kwargs):
     '''Write one dataset, i.e. interferogram, coherence, velocity, dem ...
         Return 0 if failed.
   
     Usage:
         write(data,atr,outname)
         write(rg,az,atr,outname)
+        write(data,atr,outname,epoch_list=epoch_list)
     
     Inputs:
-        data : 2D data matrix
+        data : 2D data matrix, or 3D data matrix in [epoch, y, x] for timeseries / interferograms
         atr  : attribute object
         outname : output file name
+        epoch_list : list of string, epoch names, for 3D data matrix only
+        atr_list   : list of attribute object, per-epoch attributes, for interferograms/coherence only
+        layout     : string, split or cube, HDF5 layout for 3D data matrix, default is pysar.hdf5_layout
+        chunks     : 3-tuple of int, chunk shape in [epoch, y, x], see storage_option()
+        compression: string, compression of HDF5 datasets, see storage_option()
     
     Output:
         output file name
@@ -39,6 +49,7 @@ def write(*args):
         write(data,atr,'strm1.dem')
         write(data,atr,'100120.mli')
         write(rg,az,atr,'geomap_4lks.trans')
+        write(ts_data,atr,'timeseries.h5',epoch_list=date_list,layout='cube')
     '''
 
     ########## Check Inputs ##########
@@ -58,16 +69,31 @@ def write(*args):
     ##### PySAR HDF5 product
     if ext in ['.h5','.he5']:
         k = atr['FILE_TYPE']
-        if k in ['interferograms','coherence','wrapped','timeseries']:
-            print 'Un-supported file type: '+k
-            print 'Only support 1-dataset-1-attribute file, i.e. velocity, mask, ...'
-            return 0;
+        if k in multi_group_hdf5_file+multi_dataset_hdf5_file:
+            if 'epoch_list' not in kwargs.keys() or data.ndim != 3:
+                print 'Un-supported input for file type: '+k
+                print 'Need 3D data matrix in [epoch, y, x] and epoch_list for multi-epoch file.'
+                return 0;
+            epoch_list = kwargs['epoch_list']
+            h5file = h5py.File(outname,'w')
+            create_hdf5_stack(h5file, k, epoch_list, data.shape[1], data.shape[2], atr,\
+                              atr_list=kwargs.get('atr_list', None), layout=kwargs.get('layout', None),\
+                              chunks=kwargs.get('chunks', None), dtype=data.dtype,\
+                              compression=kwargs.get('compression', None))
+            write_hdf5_block(h5file, k, data, epoch_list=epoch_list)
+            h5file.close()
+            readfile.clear_metadata_cache(outname)
+            return outname
+
         h5file = h5py.File(outname,'w')
         group = h5file.create_group(k)
-        dset = group.create_dataset(k, data=data, compression='gzip')
+        dset = group.create_dataset(k, data=data, **storage_option(kwargs.get('compression', None),\
+                                                                   chunks=kwargs.get('chunks', None),\
+                                                                   shape=data.shape))
         for key , value in atr.iteritems():
             group.attrs[key]=value
         h5file.close()
+        readfile.clear_metadata_cache(outname)
         return outname
 
     ##### ISCE / ROI_PAC GAMMA / Image product
@@ -94,6 +120,161 @@ def write(*args):
         return outname
 
 
+def storage_option(compression=None, shuffle=None, chunks=None, shape=None):
+    '''Keyword arguments of h5py create_dataset() for chunking and compression of HDF5 datasets.
+    Priority: input argument > environment variable (PYSAR_HDF5_COMPRESSION / PYSAR_HDF5_SHUFFLE /
+    PYSAR_HDF5_CHUNKS, i.e. set from template by pysarApp.py) > pysar.hdf5_compression / pysar.hdf5_shuffle /
+    pysar.hdf5_chunks
+    Inputs:
+        compression - string, none, lzf, gzip, or gzip1 - gzip9 for gzip with compression level
+        shuffle     - bool, apply shuffle filter before compression
+        chunks      - list of int in [epoch, y, x], chunk shape aligned to the last dimensions of dataset,
+                      i.e. [y, x] for 2D dataset, limited by dataset shape; or string, i.e. '16,128,128',
+                      auto for h5py automatic chunking
+        shape       - tuple of int, shape of dataset, h5py automatic chunking is used if not given
+    Output:
+        opts - dict, i.e. {'chunks':(128,128), 'compression':'gzip', 'compression_opts':4, 'shuffle':True}
+    Example:
+        group.create_dataset('mask', data=mask, **writefile.storage_option(shape=mask.shape))
+        group.create_dataset(date, data=data, **writefile.storage_option('lzf', shuffle=True, shape=data.shape))
+        group.create_dataset(k, shape=(date_num, length, width), **writefile.storage_option(chunks=[8,256,256],\
+                                                                                  shape=(date_num, length, width)))
+    '''
+    if compression is None:
+        compression = os.environ.get('PYSAR_HDF5_COMPRESSION', pysar.hdf5_compression)
+    if shuffle is None:
+        shuffle = os.environ.get('PYSAR_HDF5_SHUFFLE', pysar.hdf5_shuffle)
+    if chunks is None:
+        chunks = os.environ.get('PYSAR_HDF5_CHUNKS', pysar.hdf5_chunks)
+    compression = str(compression).lower()
+    if str(shuffle).lower() in ['yes','true','1']:
+        shuffle = True
+    else:
+        shuffle = False
+    if isinstance(chunks, str):
+        if chunks.lower() in ['auto','']:
+            chunks = None
+        else:
+            chunks = chunks.replace(',',' ').split()
+
+    opts = dict()
+    if chunks and shape and min(shape) > 0:
+        chunks = [1]*max(len(shape)-len(chunks), 0) + [int(i) for i in chunks][-len(shape):]
+        opts['chunks'] = tuple([min(chunks[i], int(shape[i])) for i in range(len(shape))])
+
+    if compression in ['none','no','false','']:
+        # shuffle filter only helps compression
+        return opts
+    elif compression == 'lzf':
+        opts['compression'] = 'lzf'
+    elif compression.startswith('gzip') and compression[4:] in ['']+[str(i) for i in range(10)]:
+        opts['compression'] = 'gzip'
+        if compression[4:]:
+            opts['compression_opts'] = int(compression[4:])
+    else:
+        raise ValueError('Un-recognized HDF5 compression: '+compression)
+    if shuffle:
+        opts['shuffle'] = True
+    return opts
+
+
+def create_hdf5_stack(h5file, k, epoch_list, length, width, atr=dict(), atr_list=None, layout=None,\
+                      chunks=None, dtype=np.float32, compression=None):
+    '''Create empty datasets and attributes of multi-epoch file in opened HDF5 file, for block writing.
+    Inputs:
+        h5file     - HDF5 file object, opened in 'w' or 'a' mode
+        k          - string, file type / group name, i.e. timeseries, interferograms
+        epoch_list - list of string, date for timeseries, group name for interferograms
+        length/width - int, size of each epoch
+        atr        - dict, attributes, written to h5file[k] for timeseries
+                     and to each h5file[k][epoch] for interferograms if atr_list is None
+        atr_list   - list of dict, per-epoch attributes for interferograms, coherence, etc.
+        layout     - string, split or cube, default is pysar.hdf5_layout
+        chunks     - 3-tuple of int, chunk shape in [epoch, y, x], [y, x] is used for split layout,
+                     see storage_option()
+        compression - string, compression of datasets, see storage_option()
+    Output:
+        h5file - HDF5 file object
+    Example:
+        h5 = h5py.File('timeseries.h5','w')
+        create_hdf5_stack(h5, 'timeseries', date_list, length, width, atr, layout='cube')
+        write_hdf5_block(h5, 'timeseries', ts_block, box=(0,y0,width,y1))
+        h5.close()
+    '''
+    if not layout:
+        layout = pysar.hdf5_layout
+    epoch_list = [str(i) for i in epoch_list]
+    epoch_num = len(epoch_list)
+    group = h5file.require_group(k)
+
+    if layout == 'cube':
+        opts = storage_option(compression, chunks=chunks, shape=(epoch_num, length, width))
+        group.create_dataset(k, shape=(epoch_num, length, width), dtype=dtype, **opts)
+        group.create_dataset(cube_index_name, data=np.array(epoch_list, np.string_))
+    elif layout == 'split':
+        opts = storage_option(compression, chunks=chunks, shape=(length, width))
+        for epoch in epoch_list:
+            if k in multi_dataset_hdf5_file:
+                group.create_dataset(epoch, shape=(length, width), dtype=dtype, **opts)
+            else:
+                group.create_group(epoch).create_dataset(epoch, shape=(length, width), dtype=dtype, **opts)
+    else:
+        raise ValueError('Un-recognized HDF5 layout: '+str(layout))
+
+    # Attributes
+    if k in multi_dataset_hdf5_file:
+        for key, value in atr.iteritems():
+            group.attrs[key] = value
+    else:
+        for i in range(epoch_num):
+            gg = group.require_group(epoch_list[i])
+            if atr_list:
+                atr_epoch = atr_list[i]
+            else:
+                atr_epoch = atr
+            for key, value in atr_epoch.iteritems():
+                gg.attrs[key] = value
+    readfile.clear_metadata_cache(h5file.filename)
+    return h5file
+
+
+def write_hdf5_block(h5file, k, data, box=None, epoch_list=None):
+    '''Write 3D matrix in [epoch, y, x] into datasets created by create_hdf5_stack(), for both split and cube layout
+    Inputs:
+        h5file     - HDF5 file object
+        k          - string, file type / group name, i.e. timeseries, interferograms
+        data       - 3D np.array in [epoch, y, x]
+        box        - 4-tuple of int, area to write, defined in (x0, y0, x1, y1) in pixel coordinate
+                     whole area by default
+        epoch_list - list of string, epochs of data, all epochs in file by default
+    Output:
+        h5file - HDF5 file object
+    '''
+    epochListAll = readfile.get_epoch_list(h5file, k)
+    if not epoch_list:
+        epoch_list = epochListAll
+    epoch_list = [str(i) for i in epoch_list]
+    if not box:
+        box = (0, 0, data.shape[2], data.shape[1])
+
+    if readfile.is_cube_hdf5(h5file, k):
+        dset = h5file[k].get(k)
+        if epoch_list == epochListAll:
+            dset[:, box[1]:box[3], box[0]:box[2]] = data
+        else:
+            for i in range(len(epoch_list)):
+                dset[epochListAll.index(epoch_list[i]), box[1]:box[3], box[0]:box[2]] = data[i]
+    else:
+        for i in range(len(epoch_list)):
+            epoch = epoch_list[i]
+            if k in multi_dataset_hdf5_file:
+                dset = h5file[k].get(epoch)
+            else:
+                dset = h5file[k][epoch].get(epoch)
+            dset[box[1]:box[3], box[0]:box[2]] = data[i]
+    return h5file
+
+
 def write_roipac_rsc(atr, outname, sorting=True):
     '''Write attribute dict into ROI_PAC .rsc file
     Inputs:
@@ -178,6 +359,22 @@ def write_complex64(data,outname):
     return outname
 
 
+def write_complex_float32(data, outname):
+    '''Write complex float32 data, i.e. roi_pac .int and .amp file
+        real, imagery, real, ...
+    '''
+    data = np.array(data, dtype=np.complex64)
+    data.tofile(outname)
+    return outname
+
+
+def write_flag(data, outname):
+    '''Write 1-byte flag data, i.e. roi_pac .flg and *_snap_connect.byt file'''
+    data = np.array(data, dtype=np.uint8)
+    data.tofile(outname)
+    return outname
+
+
 def write_real_int16(data,outname):
     data=np.array(data,dtype=np.int16)
     data.tofile(outname)
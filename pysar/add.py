@@ -101,7 +101,7 @@ def main(argv):
         group = h5out.create_group(k)
   
         h5in  = h5py.File(fileList[0])
-        epochList = sorted(h5in[k].keys())
+        epochList = readfile.get_epoch_list(h5in, k)
 
     ########################### Add file by file ########################
     if k in ['timeseries']:
@@ -111,11 +111,11 @@ def main(argv):
             for File in fileList:
                 print File
                 h5file = h5py.File(File,'r')
-                d = h5file[k].get(epoch)[:]
+                d = readfile.read_hdf5_epoch(h5file, k, epoch)
   
                 data = add(data,d)
   
-            dset = group.create_dataset(epoch, data=data, compression='gzip')
+            dset = group.create_dataset(epoch, data=data, **writefile.storage_option(shape=data.shape))
         for key,value in atr.iteritems():   group.attrs[key] = value
   
         h5out.close()
@@ -128,12 +128,12 @@ def main(argv):
             for File in fileList:
                 print File
                 h5file = h5py.File(File,'r')
-                d = h5file[k][epoch].get(epoch)[:]
+                d = readfile.read_hdf5_epoch(h5file, k, epoch)
   
                 data = add(data,d)
   
             gg = group.create_group(epoch)
-            dset = gg.create_dataset(epoch, data=data, compression='gzip')
+            dset = gg.create_dataset(epoch, data=data, **writefile.storage_option(shape=data.shape))
             for key, value in h5in[k][epoch].attrs.iteritems():
                 gg.attrs[key] = value
   
@@ -14,6 +14,9 @@ import h5py
 import numpy as np
 import matplotlib.pyplot as plt
 
+import pysar._readfile as readfile
+import pysar._writefile as writefile
+
 
 def usage():
     print'''
@@ -91,7 +94,7 @@ def get_lat_lon(h5file):
  
     if 'interferograms' in k:
  
-        ifgramList = h5file['interferograms'].keys()
+        ifgramList = readfile.get_epoch_list(h5file, 'interferograms')
         Width=float(h5file['interferograms'][ifgramList[0]].attrs['WIDTH'])
         Length= float(h5file['interferograms'][ifgramList[0]].attrs['FILE_LENGTH'])
         ullon=float(h5file['interferograms'][ifgramList[0]].attrs['X_FIRST'])
@@ -229,7 +232,8 @@ def main(argv):
     print 'writing '+outName
     h5velocity = h5py.File(outName,'w')
     group=h5velocity.create_group('velocity')
-    dset = group.create_dataset('velocity', data=np.reshape(Luh[0,:],(LENGTH,WIDTH)), compression='gzip')
+    dset = group.create_dataset('velocity', data=np.reshape(Luh[0,:],(LENGTH,WIDTH)),\
+                                **writefile.storage_option(shape=(LENGTH,WIDTH)))
     
     for key , value in h5V1[k[0]].attrs.iteritems():
         group.attrs[key]=value
@@ -248,7 +252,8 @@ def main(argv):
     print 'writing '+outName
     h5velocity = h5py.File(outName,'w')
     group=h5velocity.create_group('velocity')
-    dset = group.create_dataset('velocity', data=np.reshape(Luh[1,:],(LENGTH,WIDTH)), compression='gzip')
+    dset = group.create_dataset('velocity', data=np.reshape(Luh[1,:],(LENGTH,WIDTH)),\
+                                **writefile.storage_option(shape=(LENGTH,WIDTH)))
  
     for key , value in h5V1[k[0]].attrs.iteritems():
         group.attrs[key]=value
@@ -17,6 +17,7 @@ from matplotlib.ticker import FuncFormatter
 from scipy.linalg import pinv as pinv
 
 import pysar._readfile as readfile
+import pysar._writefile as writefile
 
 
 def to_percent(y, position):
@@ -60,7 +61,7 @@ def main(argv):
   
     ##################################
     h5file = h5py.File(File)
-    dateList = h5file['timeseries'].keys()
+    dateList = readfile.get_epoch_list(h5file, 'timeseries')
     ##################################
   
     ##### Read Mask File 
@@ -120,7 +121,7 @@ def main(argv):
     print '%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%'
     for i in range(1,len(dateList)):
         if not dateList[i] in excludedDates:
-            dset = h5file['timeseries'].get(dateList[i])
+            dset = readfile.read_hdf5_epoch(h5file, 'timeseries', dateList[i])
             data = dset[0:dset.shape[0],0:dset.shape[1]]
             L = data.flatten(1)
             Berror=np.dot(np.linalg.pinv(A[ndx]),L[ndx])
@@ -154,9 +155,9 @@ def main(argv):
   
     Bedif=np.zeros([len(dateList),4])
     for i in range(1,len(dateList)):
-        dset1 = h5file['timeseries'].get(dateList[i-1])
+        dset1 = readfile.read_hdf5_epoch(h5file, 'timeseries', dateList[i-1])
         data1 = dset1[0:dset1.shape[0],0:dset1.shape[1]]
-        dset2 = h5file['timeseries'].get(dateList[i])
+        dset2 = readfile.read_hdf5_epoch(h5file, 'timeseries', dateList[i])
         data2 = dset2[0:dset2.shape[0],0:dset2.shape[1]]
         data=data2-data1
         L = data.flatten(1)
@@ -183,9 +184,9 @@ def main(argv):
     h5orbCor=h5py.File(outName,'w')
     group = h5orbCor.create_group('timeseries')
     for i in range(len(dateList)):
-        dset1 = h5file['timeseries'].get(dateList[i])
+        dset1 = readfile.read_hdf5_epoch(h5file, 'timeseries', dateList[i])
         data = dset1[0:dset1.shape[0],0:dset1.shape[1]] - orbEffect[i,:,:]
-        dset = group.create_dataset(dateList[i], data=data, compression='gzip')      
+        dset = group.create_dataset(dateList[i], data=data, **writefile.storage_option(shape=data.shape))      
   
     for key,value in h5file['timeseries'].attrs.iteritems():
         group.attrs[key] = value
@@ -193,7 +194,7 @@ def main(argv):
     try:
         dset1 = h5file['mask'].get('mask')
         group=h5orbCor.create_group('mask')
-        dset = group.create_dataset('mask', data=dset1, compression='gzip')
+        dset = group.create_dataset('mask', data=dset1, **writefile.storage_option(shape=dset1.shape))
     except: pass
   
     h5file.close()
@@ -17,6 +17,7 @@ from matplotlib.ticker import FuncFormatter
 from scipy.linalg import pinv as pinv
 
 import pysar._readfile as readfile
+import pysar._writefile as writefile
 
 
 ####################################################################################
@@ -67,7 +68,7 @@ def main(argv):
     print baseline_error  
     ##################################
     h5file = h5py.File(File)
-    dateList = h5file['timeseries'].keys()
+    dateList = readfile.get_epoch_list(h5file, 'timeseries')
     ##################################
   
     try: maskFile=argv[4]
@@ -169,7 +170,7 @@ def main(argv):
     Be=np.zeros([len(dateList),num_base_par+p+1])  
     print '%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%'
     for i in range(1,len(dateList)):
-        dset = h5file['timeseries'].get(dateList[i])
+        dset = readfile.read_hdf5_epoch(h5file, 'timeseries', dateList[i])
         data = dset[0:dset.shape[0],0:dset.shape[1]]
         L = data.flatten(1)
         M=np.hstack((A,B))
@@ -209,9 +210,9 @@ def main(argv):
     h5orbCor=h5py.File(outName,'w')
     group = h5orbCor.create_group('timeseries')
     for i in range(len(dateList)):
-        dset1 = h5file['timeseries'].get(dateList[i])
+        dset1 = readfile.read_hdf5_epoch(h5file, 'timeseries', dateList[i])
         data = dset1[0:dset1.shape[0],0:dset1.shape[1]] - orbEffect[i,:,:]
-        dset = group.create_dataset(dateList[i], data=data, compression='gzip')      
+        dset = group.create_dataset(dateList[i], data=data, **writefile.storage_option(shape=data.shape))      
   
     for key,value in h5file['timeseries'].attrs.iteritems():
         group.attrs[key] = value
@@ -219,7 +220,7 @@ def main(argv):
   
     dset1 = h5file['mask'].get('mask')
     group=h5orbCor.create_group('mask')
-    dset = group.create_dataset('mask', data=dset1, compression='gzip')
+    dset = group.create_dataset('mask', data=dset1, **writefile.storage_option(shape=dset1.shape))
   
     h5file.close()
     h5orbCor.close()
@@ -17,6 +17,8 @@ import scipy.io as sio
 import datetime
 import time
 
+import pysar._readfile as readfile
+
 def usage():
     print '''
 ****************************************************************
@@ -121,12 +123,12 @@ def main(argv):
 
     elif 'timeseries' in k:
     
-        epochList=h5file['timeseries'].keys()
+        epochList=readfile.get_epoch_list(h5file, 'timeseries')
         data_dict={}
         
         for epoch in epochList:
             print epoch
-            d = h5file['timeseries'].get(epoch)
+            d = readfile.read_hdf5_epoch(h5file, 'timeseries', epoch)
             ts={}
             ts['data'] = d[0:d.shape[0],0:d.shape[1]] 
             try:
@@ -22,10 +22,12 @@ import argparse
 import h5py
 import numpy as np
 
+import pysar
 import pysar._datetime as ptime
 import pysar._pysar_utilities as ut
 import pysar._readfile as readfile
 import pysar._writefile as writefile
+import pysar._remove_surface as rm
 
 def read_template2inps(template_file, inps=None):
     '''Read input template file into inps.ex_date'''
@@ -61,6 +63,26 @@ def read_template2inps(template_file, inps=None):
         else:
             inps.step_date = None
 
+    # Residual RMS options, same as timeseries_rms.py
+    prefix = 'pysar.residualRms.'
+
+    key = prefix+'maskFile'
+    if key in key_list:
+        value = template[key]
+        if value == 'auto':
+            inps.resid_mask_file = 'maskTempCoh.h5'
+        elif value == 'no':
+            inps.resid_mask_file = None
+        else:
+            inps.resid_mask_file = value
+
+    key = prefix+'ramp'
+    if key in key_list:
+        value = template[key]
+        if value == 'auto':
+            inps.ramp_type = 'quadratic'
+        else:
+            inps.ramp_type = value
 
     return inps
 
@@ -83,6 +105,133 @@ def get_exclude_date(inps, date_list_all):
     return inps
 
 
+def pixel_geometry(value, rows, cols):
+    '''Get geometry value, i.e. incidence angle / range distance, of pixels
+    Inputs:
+        value     - np.array in size of 1, (width,) or (length, width)
+        rows/cols - 1D np.array of int, row/column number of pixels
+    Output:
+        1D np.array in size of rows, or float for constant value
+    '''
+    if value.size == 1:
+        return float(value)
+    elif value.ndim == 1:
+        return value[cols]
+    else:
+        return value[rows, cols]
+
+
+def estimate_dem_error(ts, A_def, pbase, tbase, row_idx=None, ex_flag=None, phase_velocity=False,\
+                       update_timeseries=True):
+    '''Estimate DEM error with least squares for all pixels in batch.
+    The design matrix A = [pbase/(range_dis*sin(inc_angle)), A_def] differs among pixels only in its
+    DEM error column, thus the DEM error is solved after projecting out the deformation model A_def
+    (Frisch-Waugh-Lovell theorem), with one matrix product for all pixels sharing the same pbase,
+    identical to the solution of np.linalg.pinv(A) pixel by pixel.
+    Inputs:
+        ts      - 2D np.array in size of (date_num, pixel_num), time series in meters
+        A_def   - 2D np.array in size of (date_num, model_num) or (date_num-1, model_num) for phase velocity,
+                  design matrix of temporal deformation model
+        pbase   - 2D np.array in size of (date_num, 1) or (date_num, length), perpendicular baseline
+        tbase   - 2D np.array in size of (date_num, 1), temporal baseline
+        row_idx - 1D np.array of int in size of (pixel_num,), column index of pbase of each pixel,
+                  None for one pbase for all pixels
+        ex_flag - 1D np.array of bool in size of (date_num,), False for dates excluded from estimation,
+                  None for all dates
+        phase_velocity - bool, use phase velocity instead of phase for inversion
+        update_timeseries - bool, correct input ts for DEM error in place
+    Outputs:
+        delta_z - 1D np.array in size of (pixel_num,), DEM error multiplied by 1/(range_dis*sin(inc_angle))
+        resid   - 2D np.array in size of A_def.shape[0] by pixel_num, inversion residual
+    '''
+    if row_idx is None:
+        row_idx = np.zeros(ts.shape[1], np.int64)
+    if phase_velocity:
+        pbase_obs = np.diff(pbase, axis=0) / np.diff(tbase, axis=0)
+        ts_obs = np.diff(ts, axis=0) / np.diff(tbase, axis=0)
+    else:
+        pbase_obs = pbase
+        ts_obs = ts
+    if ex_flag is None:
+        ex_flag = np.ones(A_def.shape[0], np.bool_)
+    elif phase_velocity:
+        # exclude velocity of both intervals next to the excluded date
+        ex_flag = ex_flag[1:] & ex_flag[:-1]
+
+    # Project out deformation model: P = I - A_def * pinv(A_def)
+    A_def_inv = np.linalg.pinv(A_def[ex_flag,:])
+    proj = np.eye(np.sum(ex_flag)) - np.dot(A_def[ex_flag,:], A_def_inv)
+    pbase_res = np.dot(proj, pbase_obs[ex_flag,:])
+    ts_res = np.dot(proj, ts_obs[ex_flag,:])
+
+    # DEM error: pbase_res' * ts_res / (pbase_res' * pbase_res)
+    pbase_norm = np.sum(pbase_res**2, axis=0)
+    pbase_norm[pbase_norm <= np.finfo(np.float32).eps * np.max(pbase_norm)] = np.inf
+    delta_z = np.sum(pbase_res[:,row_idx] * ts_res, axis=0) / pbase_norm[row_idx]
+    del ts_res
+
+    # Deformation model and residual
+    ts_dem = pbase_obs[:,row_idx] * delta_z
+    X_def = np.dot(A_def_inv, ts_obs[ex_flag,:] - ts_dem[ex_flag,:])
+    resid = ts_obs - ts_dem - np.dot(A_def, X_def)
+    del ts_dem, X_def
+
+    if update_timeseries:
+        ts -= pbase[:,row_idx] * delta_z
+    return delta_z, resid
+
+
+def update_residual_stat(stat, resid, rows, cols, ramp_type='quadratic'):
+    '''Accumulate sums of residual for its deramped RMS/STD of each epoch, in one pass over row blocks.
+    The ramp of each epoch is the least squares fit of all accumulated pixels, thus RMS/STD is the same as
+    removing the ramp with _remove_surface.remove_data_surface() and calculating with timeseries_rms().
+    Inputs:
+        stat      - dict, accumulated sums, updated in place, empty dict for the 1st call
+        resid     - 2D np.array in size of (epoch_num, pixel_num), residual, NaN for invalid observation
+        rows/cols - 1D np.array of int in size of (pixel_num,), row/column number of pixels
+        ramp_type - string, ramp type, no for do not remove ramp
+    '''
+    valid = np.isfinite(resid)
+    resid = np.where(valid, resid, 0.)
+    # pixels with zero value are set to zero after ramp removal, i.e. reference pixel
+    zero = np.array(valid & (resid == 0.), np.float64)
+    valid = np.array(valid, np.float64)
+
+    if ramp_type == 'no':
+        G = np.zeros((rows.size, 0))
+    else:
+        G = rm.surface_design_matrix(rows, cols, ramp_type)
+    GG = np.einsum('ni,nj->nij', G, G).reshape(rows.size, G.shape[1]**2)
+    for key, value in [('num', np.sum(valid, axis=1)),\
+                       ('sum', np.sum(resid, axis=1, dtype=np.float64)),\
+                       ('sqsum', np.sum(np.square(resid), axis=1, dtype=np.float64)),\
+                       ('b', np.dot(resid, G)),\
+                       ('s', np.dot(valid, G)),\
+                       ('s0', np.dot(zero, G)),\
+                       ('G', np.dot(valid, GG)),\
+                       ('G0', np.dot(zero, GG))]:
+        stat[key] = stat.get(key, 0.) + value
+    return stat
+
+
+def residual_stat2rms(stat):
+    '''Get deramped RMS and STD of each epoch from sums accumulated by update_residual_stat()'''
+    epoch_num, param_num = stat['b'].shape
+    rms_list = []
+    std_list = []
+    for i in range(epoch_num):
+        num = max(stat['num'][i], 1.)
+        G = stat['G'][i].reshape(param_num, param_num)
+        G0 = stat['G0'][i].reshape(param_num, param_num)
+        x = np.dot(np.linalg.pinv(G), stat['b'][i])
+        sqsum = stat['sqsum'][i] - 2*np.dot(x, stat['b'][i]) + np.dot(x, np.dot(G - G0, x))
+        dsum = stat['sum'][i] - np.dot(x, stat['s'][i] - stat['s0'][i])
+        rms = np.sqrt(max(sqsum, 0.) / num)
+        rms_list.append(rms)
+        std_list.append(np.sqrt(max(rms**2 - (dsum/num)**2, 0.)))
+    return rms_list, std_list
+
+
 ######################################
 TEMPLATE='''
 ## 8. Topographic (DEM) Residual Correction (Fattahi and Amelung, 2013, IEEE-TGRS)
@@ -96,6 +245,8 @@ EXAMPLE='''example:
   dem_error.py  timeseries_ECMWF.h5
   dem_error.py  timeseries_ECMWF.h5  --phase-velocity
   dem_error.py  timeseries_ECMWF.h5  -d dem_radar.h5
+  dem_error.py  timeseries_ECMWF.h5  -m mask.h5
+  dem_error.py  timeseries_ECMWF.h5  --memory 8 --residual-cube
   dem_error.py  geo_timeseries.h5    -i geo_incidence_angle.h5  -r geo_range.h5
 
   dem_error.py  timeseries_ECMWF.h5 --template pysarApp_template.txt
@@ -133,6 +284,22 @@ def cmdLineParse():
                         help='Do not update timeseries; if specified, only DEM error will be calculated.')
     parser.add_argument('--poly-order', dest='poly_order', type=int, default=2, choices=[1,2,3],\
                         help='polynomial order number of temporal deformation model, default = 2')
+    parser.add_argument('-m','--mask', dest='mask_file',\
+                        help='mask file, only pixels with non-zero value are processed,\n'+\
+                             'the others are filled with NaN in output files.')
+    parser.add_argument('--memory', dest='max_memory', type=float, default=pysar.max_memory,\
+                        help='max memory in GB used for block-wise processing, default = '+str(pysar.max_memory))
+
+    resid = parser.add_argument_group('Residual', 'Inversion residual output')
+    resid.add_argument('--residual-cube', dest='residual_cube', action='store_true',\
+                       help='write the full residual time series into *InvResid.h5 in float32.\n'+\
+                            'Otherwise only the deramped RMS/STD of each epoch is written into\n'+\
+                            '*InvResid_RAMP_rms/std.txt, as used by timeseries_rms.py')
+    resid.add_argument('--resid-mask', dest='resid_mask_file', default='maskTempCoh.h5',\
+                       help='mask file for residual RMS/STD, default: maskTempCoh.h5, use all pixels if not found')
+    resid.add_argument('--resid-ramp', dest='ramp_type', default='quadratic',\
+                       help='ramp type to be removed for residual RMS/STD.\n'+\
+                            'default - quadratic; no - do not remove ramp')
 
     inps = parser.parse_args()
     return inps  
@@ -150,14 +317,14 @@ def main(argv):
         print 'read option from template file: '+inps.template_file
         inps = read_template2inps(inps.template_file, inps)
 
-    # Read Time Series
-    print "loading time series: " + inps.timeseries_file
+    # Read Time Series Info
+    print "time series file: " + inps.timeseries_file
     atr = readfile.read_attribute(inps.timeseries_file)
     length = int(atr['FILE_LENGTH'])
     width = int(atr['WIDTH'])
 
-    h5 = h5py.File(inps.timeseries_file)
-    date_list = sorted(h5['timeseries'].keys())
+    h5 = h5py.File(inps.timeseries_file, 'r')
+    date_list = readfile.get_epoch_list(h5, 'timeseries')
     date_num = len(date_list)
     print 'number of acquisitions: '+str(date_num)
 
@@ -168,17 +335,6 @@ def main(argv):
         if inps.ex_date:
             inps.ex_flag = np.array([i not in inps.ex_date for i in date_list])
 
-    timeseries = np.zeros((len(date_list),length*width),np.float32)
-    prog_bar = ptime.progress_bar(maxValue=date_num, prefix='loading: ')
-    for i in range(date_num):
-        date = date_list[i]
-        d = h5['timeseries'].get(date)[:]
-        timeseries[i][:] = d.flatten('F')
-        prog_bar.update(i+1, suffix=date)
-    del d
-    h5.close()
-    prog_bar.close()
-
     # Perpendicular Baseline
     print 'read perpendicular baseline'
     try:
@@ -268,6 +424,8 @@ def main(argv):
         flag_array = np.array(yy_list) >= step_yy
         A_step = np.zeros((date_num, 1))
         A_step[flag_array] = 1.0
+        if inps.phase_velocity:
+            A_step = np.diff(A_step, axis=0) / np.diff(inps.tbase, axis=0)
         A_def = np.hstack((A_def, A_step))
 
     # Heresh's original code for phase history approach
@@ -275,148 +433,99 @@ def main(argv):
     print '-------------------------------------------------'
 
 
-    ##---------------------------------------- Loop for L2-norm inversion  -----------------------------------##
-    delta_z_mat = np.zeros([length, width])
-    resid_n = np.zeros([A_def.shape[0], length*width])
-    constC = np.zeros([length, width])
-    #delta_a_mat = np.zeros([length, width])
-    if inps.incidence_angle.ndim == 2 and inps.range_dis.ndim == 2:
-        print 'inversing using L2-norm minimization (unweighted least squares)'\
-              ' pixel by pixel: %d loops in total' % (length*width)
-        prog_bar = ptime.progress_bar(maxValue=length*width, prefix='calculating: ')
-        for i in range(length*width):
-            row = i%length
-            col = i/length
-            range_dis = inps.range_dis[row, col]
-            inc_angle = inps.incidence_angle[row, col]
-            # Consider P_BASELINE variation within one interferogram
-            if inps.pbase.shape[1] > 1:
-                pbase = inps.pbase[:,row].reshape(date_num, 1)
-
-            # Design matrix - DEM error using pbase, range distance and incidence angle
-            A_delta_z = pbase / (range_dis * np.sin(inc_angle))
-            if inps.phase_velocity:
-                pbase_v = np.diff(pbase, axis=0) / np.diff(inps.tbase, axis=0)
-                A_delta_z_v = pbase_v / (range_dis * np.sin(inc_angle))
-                A = np.hstack((A_delta_z_v, A_def))
-            else:
-                A = np.hstack((A_delta_z, A_def))
-
-            # L-2 norm inversion
-            if inps.ex_date:
-                A_inv = np.linalg.pinv(A[inps.ex_flag,:])
-            else:
-                A_inv = np.linalg.pinv(A)
-
-            # Get unknown parameters X = [delta_z, vel, acc, delta_acc, ...]
-            ts_dis = timeseries[:,i]
-            if inps.phase_velocity:
-                ts_dis = np.diff(ts_dis, axis=0) / np.diff(inps.tbase, axis=0)
-
-            if inps.ex_date:
-                X = np.dot(A_inv, ts_dis[inps.ex_flag])
-            else:
-                X = np.dot(A_inv, ts_dis)
-
-            # Residual vector n
-            resid_n[:, i] = ts_dis - np.dot(A, X)
-
-            # Update DEM error / timeseries matrix
-            delta_z = X[0]
-            delta_z_mat[row, col] = delta_z
-            if inps.update_timeseries:
-                timeseries[:,i] -= np.dot(A_delta_z, delta_z).flatten()
-            prog_bar.update(i+1, every=length*width/100)
-        prog_bar.close()
-
-
-    elif inps.incidence_angle.ndim == 1 and inps.range_dis.ndim == 1:
-        print 'inversing using L2-norm minimization (unweighted least squares)'\
-              ' column by column: %d loops in total' % (width)
-        prog_bar = ptime.progress_bar(maxValue=width, prefix='calculating: ')
-        for i in range(width):
-            range_dis = inps.range_dis[i]
-            inc_angle = inps.incidence_angle[i]
-
-            # Design matrix - DEM error using pbase, range distance and incidence angle
-            A_delta_z = pbase / (range_dis * np.sin(inc_angle))
-            if inps.phase_velocity:
-                pbase_v = np.diff(pbase, axis=0) / np.diff(inps.tbase, axis=0)
-                A_delta_z_v = pbase_v / (range_dis * np.sin(inc_angle))
-                A = np.hstack((A_delta_z_v, A_def))
-            else:
-                A = np.hstack((A_delta_z, A_def))
-
-            # L-2 norm inversion
-            if inps.ex_date:
-                A_inv = np.linalg.pinv(A[inps.ex_flag,:])
-            else:
-                A_inv = np.linalg.pinv(A)
-
-            # Get unknown parameters X = [delta_z, vel, acc, delta_acc, ...]
-            ts_dis = timeseries[:,i*length:(i+1)*length]
-            if inps.phase_velocity:
-                ts_dis = np.diff(ts_dis, axis=0) / np.diff(inps.tbase, axis=0)
-
-            if inps.ex_date:
-                X = np.dot(A_inv, ts_dis[inps.ex_flag,:])
-            else:
-                X = np.dot(A_inv, ts_dis)
-
-            # Residual vector n
-            resid_n[:, i*length:(i+1)*length] = ts_dis - np.dot(A, X)
-            constC[:, i] = X[1].reshape((1, length))
-
-            # Update DEM error / timeseries matrix
-            delta_z = X[0].reshape((1,length))
-            delta_z_mat[:, i] = delta_z
-            if inps.update_timeseries:
-                timeseries[:, i*length:(i+1)*length] -= np.dot(A_delta_z, delta_z)
-            prog_bar.update(i+1, every=width/100)
-        prog_bar.close()
-
-
-    elif inps.incidence_angle.ndim == 0 and inps.range_dis.ndim == 0:
-        print 'inversing using L2-norm minimization (unweighted least squares) for the whole area'
-        
-        # Design matrix - DEM error using pbase, range distance and incidence angle
-        A_delta_z = pbase / (inps.range_dis * np.sin(inps.incidence_angle))
-        if inps.phase_velocity:
-            pbase_v = np.diff(pbase, axis=0) / np.diff(inps.tbase, axis=0)
-            A_delta_z_v = pbase_v / (inps.range_dis * np.sin(inps.incidence_angle))
-            A = np.hstack((A_delta_z_v, A_def))
+    ##---------------------------------------- Block-wise L2-norm inversion  ---------------------------------##
+    for value in [inps.incidence_angle, inps.range_dis]:
+        if value.size != 1 and value.shape not in [(width,), (length, width)]:
+            print 'ERROR: Script only support incidence angle and range distance in size of 1, width or length*width.'
+            print 'shape of incidence angle: '+str(inps.incidence_angle.shape)
+            print 'shape of range distance: '+str(inps.range_dis.shape)
+            sys.exit(1)
+    ex_flag = None
+    if inps.ex_date:
+        ex_flag = inps.ex_flag
+    resid_num = A_def.shape[0]
+    resid_date_list = date_list[0:resid_num]
+
+    # Row blocks, with time series in float32 and ~5 float64 copies of it in estimate_dem_error()
+    box_list = ut.get_row_block_list(length, width, 12*date_num, inps.max_memory)
+    print 'inversing using L2-norm minimization (unweighted least squares)'\
+          ' in %d row block(s)' % (len(box_list))
+    if inps.mask_file:
+        print 'only pixels with non-zero value in mask file: '+inps.mask_file
+
+    # Output files, written block by block
+    if inps.update_timeseries:
+        print 'writing >>> '+inps.outfile
+        h5out = h5py.File(inps.outfile, 'w')
+        writefile.create_hdf5_stack(h5out, 'timeseries', date_list, length, width, atr=atr)
+    resid_file = os.path.splitext(inps.outfile)[0]+'InvResid.h5'
+    if inps.residual_cube:
+        print 'writing >>> '+resid_file
+        atr_resid = atr.copy()
+        if resid_num == date_num:
+            atr_resid['UNIT'] = 'm'
         else:
-            A = np.hstack((A_delta_z, A_def))
-
-        # L-2 norm inversion
-            if inps.ex_date:
-                A_inv = np.linalg.pinv(A[inps.ex_flag,:])
-            else:
-                A_inv = np.linalg.pinv(A)
-
-        # Get unknown parameters X = [delta_z, vel, acc, delta_acc, ...]
-        if inps.phase_velocity:
-            timeseries = np.diff(timeseries, axis=0) / np.diff(inps.tbase, axis=0)
-
-        if inps.ex_date:
-            X = np.dot(A_inv, timeseries[inps.ex_flag,:])
+            atr_resid['UNIT'] = 'm/yr'
+        h5resid = h5py.File(resid_file, 'w')
+        writefile.create_hdf5_stack(h5resid, 'timeseries', resid_date_list, length, width, atr=atr_resid)
+    if inps.resid_mask_file and not os.path.isfile(inps.resid_mask_file):
+        print 'can not find mask file for residual RMS: '+inps.resid_mask_file+', use all pixels'
+        inps.resid_mask_file = None
+
+    delta_z_mat = np.zeros((length, width), np.float32)
+    resid_stat = dict()
+    prog_bar = ptime.progress_bar(maxValue=len(box_list), prefix='calculating: ')
+    for i in range(len(box_list)):
+        box = box_list[i]
+        box_width = box[2] - box[0]
+        box_pixel_num = (box[3] - box[1]) * box_width
+
+        # Valid pixels, only them are processed
+        if inps.mask_file:
+            pixel_idx = np.flatnonzero(readfile.read(inps.mask_file, box)[0] != 0)
         else:
-            X = np.dot(A_inv, timeseries)
+            pixel_idx = np.arange(box_pixel_num)
+        rows = box[1] + pixel_idx / box_width
+        cols = box[0] + pixel_idx % box_width
 
-        # Residual vector n
-        resid_n = ts_dis - np.dot(A, X)
+        timeseries = readfile.read_hdf5_stack(h5, 'timeseries', date_list, box).reshape(date_num, -1)
+        timeseries = np.array(timeseries[:, pixel_idx], np.float32)
 
-        # Update DEM error / timeseries matrix
-        delta_z_mat = X[0].reshape((1, length*width))
+        # Consider P_BASELINE variation within one interferogram
+        row_idx = None
+        if inps.pbase.shape[1] > 1:
+            row_idx = rows
+        delta_z, resid = estimate_dem_error(timeseries, A_def, inps.pbase, inps.tbase, row_idx, ex_flag,\
+                                            inps.phase_velocity, inps.update_timeseries)
+        # Geometry: 1/(range_dis * sin(inc_angle)) scales the DEM error column
+        range_dis = pixel_geometry(inps.range_dis, rows, cols)
+        inc_angle = pixel_geometry(inps.incidence_angle, rows, cols)
+        delta_z *= range_dis * np.sin(inc_angle)
+
+        # Scatter valid pixels back to the whole box, with NaN for masked out pixels
+        data = ut.scatter_pixel(delta_z, pixel_idx, box_pixel_num)
+        delta_z_mat[box[1]:box[3], box[0]:box[2]] = data.reshape(-1, box_width)
         if inps.update_timeseries:
-            timeseries -= np.dot(A_delta_z, delta_z_mat)
-        delta_z_mat = np.reshape(delta_z_mat, [length, width], order='F')
-
-    else:
-        print 'ERROR: Script only support same dimension for both incidence angle and range distance matrix.'
-        print 'dimension of incidence angle: '+str(inps.incidence_angle.ndim)
-        print 'dimension of range distance: '+str(inps.range_dis.ndim)
-        sys.exit(1)
+            data = ut.scatter_pixel(timeseries, pixel_idx, box_pixel_num).reshape(date_num, -1, box_width)
+            writefile.write_hdf5_block(h5out, 'timeseries', data, box)
+        del timeseries
+        if inps.residual_cube:
+            data = ut.scatter_pixel(resid, pixel_idx, box_pixel_num).reshape(resid_num, -1, box_width)
+            writefile.write_hdf5_block(h5resid, 'timeseries', data, box)
+
+        # Residual statistics of pixels within mask
+        if inps.resid_mask_file:
+            resid_mask = readfile.read(inps.resid_mask_file, box)[0].flatten()[pixel_idx] != 0
+            resid, rows, cols = resid[:, resid_mask], rows[resid_mask], cols[resid_mask]
+        update_residual_stat(resid_stat, resid, rows, cols, inps.ramp_type)
+        del resid
+        prog_bar.update(i+1, suffix='rows %d-%d' % (box[1], box[3]))
+    prog_bar.close()
+    h5.close()
+    if inps.update_timeseries:
+        h5out.close()
+    if inps.residual_cube:
+        h5resid.close()
 
 
     ##------------------------------------------------ Output  --------------------------------------------##
@@ -425,74 +534,29 @@ def main(argv):
         dem_error_file = 'demGeo_error.h5'
     else:
         dem_error_file = 'demRadar_error.h5'
-    #if inps.phase_velocity:  suffix = '_pha_poly'+str(inps.poly_order)
-    #else:                    suffix = '_vel_poly'+str(inps.poly_order)
-    #dem_error_file = os.path.splitext(dem_error_file)[0]+suffix+os.path.splitext(dem_error_file)[1]
     print 'writing >>> '+dem_error_file
     atr_dem_error = atr.copy()
     atr_dem_error['FILE_TYPE'] = 'dem'
     atr_dem_error['UNIT'] = 'm'
     writefile.write(delta_z_mat, atr_dem_error, dem_error_file)
 
-    ## Phase Constant C = resid_n[0,:]
-    #atrC = atr.copy()
-    #atrC['FILE_TYPE'] = 'mask'
-    #atrC['UNIT'] = 'm'
-    #writefile.write(constC, atrC, 'constD.h5')
-
-    ## Corrected DEM file
-    #if inps.dem_file:
-    #    inps.dem_outfile = os.path.splitext(inps.dem_file)[0]+suffix+os.path.splitext(inps.dem_file)[1]
-    #    print '--------------------------------------'
-    #    print 'writing >>> '+inps.dem_outfile
-    #    dem, atr_dem = readfile.read(inps.dem_file)
-    #    writefile.write(dem+delta_z_mat, atr_dem, inps.dem_outfile)
-    
-    #outfile = 'delta_acc.h5'
-    #print 'writing >>> '+outfile
-    #atr_dem_error = atr.copy()
-    #atr_dem_error['FILE_TYPE'] = 'velocity'
-    #atr_dem_error['UNIT'] = 'm/s'
-    #writefile.write(delta_a_mat, atr_dem_error, outfile)
-    #print '**************************************'
-
-    # Corrected Time Series
-    if inps.update_timeseries:
-        print 'writing >>> '+inps.outfile
-        print 'number of dates: '+str(len(date_list))
-        h5out = h5py.File(inps.outfile,'w')
-        group = h5out.create_group('timeseries')
-        prog_bar = ptime.progress_bar(maxValue=date_num, prefix='writing: ')
-        for i in range(date_num):
-            date = date_list[i]
-            d = np.reshape(timeseries[i][:], [length,width], order='F')
-            dset = group.create_dataset(date, data=d, compression='gzip')
-            prog_bar.update(i+1, suffix=date)
-        prog_bar.close()
-        for key,value in atr.iteritems():
-            group.attrs[key] = value
-        h5out.close()
-
-    outFile = os.path.splitext(inps.outfile)[0]+'InvResid.h5'
-    print 'writing >>> '+outFile
-    print 'number of dates: '+str(A_def.shape[0])
-    h5out = h5py.File(outFile,'w')
-    group = h5out.create_group('timeseries')
-    prog_bar = ptime.progress_bar(maxValue=A_def.shape[0], prefix='writing: ')
-    for i in range(A_def.shape[0]):
-        date = date_list[i]
-        d = np.reshape(resid_n[i][:], [length,width], order='F')
-        dset = group.create_dataset(date, data=d, compression='gzip')
-        prog_bar.update(i+1, suffix=date)
-    prog_bar.close()
-    # Attribute
-    for key,value in atr.iteritems():
-        group.attrs[key] = value
-    if A_def.shape[0] == date_num:
-        group.attrs['UNIT'] = 'm'
+    # Deramped residual RMS / STD of each epoch, same as timeseries_rms.py from the residual cube
+    if inps.ramp_type == 'no':
+        resid_txt_base = os.path.splitext(resid_file)[0]
     else:
-        group.attrs['UNIT'] = 'm/yr'
-    h5out.close()
+        resid_txt_base = os.path.splitext(resid_file)[0]+'_'+inps.ramp_type
+    rms_list, std_list = residual_stat2rms(resid_stat)
+    for name, value_list, title in [('rms', rms_list, 'Root Mean Square'), ('std', std_list, 'Standard Deviation')]:
+        txtFile = resid_txt_base+'_'+name+'.txt'
+        print 'writing >>> '+txtFile
+        f = open(txtFile, 'w')
+        f.write('# Residual '+title+' in space for each epoch of timeseries\n')
+        f.write('# Timeseries file: '+resid_file+'\n')
+        f.write('# Mask file: '+str(inps.resid_mask_file)+'\n')
+        f.write('# Date      '+name.upper()+'(m)\n')
+        for j in range(resid_num):
+            f.write('%s    %.4f\n' % (resid_date_list[j], value_list[j]))
+        f.close()
 
     return
 
@@ -52,8 +52,8 @@ def diff_file(file1, file2, outName=None):
 
         h5_1  = h5py.File(file1)
         h5_2  = h5py.File(file2)
-        epochList = sorted(h5_1[k].keys())
-        epochList2 = sorted(h5_2[k2].keys())
+        epochList = readfile.get_epoch_list(h5_1, k)
+        epochList2 = readfile.get_epoch_list(h5_2, k2)
         if not all(i in epochList2 for i in epochList):
             print file2+' does not contain all group of '+file1
             sys.exit(1)
@@ -72,7 +72,7 @@ def diff_file(file1, file2, outName=None):
             ref_date = None
         else:
             ref_date = atr['ref_date']
-            data2_ref = h5_2[k2].get(ref_date)[:]
+            data2_ref = readfile.read_hdf5_epoch(h5_2, k2, ref_date)
             print 'consider different reference date'
         # check reference pixel
         ref_y = int(atr['ref_y'])
@@ -86,14 +86,14 @@ def diff_file(file1, file2, outName=None):
         # calculate difference in loop
         for i in range(epoch_num):
             date = epochList[i]
-            data1 = h5_1[k].get(date)[:]
-            data2 = h5_2[k2].get(date)[:]
+            data1 = readfile.read_hdf5_epoch(h5_1, k, date)
+            data2 = readfile.read_hdf5_epoch(h5_2, k2, date)
             if ref_date:
                 data2 -= data2_ref
             if ref_x and ref_y:
                 data2 -= data2[ref_y, ref_x]
             data = diff_data(data1, data2)
-            dset = group.create_dataset(date, data=data, compression='gzip')
+            dset = group.create_dataset(date, data=data, **writefile.storage_option(shape=data.shape))
             prog_bar.update(i+1, suffix=date)
         for key,value in atr.iteritems():
             group.attrs[key] = value
@@ -109,11 +109,11 @@ def diff_file(file1, file2, outName=None):
         for i in range(epoch_num):
             epoch1 = epochList[i]
             epoch2 = epochList2[i]
-            data1 = h5_1[k][epoch1].get(epoch1)[:]
-            data2 = h5_2[k2][epoch2].get(epoch2)[:]
+            data1 = readfile.read_hdf5_epoch(h5_1, k, epoch1)
+            data2 = readfile.read_hdf5_epoch(h5_2, k2, epoch2)
             data = diff_data(data1, data2)  
             gg = group.create_group(epoch1)
-            dset = gg.create_dataset(epoch1, data=data, compression='gzip')
+            dset = gg.create_dataset(epoch1, data=data, **writefile.storage_option(shape=data.shape))
             for key, value in h5_1[k][epoch1].attrs.iteritems():
                 gg.attrs[key] = value
             prog_bar.update(i+1, suffix=date12_list[i])
@@ -14,21 +14,24 @@ import datetime
 import h5py
 import numpy as np
 
+import pysar._readfile as readfile
+import pysar._writefile as writefile
+
 ######################################
 
 def get_data(h5timeseries):
 
-    dateList = h5timeseries['timeseries'].keys()
+    dateList = readfile.get_epoch_list(h5timeseries, 'timeseries')
   
     dateIndex={}
     for ni in range(len(dateList)):
         dateIndex[dateList[ni]]=ni
   
-    dset = h5timeseries['timeseries'].get(h5timeseries['timeseries'].keys()[0])
+    dset = readfile.read_hdf5_epoch(h5timeseries, 'timeseries', dateList[0])
     nrows,ncols=np.shape(dset)
-    timeseries = np.zeros((len(h5timeseries['timeseries'].keys()),np.shape(dset)[0]*np.shape(dset)[1]),np.float32)
+    timeseries = np.zeros((len(dateList),np.shape(dset)[0]*np.shape(dset)[1]),np.float32)
     for date in dateList:
-        dset = h5timeseries['timeseries'].get(date)
+        dset = readfile.read_hdf5_epoch(h5timeseries, 'timeseries', date)
         d = dset[0:dset.shape[0],0:dset.shape[1]]
         timeseries[dateIndex[date]][:]=d.flatten(0)
     del d
@@ -120,7 +123,8 @@ def main(argv):
     for date in dateList: 
         i=i+1   
         print date
-        dset = group.create_dataset(date, data=np.reshape(timeseries_filt[i,:],[nrows,ncols]), compression='gzip') 
+        dset = group.create_dataset(date, data=np.reshape(timeseries_filt[i,:],[nrows,ncols]),\
+                                    **writefile.storage_option(shape=(nrows,ncols))) 
   
     #  group = h5timeseriesDEMcor.create_group('timeseries')
     for key,value in h5File['timeseries'].attrs.iteritems():
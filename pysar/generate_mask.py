@@ -100,14 +100,14 @@ def main(argv):
         ext = os.path.splitext(File)[1].lower()
         if ext == '.h5' and k in ['interferograms','coherence','wrapped','timeseries']:
             h5file = h5py.File(File,'r')
-            epochList = h5file[k].keys()
+            epochList = readfile.get_epoch_list(h5file, k)
   
             for epoch in epochList:
                 print epoch
                 if k in ['interferograms','coherence','wrapped']:
-                    data = h5file[k][epoch].get(epoch)[:]
+                    data = readfile.read_hdf5_epoch(h5file, k, epoch)
                 elif k in ['timeseries']:
-                    data = h5file[k].get(epoch)
+                    data = readfile.read_hdf5_epoch(h5file, k, epoch)
                 MaskZero *= data
                 MaskZero[np.isnan(data)] = 0
             h5file.close()
@@ -18,67 +18,226 @@
 import os
 import sys
 import argparse
+import hashlib
 
 import h5py
 import numpy as np
-#from joblib import Parallel, delayed
-#import multiprocessing
 
+import pysar._datetime as ptime
 import pysar._readfile  as readfile
 import pysar._writefile as writefile
 import pysar._pysar_utilities as ut
 import pysar.subset as subset
+from pysar._readfile import multi_group_hdf5_file, multi_dataset_hdf5_file
 
 
-def geomap4subset_radar_file(radar_atr, geomap_file):
-    ''' Add offset value to geomap file if input radar file has been subsetted.'''
-    if 'subset_x0' in radar_atr.keys():
-        x0 = float(radar_atr['subset_x0'])
-        y0 = float(radar_atr['subset_y0'])
-        print '\nInput radar coord file has been subsetted.\n    creating temporary geomap file for it...'
-
-        rg,az,rsc = readfile.read_float32(geomap_file)
-        rg = rg - x0
-        az = az - y0
-
-        geomap_file = 'temp_'+geomap_file
-        print '    writing >>> '+geomap_file+'\n'
-        writefile.write_float32(rg, az, geomap_file)
-        writefile.write_roipac_rsc(rsc, geomap_file+'.rsc')
-
-    return geomap_file
-
-
-######################  Geocode one data  ########################
-def geocode_data_roipac(data, atr, geomapFile, roipac_name):
-    '''Geocode input data with attribute dict using geomapFile
+############################  Lookup table  ##############################
+def read_lookup_table(lookup_file, atr_rdr=dict()):
+    '''Read range/azimuth lookup table in coordinate of radar file, which may have been subsetted.
     Inputs:
-        data : 2D np.array
-        atr  : dict, attributes
-        geomapFile  : string, path of geomap*.trans file
-        roipac_name : string, path of roipac file
+        lookup_file - string, path of geomap*.trans file
+        atr_rdr     - dict, attributes of file in radar coord, for subset_x0/y0
+    Outputs:
+        rg/az   - 2D np.array in float32 in geo coord, range/azimuth pixel number of input radar file,
+                  NaN for area not covered by radar data, marked with zero in both range and azimuth
+        atr_lut - dict, attributes of lookup table
     '''
-
-    print 'writing to roi_pac unw file format'
-    writefile.write_float32(data, roipac_name)
-    writefile.write_roipac_rsc(atr, roipac_name+'.rsc')
- 
-    geoCmd = 'geocode.pl '+geomapFile+' '+roipac_name+' geo_'+roipac_name
-    os.system(geoCmd)
-    print geoCmd
- 
-    print 'reading geocoded file...'
-    amp,unw,unwrsc = readfile.read_float32('geo_'+roipac_name)
- 
-    rmCmd = 'rm '+roipac_name+' '+roipac_name+'.rsc';           os.system(rmCmd);       print rmCmd
-    rmCmd = 'rm geo_'+roipac_name+' geo_'+roipac_name+'.rsc';   os.system(rmCmd);       print rmCmd
- 
-    return amp, unw, unwrsc
+    print 'reading lookup table: '+lookup_file
+    rg, az, atr_lut = readfile.read(lookup_file)
+    rg = np.array(rg, np.float32)
+    az = np.array(az, np.float32)
+    no_coverage = (rg == 0.) & (az == 0.)
+
+    if 'subset_x0' in atr_rdr.keys():
+        print 'input radar coord file has been subsetted, shift lookup table by subset_x0/y0'
+        rg -= float(atr_rdr['subset_x0'])
+        az -= float(atr_rdr['subset_y0'])
+    rg[no_coverage] = np.nan
+    az[no_coverage] = np.nan
+    return rg, az, atr_lut
+
+
+def lookup_index(rg, az, length, width, interp_method='nearest'):
+    '''Get index and weight of radar pixels to resample each geo pixel.
+    Inputs:
+        rg/az         - 2D np.array in geo coord, output of read_lookup_table()
+        length/width  - int, size of radar file
+        interp_method - string, nearest or bilinear
+    Outputs:
+        pixel_idx - 1D np.array of int, flat index of geo pixels covered by radar data
+        idx       - 2D np.array of int in size of (neighbor_num, valid_pixel_num), flat index of radar pixels,
+                    with neighbor_num = 1 for nearest and 4 for bilinear
+        weight    - 2D np.array of float32 in size of (neighbor_num, valid_pixel_num), weight of radar pixels
+    '''
+    rg = rg.flatten()
+    az = az.flatten()
+    with np.errstate(invalid='ignore'):
+        if interp_method == 'nearest':
+            x = np.floor(rg+0.5)
+            y = np.floor(az+0.5)
+            valid = (x >= 0) & (x <= width-1) & (y >= 0) & (y <= length-1)
+        elif interp_method == 'bilinear':
+            valid = (rg >= 0) & (rg <= width-1) & (az >= 0) & (az <= length-1)
+        else:
+            raise ValueError('Un-recognized interpolation method: '+str(interp_method))
+    pixel_idx = np.flatnonzero(valid)
+
+    if interp_method == 'nearest':
+        idx = (y[pixel_idx].astype(np.int64)*width + x[pixel_idx].astype(np.int64)).reshape(1,-1)
+        weight = np.ones(idx.shape, np.float32)
+    else:
+        rg = rg[pixel_idx]
+        az = az[pixel_idx]
+        x0 = np.floor(rg).astype(np.int64)
+        y0 = np.floor(az).astype(np.int64)
+        x1 = np.minimum(x0+1, width-1)
+        y1 = np.minimum(y0+1, length-1)
+        fx = (rg - x0).astype(np.float32)
+        fy = (az - y0).astype(np.float32)
+        idx = np.vstack((y0*width+x0, y0*width+x1, y1*width+x0, y1*width+x1))
+        weight = np.vstack(((1-fx)*(1-fy), fx*(1-fy), (1-fx)*fy, fx*fy))
+    return pixel_idx, idx, weight
+
+
+def resample_data(data, pixel_idx, idx, weight, geo_shape, fill_value=0.):
+    '''Resample data in radar coord into geo coord, using output of lookup_index().
+    Inputs:
+        data       - 2D np.array in [y, x] or 3D np.array in [epoch, y, x] in radar coord
+        pixel_idx/idx/weight - output of lookup_index()
+        geo_shape  - 2-tuple of int, length and width in geo coord
+        fill_value - number, value for area not covered by radar data
+    Output:
+        geo_data - 2D/3D np.array in geo coord, in the same data type as input for nearest
+                   interpolation, in float32 for bilinear interpolation
+    '''
+    epoch_shape = data.shape[:-2]
+    data = data.reshape(-1, data.shape[-2]*data.shape[-1])
+    if idx.shape[0] == 1:
+        geo_data = np.zeros((data.shape[0], geo_shape[0]*geo_shape[1]), data.dtype)
+        geo_data[:] = fill_value
+        geo_data[:, pixel_idx] = data[:, idx[0]]
+    else:
+        geo_data = np.zeros((data.shape[0], geo_shape[0]*geo_shape[1]), np.float32)
+        geo_data[:] = fill_value
+        geo_valid = data[:, idx[0]] * weight[0]
+        for i in range(1, idx.shape[0]):
+            geo_valid += data[:, idx[i]] * weight[i]
+        geo_data[:, pixel_idx] = geo_valid
+    return geo_data.reshape(epoch_shape+tuple(geo_shape))
+
+
+############################  Geocoding plan  ##############################
+# Plan last used in the current process, keyed by plan key
+geocode_plan_cache = dict()
+# Checksum of lookup tables, keyed by path, size and modification time
+lookup_checksum_cache = dict()
+
+def lookup_table_checksum(lookup_file):
+    '''MD5 checksum of lookup table data and metadata file, computed once per file version in a process'''
+    lookup_file = os.path.abspath(lookup_file)
+    stat = os.stat(lookup_file)
+    file_key = (lookup_file, stat.st_size, stat.st_mtime)
+    if file_key not in lookup_checksum_cache:
+        md5 = hashlib.md5()
+        for fname in [lookup_file, lookup_file+'.rsc']:
+            with open(fname, 'rb') as f:
+                for chunk in iter(lambda: f.read(64*1024**2), b''):
+                    md5.update(chunk)
+        lookup_checksum_cache[file_key] = md5.hexdigest()
+    return lookup_checksum_cache[file_key]
+
+
+def get_geocode_plan(lookup_file, atr_rdr, interp_method='nearest', plan_dir=None):
+    '''Get resampling plan from radar coord of input file to geo coord of lookup table.
+    The plan only depends on the lookup table, the size and subset_x0/y0 of radar file and the
+    interpolation method. It is cached on disk keyed on the lookup table checksum, so that geocoding
+    another file of the same track with existing plan needs no lookup table processing.
+    Inputs:
+        lookup_file   - string, path of geomap*.trans file
+        atr_rdr       - dict, attributes of file in radar coord
+        interp_method - string, nearest or bilinear
+        plan_dir      - string, directory of plan file, current directory by default
+    Output:
+        plan - dict, with the following items:
+               key    - string, checksum of lookup table and radar file info
+               pixel_idx, idx, weight - output of lookup_index()
+               geo_shape - 2-tuple of int, length and width in geo coord
+               atr_geo   - dict, attributes of geo coord, from lookup table
+    Example:
+        plan = get_geocode_plan('geomap_4rlks.trans', atr, 'bilinear')
+        geo_data = geocode_data(data, plan)
+    '''
+    length = int(atr_rdr['FILE_LENGTH'])
+    width = int(atr_rdr['WIDTH'])
+    x0 = atr_rdr.get('subset_x0', '0')
+    y0 = atr_rdr.get('subset_y0', '0')
+    key = '%s_%d_%d_%s_%s_%s' % (lookup_table_checksum(lookup_file), length, width, x0, y0, interp_method)
+    key = hashlib.md5(key).hexdigest()
+
+    if key in geocode_plan_cache:
+        return geocode_plan_cache[key]
+
+    if not plan_dir:
+        plan_dir = os.getcwd()
+    plan_file = os.path.join(plan_dir, 'geocodePlan_'+key[:16]+'.npz')
+    plan = None
+    if os.path.isfile(plan_file):
+        try:
+            plan_npz = np.load(plan_file)
+            if str(plan_npz['key']) == key:
+                print 'use existing geocoding plan: '+plan_file
+                plan = dict([(i, plan_npz[i]) for i in ['pixel_idx','idx','weight']])
+                plan['geo_shape'] = tuple(plan_npz['geo_shape'])
+            plan_npz.close()
+        except Exception:
+            print 'WARNING: can not read geocoding plan: '+plan_file
+
+    if plan is None:
+        rg, az, atr_lut = read_lookup_table(lookup_file, atr_rdr)
+        plan = dict()
+        plan['geo_shape'] = rg.shape
+        plan['pixel_idx'], plan['idx'], plan['weight'] = lookup_index(rg, az, length, width, interp_method)
+        del rg, az
+        # int32 index is enough for most radar files
+        if length*width < 2**31:
+            plan['idx'] = plan['idx'].astype(np.int32)
+            plan['pixel_idx'] = plan['pixel_idx'].astype(np.int32)
+
+        # Write to temporary file first, so that parallel processes never read a partial plan
+        print 'writing geocoding plan >>> '+plan_file
+        try:
+            plan_file_tmp = plan_file+'.%d.tmp' % os.getpid()
+            with open(plan_file_tmp, 'wb') as f:
+                np.savez(f, key=key, pixel_idx=plan['pixel_idx'], idx=plan['idx'], weight=plan['weight'],\
+                         geo_shape=np.array(plan['geo_shape']))
+            os.rename(plan_file_tmp, plan_file)
+        except (IOError, OSError):
+            print 'WARNING: can not write geocoding plan: '+plan_file
+
+    plan['key'] = key
+    plan['atr_geo'] = dict(readfile.read_attribute(lookup_file))
+    plan['atr_geo']['WIDTH'] = str(plan['geo_shape'][1])
+    plan['atr_geo']['FILE_LENGTH'] = str(plan['geo_shape'][0])
+    geocode_plan_cache.clear()
+    geocode_plan_cache[key] = plan
+    return plan
+
+
+def geocode_data(data, plan, fill_value=0.):
+    '''Geocode 2D np.array in [y, x] or 3D np.array in [epoch, y, x] with plan from get_geocode_plan()'''
+    return resample_data(data, plan['pixel_idx'], plan['idx'], plan['weight'], plan['geo_shape'], fill_value)
 
 
 ######################################################################################
 def geocode_attribute(atr_rdr, atr_geo, transFile=None):
-    '''Update attributes after geocoding'''
+    '''Update attributes after geocoding
+    Inputs:
+        atr_rdr   - dict, attributes of file in radar coord
+        atr_geo   - dict, attributes of geo coord, i.e. from lookup table
+        transFile - string, path of geomap*.trans file for the whole radar coverage, to convert reference point
+    Output:
+        atr - dict, attributes of geocoded file
+    '''
     atr = dict()
     for key, value in atr_geo.iteritems():  atr[key] = str(value)
     for key, value in atr_rdr.iteritems():  atr[key] = str(value)
@@ -103,118 +262,121 @@ def geocode_attribute(atr_rdr, atr_geo, transFile=None):
     return atr
 
 
-def geocode_file_roipac(infile, geomap_file, outfile=None):
-    '''Geocode one file'''
+def geocode_file(infile, lookup_file, outfile=None, interp_method='nearest', fill_value=0.):
+    '''Geocode one file using range/azimuth lookup table, from HDF5 to HDF5 for multi-epoch file.
+    The resampling plan is got once per file, from disk cache if available, and then applied to each epoch.
+    Inputs:
+        infile      - string, path of file in radar coord, PySAR HDF5 file, .dem, .mli file or
+                      ROI_PAC .unw/.cor/.hgt/.msk/.trans/.int/.amp/.flg/.byt file
+        lookup_file - string, path of geomap*.trans file
+        outfile     - string, path of output file, geo_infile by default
+        interp_method - string, nearest or bilinear, nearest is always used for wrapped phase and mask
+        fill_value  - number, value for area not covered by radar data
+    Output:
+        outfile - string, path of output file
+    '''
     # Input file info
     atr = readfile.read_attribute(infile)
     k = atr['FILE_TYPE']
+    ext = os.path.splitext(infile)[1].lower()
     print 'geocoding '+k+' file: '+infile+' ...'
+    if k in ['wrapped','mask','.int','.flg','.byt','.msk']:
+        interp_method = 'nearest'
+    print 'interpolation method: '+interp_method
+
+    # Resampling plan from lookup table
+    plan = get_geocode_plan(lookup_file, atr, interp_method)
+    geo_shape = plan['geo_shape']
+    atr_geo = plan['atr_geo']
 
-    # roipac outfile name info - intermediate product
-    infile_base, ext = os.path.splitext(infile)
-    infile_mark = infile_base+'_'+ext.split('.')[1]
-    if k in ['coherence','temporal_coherence','.cor']:
-        roipac_ext = '.cor'
-    elif k in ['wrapped','.int']:
-        roipac_ext = '.int'
-    else:
-        roipac_ext = '.unw'
-     
-    # temporary geomap file - needed for parallel processing
-    geomap_file2 = geomap_file.split('.trans')[0]+'4'+infile_mark+'.trans'
-    cpCmd = 'cp '+geomap_file+' '+geomap_file2;              os.system(cpCmd);  print cpCmd
-    cpCmd = 'cp '+geomap_file+'.rsc '+geomap_file2+'.rsc';   os.system(cpCmd);  print cpCmd
-    
     # Output file name
     if not outfile:
-        outfile = 'geo_'+infile
+        outfile = 'geo_'+os.path.basename(infile)
     print 'writing >>> '+outfile
 
-    # Multi-dataset file
-    if k in ['timeseries','interferograms','coherence','wrapped']:
+    # Multi-epoch file
+    if k in multi_group_hdf5_file+multi_dataset_hdf5_file:
         h5 = h5py.File(infile, 'r')
-        epochList = sorted(h5[k].keys())
-        
+        epochList = readfile.get_epoch_list(h5, k)
+        if readfile.is_cube_hdf5(h5, k):  layout = 'cube'
+        else:  layout = 'split'
+        dtype = readfile.read_hdf5_epoch(h5, k, epochList[0], box=(0,0,1,1)).dtype
+        if interp_method != 'nearest':
+            dtype = np.float32
+
         h5out = h5py.File(outfile, 'w')
-        group = h5out.create_group(k)
-        
-        if k in ['interferograms','coherence','wrapped']:
+        if k in multi_group_hdf5_file:
             print 'number of interferograms: '+str(len(epochList))
-            for epoch in epochList:
-                print epoch
-                data = h5[k][epoch].get(epoch)[:]
-                atr = h5[k][epoch].attrs
-                
-                roipac_name = infile_mark+'_'+epoch+roipac_ext
-                geo_amp, geo_data, geo_rsc = geocode_data_roipac(data, atr, geomap_file2, roipac_name)
-                geo_atr = geocode_attribute(atr, geo_rsc, geomap_file2)
-                
-                gg = group.create_group('geo_'+epoch)
-                dset = gg.create_dataset('geo_'+epoch, data=geo_data, compression='gzip')
-                for key, value in geo_atr.iteritems():
-                    gg.attrs[key] = value
-
-        elif k in ['timeseries']:
+            outEpochList = ['geo_'+epoch for epoch in epochList]
+            atr_list = [geocode_attribute(h5[k][epoch].attrs, atr_geo, lookup_file) for epoch in epochList]
+            writefile.create_hdf5_stack(h5out, k, outEpochList, geo_shape[0], geo_shape[1], atr_list=atr_list,\
+                                        layout=layout, dtype=dtype)
+        else:
             print 'number of acquisitions: '+str(len(epochList))
-            for epoch in epochList:
-                print epoch
-                data = h5[k].get(epoch)[:]
-                
-                roipac_name = infile_mark+'_'+epoch+roipac_ext
-                geo_amp, geo_data, geo_rsc = geocode_data_roipac(data, atr, geomap_file2, roipac_name)
-                
-                dset = group.create_dataset(epoch, data=geo_data, compression='gzip')
-            geo_atr = geocode_attribute(atr, geo_rsc, geomap_file2)
-            for key, value in geo_atr.iteritems():
-                group.attrs[key] = value
-                
+            outEpochList = list(epochList)
+            geo_atr = geocode_attribute(atr, atr_geo, lookup_file)
+            writefile.create_hdf5_stack(h5out, k, outEpochList, geo_shape[0], geo_shape[1], atr=geo_atr,\
+                                        layout=layout, dtype=dtype)
+
+        prog_bar = ptime.progress_bar(maxValue=len(epochList))
+        for i in range(len(epochList)):
+            data = readfile.read_hdf5_epoch(h5, k, epochList[i])
+            geo_data = geocode_data(data, plan, fill_value)
+            writefile.write_hdf5_block(h5out, k, geo_data[np.newaxis,:,:], epoch_list=[outEpochList[i]])
+            prog_bar.update(i+1, suffix=epochList[i])
+        prog_bar.close()
         h5.close()
         h5out.close()
 
-    # Single-dataset file
-    elif atr['PROCESSOR'] == 'roipac':
-        rmCmd = 'rm geo_'+infile+' geo_'+infile+'.rsc'
-        os.system(rmCmd)
-        print rmCmd
-
-        geoCmd = 'geocode.pl '+geomap_file2+' '+infile+' geo_'+infile
-        os.system(geoCmd)
-        print geoCmd
+    # ROI_PAC file with two bands
+    elif atr['PROCESSOR'] == 'roipac' and ext in ['.unw','.cor','.hgt','.msk','.trans']:
+        amp, data, atr = readfile.read_float32(infile)
+        geo_amp, geo_data = geocode_data(np.array([amp, data]), plan, fill_value)
+        geo_atr = geocode_attribute(atr, atr_geo, lookup_file)
+        writefile.write_float32(geo_amp, geo_data, outfile)
+        writefile.write_roipac_rsc(geo_atr, outfile+'.rsc')
+
+    # ROI_PAC complex file, geocode real and imaginary part together
+    elif atr['PROCESSOR'] == 'roipac' and ext in ['.int','.amp']:
+        data, atr = readfile.read_complex_float32(infile, real_imag=True)
+        geo_real, geo_imag = geocode_data(np.array([data.real, data.imag]), plan, fill_value)
+        geo_atr = geocode_attribute(atr, atr_geo, lookup_file)
+        writefile.write_complex_float32(geo_real + 1j*geo_imag, outfile)
+        writefile.write_roipac_rsc(geo_atr, outfile+'.rsc')
+
+    # ROI_PAC flag file, keep bits of each byte
+    elif atr['PROCESSOR'] == 'roipac' and ext in ['.flg','.byt']:
+        data, atr = readfile.read_flag(infile)
+        geo_data = geocode_data(data.view(np.uint8), plan, fill_value)
+        geo_atr = geocode_attribute(atr, atr_geo, lookup_file)
+        writefile.write_flag(geo_data, outfile)
+        writefile.write_roipac_rsc(geo_atr, outfile+'.rsc')
 
-        atr_rdr = readfile.read_roipac_rsc(infile+'.rsc')
-        atr_geo = readfile.read_roipac_rsc('geo_'+infile+'.rsc')
-        atr_geo = geocode_attribute(atr_rdr, atr_geo)
-        writefile.write_roipac_rsc(atr_geo, 'geo_'+infile+'.rsc')
-
-    else:
-        rmCmd = 'rm '+outfile+' '+outfile+'.rsc';    os.system(rmCmd);    print rmCmd
+    # Single-dataset file
+    elif ext in ['.h5','.he5','.dem','.mli']:
         data, atr = readfile.read(infile)
-
-        roipac_name = infile_mark+roipac_ext
-        geo_amp, geo_data, geo_rsc = geocode_data_roipac(data, atr, geomap_file2, roipac_name)
-        geo_atr = geocode_attribute(atr, geo_rsc, geomap_file2)
-        
+        geo_data = geocode_data(data, plan, fill_value)
+        geo_atr = geocode_attribute(atr, atr_geo, lookup_file)
         writefile.write(geo_data, geo_atr, outfile)
 
-    # delete temporary geomap file
-    rmCmd='rm '+geomap_file2+' '+geomap_file2+'.rsc'
-    print rmCmd
-    os.system(rmCmd)
+    else:
+        raise ValueError('Un-supported file format for geocoding: '+infile)
 
     return outfile
 
 
 ######################################################################################
 EXAMPLE='''example:
-  geocode.py  geomap_8rlks.trans  velocity.py
+  geocode.py  geomap_8rlks.trans  velocity.h5
   geocode.py  geomap_8rlks.trans  *velocity*h5
   geocode.py  geomap_8rlks.trans  timeseries_ECMWF_demCor.h5 velocity_ex.h5
   geocode.py  geomap_8rlks.trans  100901-*.cor
+  geocode.py  geomap_8rlks.trans  unwrapIfgram.h5  --interp bilinear
 '''
 
 
 def cmdLineParse():
-    parser = argparse.ArgumentParser(description='Geocode PySAR products using roi_pac geocoding function',\
+    parser = argparse.ArgumentParser(description='Geocode PySAR products using roi_pac look-up table',\
                                      formatter_class=argparse.RawTextHelpFormatter,\
                                      epilog=EXAMPLE)
 
@@ -223,8 +385,13 @@ def cmdLineParse():
                              'i.e. geomap_*rlks.trans for roi_pac product')
     parser.add_argument('file', nargs='+', help='File(s) to be geocoded')
     parser.add_argument('-o','--outfile', help='Output file name. Disabled when more than 1 input files')
+    parser.add_argument('-i','--interp', dest='interp_method', default='nearest', choices=['nearest','bilinear'],\
+                        help='interpolation method, default: nearest.\n'
+                             'nearest is always used for wrapped phase and mask.')
+    parser.add_argument('--fill', dest='fill_value', type=float, default=0.,\
+                        help='value for area not covered by radar data, default: 0')
     parser.add_argument('--parallel',dest='parallel',action='store_true',\
-                        help='Disable parallel processing. Diabled auto for 1 input file.')
+                        help='Enable parallel processing. Diabled auto for 1 input file.')
     
     inps = parser.parse_args()
     return inps
@@ -234,44 +401,29 @@ def cmdLineParse():
 def main(argv):
     inps = cmdLineParse()
     inps.file = ut.get_file_list(inps.file)
-    print 'number of file to mask: '+str(len(inps.file))
+    print 'number of file to geocode: '+str(len(inps.file))
     print inps.file
 
-    if not ut.which('geocode.pl'):
-        sys.exit("\nERROR: Can not find geocode.pl, it's needed for geocoding.\n")
-    
     #print '\n***************** Geocoding *******************'
     if not inps.lookup_file.endswith('.trans'):
         print 'ERROR: Input lookup file is not .trans file: '+inps.lookup_file+'\n'
         sys.exit(1)
 
-    # Check geomap file for previously subsetted radar coord file
-    atr = readfile.read_attribute(inps.file[0])
-    if 'subset_x0' in atr.keys():
-        inps.lookup_file = geomap4subset_radar_file(atr, inps.lookup_file)
-
     # check outfile and parallel option
     if inps.parallel:
         num_cores, inps.parallel, Parallel, delayed = ut.check_parallel(len(inps.file))
 
     # Geocoding
     if len(inps.file) == 1:
-        geocode_file_roipac(inps.file[0], inps.lookup_file, inps.outfile)
+        geocode_file(inps.file[0], inps.lookup_file, inps.outfile, inps.interp_method, inps.fill_value)
 
     elif inps.parallel:
-        #num_cores = min(multiprocessing.cpu_count(), len(inps.file), pysar.parallel_num)
-        #print 'parallel processing using %d cores ...'%(num_cores)
-        Parallel(n_jobs=num_cores)(delayed(geocode_file_roipac)(file, inps.lookup_file) for file in inps.file)
+        Parallel(n_jobs=num_cores)(delayed(geocode_file)(file, inps.lookup_file, None, inps.interp_method,\
+                                                         inps.fill_value) for file in inps.file)
     else:
         for File in inps.file:
             print '----------------------------------------------------'
-            geocode_file_roipac(File, inps.lookup_file)
-
-    # clean temporary geomap file for previously subsetted radar coord file
-    if 'subset_x0' in atr.keys():
-        rmCmd='rm '+inps.lookup_file+' '+inps.lookup_file+'.rsc'
-        os.system(rmCmd)
-        print rmCmd
+            geocode_file(File, inps.lookup_file, None, inps.interp_method, inps.fill_value)
 
     print 'Done.'
     return
@@ -14,6 +14,7 @@ import h5py
 
 import pysar._pysar_utilities as ut
 import pysar._readfile as readfile
+import pysar._writefile as writefile
 
 
 ######################################
@@ -24,15 +25,34 @@ def usage():
   
   Usage:
       igram_inversion.py interferograms_file
-      igram_inversion.py -f interferograms_file [ -l method -o timeseries_file]
+      igram_inversion.py -f interferograms_file [ -l method -o timeseries_file --memory max_memory --parallel num --skip-missing
+                          --coherence coherence_file --weight-func var --temp-coh temp_coh_file --residual residual_file
+                          --mask mask_file]
   
       -f: stacked interferograms file
       -l: inverse method, L2 (default) or L1
       -o: output timeseries file name
+      --memory: max memory in GB used for block-wise inversion, default is pysar.max_memory
+      --parallel: number of processes used for inversion, default is pysar.parallel_num
+      --skip-missing: exclude zero/NaN observations pixel by pixel,
+                      instead of using them as valid observations
+      --coherence: coherence file for weighted inversion
+      --weight-func: function to convert coherence into weight, var (default) or coh
+                     var - inverse of phase variance, gamma^2/(1-gamma^2)
+                     coh - spatial coherence
+      --temp-coh: output temporal coherence file, calculated in the same pass as the inversion
+      --residual: output text file of spatial mean and RMS of residual phase for each interferogram,
+                  calculated in the same pass as the inversion
+      --mask: mask file, only pixels with non-zero value are inverted, the others are set to NaN
   
   Example:
       igram_inversion.py Seeded_unwrapIfgram.h5
       igram_inversion.py -f Seeded_unwrapIfgram.h5 -l L1
+      igram_inversion.py -f Seeded_unwrapIfgram.h5 --memory 16 --parallel 32
+      igram_inversion.py -f Seeded_unwrapIfgram.h5 --skip-missing
+      igram_inversion.py -f Seeded_unwrapIfgram.h5 --coherence coherence.h5
+      igram_inversion.py -f Seeded_unwrapIfgram.h5 --temp-coh temporalCoherence.h5 --residual residualIfgram.txt
+      igram_inversion.py -f Seeded_unwrapIfgram.h5 --mask mask.h5
 
 ********************************************************************************
     '''
@@ -41,10 +61,19 @@ def usage():
 def main(argv):
 
     inversion_method = 'l2'
+    max_memory = None
+    parallel_num = None
+    skip_missing = False
+    coherenceFile = None
+    weight_func = 'var'
+    temp_coh_file = None
+    residual_file = None
+    maskFile = None
     #maskFile = 'Mask.h5'
   
     if len(sys.argv)>2:
-        try:   opts, args = getopt.getopt(argv,"h:f:l:o:")
+        try:   opts, args = getopt.getopt(argv,"h:f:l:o:",['memory=','parallel=','skip-missing','coherence=','weight-func=',\
+                                                              'temp-coh=','residual=','mask='])
         except getopt.GetoptError:
             usage() ; sys.exit(1)
   
@@ -53,6 +82,14 @@ def main(argv):
             elif opt == '-f':           igramsFile        = arg
             elif opt == '-l':           inversion_method  = arg.lower()
             elif opt == '-o':           timeseriesFile    = arg
+            elif opt == '--memory':     max_memory        = float(arg)
+            elif opt == '--parallel':   parallel_num      = int(arg)
+            elif opt == '--skip-missing': skip_missing    = True
+            elif opt == '--coherence':  coherenceFile     = arg
+            elif opt == '--weight-func': weight_func      = arg.lower()
+            elif opt == '--temp-coh':   temp_coh_file     = arg
+            elif opt == '--residual':   residual_file     = arg
+            elif opt == '--mask':       maskFile          = arg
   
     elif len(sys.argv)==2:
         if os.path.isfile(argv[0]):     igramsFile = argv[0]
@@ -85,10 +122,12 @@ def main(argv):
     #print '\n************** Inverse Time Series ****************'
     if not inversion_method == 'l1':
         print 'Inverse time series using L2 norm minimization'
-        ut.timeseries_inversion(igramsFile,timeseriesFile)
+        inversion_method = 'l2'
     else:
         print 'Inverse time series using L1 norm minimization'
-        ut.timeseries_inversion_L1(igramsFile,timeseriesFile)
+    ut.timeseries_inversion(igramsFile,timeseriesFile,max_memory,parallel_num,skip_missing,\
+                            coherenceFile,weight_func,inversion_method,temp_coh_file,residual_file,\
+                            maskFile)
   
     ## generate 'mask' for timeseries.h5
     #print 'Generate mask group in timeseries file.'
@@ -98,7 +137,7 @@ def main(argv):
     #    dset1 = h5filem[kM[0]].get(kM[0])
     #    Mask = dset1[0:dset1.shape[0],0:dset1.shape[1]]
     #    group=h5timeseries.create_group('mask')
-    #    dset = group.create_dataset('mask', data=Mask, compression='gzip')
+    #    dset = group.create_dataset('mask', data=Mask, **writefile.storage_option(shape=Mask.shape))
     #    h5filem.close()
     #    print 'mask: '+maskFile
     #except:
@@ -106,7 +145,7 @@ def main(argv):
     #        dset1 = h5file['mask'].get('mask')
     #        Mask = dset1[0:dset1.shape[0],0:dset1.shape[1]] 
     #        group=h5timeseries.create_group('mask')
-    #        dset = group.create_dataset('mask', data=Mask, compression='gzip')
+    #        dset = group.create_dataset('mask', data=Mask, **writefile.storage_option(shape=Mask.shape))
     #        print 'mask: mask group in '+igramsFile
     #    except:
     #        print 'No mask found, cannot inverse timeseries without mask!'
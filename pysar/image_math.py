@@ -126,49 +126,49 @@ def main(argv):
        
             dataOut = operation(data,operator,operand)
        
-            dset = group.create_dataset(k[0], data=dataOut, compression='gzip')
+            dset = group.create_dataset(k[0], data=dataOut, **writefile.storage_option(shape=dataOut.shape))
             for key , value in h5file[k[0]].attrs.iteritems():
                 group.attrs[key]=value
    
         elif k[0] == 'timeseries':
-            dateList = h5file[k[0]].keys()
+            dateList = readfile.get_epoch_list(h5file, k[0])
             print 'number of acquisitions: '+str(len(dateList))
             for date in dateList:
                 print date
-                dset = h5file[k[0]].get(date)
+                dset = readfile.read_hdf5_epoch(h5file, k[0], date)
                 data = dset[0:dset.shape[0],0:dset.shape[1]]
        
                 dataOut = operation(data,operator,operand)
        
-                dset = group.create_dataset(date, data=dataOut, compression='gzip')
+                dset = group.create_dataset(date, data=dataOut, **writefile.storage_option(shape=dataOut.shape))
             for key,value in h5file[k[0]].attrs.iteritems():
                 group.attrs[key] = value
    
         elif k[0] in ['interferograms','coherence','wrapped']:
-            ifgramList = h5file[k[0]].keys()
+            ifgramList = readfile.get_epoch_list(h5file, k[0])
             print 'number of interferograms: '+str(len(ifgramList))
             for igram in ifgramList:
                 print igram
-                dset = h5file[k[0]][igram].get(igram)
+                dset = readfile.read_hdf5_epoch(h5file, k[0], igram)
                 data = dset[0:dset.shape[0],0:dset.shape[1]]
         
                 dataOut = operation(data,operator,operand)
         
                 group2 = group.create_group(igram)
-                dset = group2.create_dataset(igram, data=dataOut, compression='gzip')
+                dset = group2.create_dataset(igram, data=dataOut, **writefile.storage_option(shape=dataOut.shape))
                 for key, value in h5file[k[0]][igram].attrs.iteritems():
                     group2.attrs[key] = value
        
             try:
                 mask = h5file['mask'].get('mask')
                 gm = h5fileOut.create_group('mask')
-                dset = gm.create_dataset('mask', data=mask, compression='gzip')
+                dset = gm.create_dataset('mask', data=mask, **writefile.storage_option(shape=mask.shape))
             except:  print 'No group for mask found in the file.'
        
             try:
                 Cset = h5file['meanCoherence'].get('meanCoherence')
                 gm = h5fileOut.create_group('meanCoherence')
-                dset = gm.create_dataset('meanCoherence', data=Cset, compression='gzip')
+                dset = gm.create_dataset('meanCoherence', data=Cset, **writefile.storage_option(shape=Cset.shape))
             except:  print 'No group for meanCoherence found in the file'
 
         else: print 'ERROR: Unrecognized HDF5 file type: '+k[0]; sys.exit(1)
@@ -108,7 +108,7 @@ def main(argv):
     try:
         if k in ['timeseries'] and argv[1] in ['--date']:
             h5 = h5py.File(File, 'r')
-            dateList = h5[k].keys()
+            dateList = readfile.get_epoch_list(h5, k)
             for date in dateList:
                 print date
             h5.close()
@@ -139,7 +139,7 @@ def main(argv):
 
         ##### DateList / IgramList
         if k in ['interferograms','coherence','wrapped','timeseries']:
-            epochList = sorted(h5file[k].keys())
+            epochList = readfile.get_epoch_list(h5file, k)
 
     if k == 'timeseries':
         try: print_timseries_date_info(epochList)
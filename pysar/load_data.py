@@ -16,6 +16,7 @@ import sys
 import glob
 import argparse
 import warnings
+import multiprocessing
 
 import h5py
 import numpy as np
@@ -167,7 +168,7 @@ def check_existed_hdf5_file(roipacFileList, hdf5File):
             return outFileList
         k = atr['FILE_TYPE']
         h5 = h5py.File(hdf5File, 'r')
-        epochList = sorted(h5[k].keys())
+        epochList = readfile.get_epoch_list(h5, k)
         h5.close()
         
         # Remove file/epoch that already existed
@@ -191,13 +192,46 @@ def check_existed_hdf5_file(roipacFileList, hdf5File):
     return outFileList
 
 
+def read_roipac_file(fname, extra_meta_dict=dict()):
+    '''Read data and attributes of one ROI_PAC file, with baseline info and PySAR attributes
+    Inputs:
+        fname : string, path of ROI_PAC .unw/.cor/.int/.byt file
+        extra_meta_dict : dict, extra attribute dictionary
+    Outputs:
+        data  : 2D np.array
+        atr   : dict, attributes
+    '''
+    data, atr = readfile.read(fname)
+
+    if 'PROCESSOR' in atr.keys() and atr['PROCESSOR'] == 'roipac':
+        try:
+            d1, d2 = atr['DATE12'].split('-')
+            baseline_file = os.path.dirname(fname)+'/'+d1+'_'+d2+'_baseline.rsc'
+            baseline_rsc = readfile.read_roipac_rsc(baseline_file)
+            atr.update(baseline_rsc)
+        except:
+            print 'No *_baseline.rsc file found!'
+
+    # PySAR attributes
+    atr['drop_ifgram'] = 'no'
+    try:     atr['PROJECT_NAME'] = extra_meta_dict['project_name']
+    except:  atr['PROJECT_NAME'] = 'PYSAR'
+    return data, atr
+
+
+def read_roipac_file_star(args):
+    return read_roipac_file(*args)
+
+
 def roipac2multi_group_hdf5(fileType, fileList, hdf5File='unwrapIfgram.h5', extra_meta_dict=dict()):
     '''Load multiple ROI_PAC files into HDF5 file (Multi-group, one dataset and one attribute dict per group).
+    Files are read and decoded by a process pool and written by the main process, in the order of fileList.
     Inputs:
         fileType : string, i.e. interferograms, coherence, snaphu_connect_component, etc.
         fileList : list of path, ROI_PAC .unw/.cor/.int/.byt file
         hdf5File : string, file name/path of the multi-group hdf5 PySAR file
-        extra_meta_dict : dict, extra attribute dictionary 
+        extra_meta_dict : dict, extra attribute dictionary, and parallel_num - number of processes
+                          to read files, default is pysar.parallel_num
     Outputs:
         hdf5File : output hdf5 file name
         fileList : list of string, files newly added
@@ -220,14 +254,12 @@ def roipac2multi_group_hdf5(fileType, fileList, hdf5File='unwrapIfgram.h5', extr
     if fileList2 == fileList:
         # Create and open new hdf5 file with w mode
         print 'number of '+ext+' to add: '+str(len(fileList))
-        print 'open '+hdf5File+' with w mode'
-        h5file = h5py.File(hdf5File, 'w')
+        h5mode = 'w'
     elif fileList2:
         # Open existed hdf5 file with r+ mode
         print 'Continue by adding the following new epochs ...'
         print 'number of '+ext+' to add: '+str(len(fileList2))
-        print 'open '+hdf5File+' with r+ mode'
-        h5file = h5py.File(hdf5File, 'r+')
+        h5mode = 'r+'
         fileList = list(fileList2)
     else:
         print 'All input '+ext+' are included, no need to re-load.'
@@ -235,41 +267,46 @@ def roipac2multi_group_hdf5(fileType, fileList, hdf5File='unwrapIfgram.h5', extr
 
     # Loop - Writing ROI_PAC files into hdf5 file
     if fileList:
+        # Reading pool is created before opening HDF5 file, which is not fork-safe
+        parallel_num = extra_meta_dict.get('parallel_num', None) or pysar.parallel_num
+        num_cores = max(min(multiprocessing.cpu_count(), parallel_num, len(fileList)), 1)
+        # Number of files read ahead of writing, limited by memory
+        queue_size = int(pysar.max_memory*1024**3 / (8.*int(mode_width)*int(mode_length)))
+        queue_size = max(min(2*num_cores, queue_size), 1)
+        arg_list = [(file, extra_meta_dict) for file in fileList]
+        if num_cores > 1:
+            print 'reading files in parallel using %d cores ...' % (num_cores)
+            pool = multiprocessing.Pool(num_cores)
+        else:
+            pool = None
+
+        print 'open '+hdf5File+' with '+h5mode+' mode'
+        h5file = h5py.File(hdf5File, h5mode)
         # Unwraped Interferograms
         if not fileType in h5file.keys():
             gg = h5file.create_group(fileType)     # new hdf5 file
         else:
             gg = h5file[fileType]                  # existing hdf5 file
-        
-        for file in fileList:
-            # Read data and attributes
-            print 'Adding ' + file
-            data, atr = readfile.read(file)
-
-            if 'PROCESSOR' in atr.keys() and atr['PROCESSOR'] == 'roipac':
-                try:
-                    d1, d2 = atr['DATE12'].split('-')
-                    baseline_file = os.path.dirname(file)+'/'+d1+'_'+d2+'_baseline.rsc'
-                    baseline_rsc = readfile.read_roipac_rsc(baseline_file)
-                    atr.update(baseline_rsc)
-                except:
-                    print 'No *_baseline.rsc file found!'
-
-            # PySAR attributes
-            atr['drop_ifgram'] = 'no'
-            try:     atr['PROJECT_NAME'] = extra_meta_dict['project_name']
-            except:  atr['PROJECT_NAME'] = 'PYSAR'
 
+        # keep at most queue_size files read ahead
+        read_results = ut.bounded_imap(pool, read_roipac_file_star, arg_list, queue_size)
+        for i, (data, atr) in enumerate(read_results):
             # Write dataset
+            file = fileList[i]
+            print 'Adding ' + file
             group = gg.create_group(os.path.basename(file))
-            dset = group.create_dataset(os.path.basename(file), data=data, compression='gzip')
+            dset = group.create_dataset(os.path.basename(file), data=data, **writefile.storage_option(shape=data.shape))
 
             # Write attributes
             for key, value in atr.iteritems():
                 group.attrs[key] = str(value)
 
         # End of Loop
+        if pool:
+            pool.close()
+            pool.join()
         h5file.close()
+        readfile.clear_metadata_cache(hdf5File)
         print 'finished writing to '+hdf5File
 
     return hdf5File, fileList
@@ -300,7 +337,7 @@ def roipac_nonzero_mask(unwFileList, maskFile='mask.h5'):
         print 'writing >>> '+maskFile
         h5 = h5py.File(maskFile,'w')
         group = h5.create_group('mask')
-        dset = group.create_dataset('mask', data=mask, compression='gzip')
+        dset = group.create_dataset('mask', data=mask, **writefile.storage_option(shape=mask.shape))
         # Attribute - *.unw.rsc
         for key,value in rsc.iteritems():
             group.attrs[key] = value
@@ -336,7 +373,7 @@ def roipac2single_dataset_hdf5(file_type, infile, outfile, extra_meta_dict=dict(
     print 'writing >>> '+outfile
     h5 = h5py.File(outfile, 'w')
     group = h5.create_group(file_type)
-    dset = group.create_dataset(file_type, data=data, compression='gzip')
+    dset = group.create_dataset(file_type, data=data, **writefile.storage_option(shape=data.shape))
 
     # Write output file - attributes
     for key, value in atr.iteritems():
@@ -614,6 +651,8 @@ def cmdLineParse():
     parser.add_argument('--processor', dest='insar_processor',\
                         default='roipac', choices={'roipac','gamma','isce','doris','gmtsar'},\
                         help='InSAR processor/software of the file')
+    parser.add_argument('--parallel', dest='parallel_num', type=int, default=pysar.parallel_num,\
+                        help='number of processes to read files, default is pysar.parallel_num')
 
     singleFile = parser.add_argument_group('Load into single HDF5 file')
     singleFile.add_argument('-f','--file', nargs='*', help='file(s) to be loaded, processed by ROI_PAC, Gamma, DORIS or ISCE.')
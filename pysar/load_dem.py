@@ -3,6 +3,7 @@ import os
 import sys
 import h5py
 import pysar._readfile as readfile
+import pysar._writefile as writefile
 
 try:
     demFile = sys.argv[1]
@@ -37,7 +38,7 @@ print 'writing >>> '+outName
 h5=h5py.File(outName,'w')
 group=h5.create_group('dem')
 
-dset = group.create_dataset('dem', data=dem, compression='gzip')
+dset = group.create_dataset('dem', data=dem, **writefile.storage_option(shape=dem.shape))
 
 for key , value in demRsc.iteritems():
      group.attrs[key]=value
@@ -60,7 +60,7 @@ def correct_lod_file(File, outFile=None):
     # Correct LOD Ramp for Input File
     if k in multi_group_hdf5_file+multi_dataset_hdf5_file:
         h5 = h5py.File(File,'r')
-        epochList = sorted(h5[k].keys())
+        epochList = readfile.get_epoch_list(h5, k)
         
         h5out = h5py.File(outFile,'w')
         group = h5out.create_group(k)
@@ -71,7 +71,7 @@ def correct_lod_file(File, outFile=None):
             Ramp *= -4*np.pi/wvl
             for epoch in epochList:
                 print epoch
-                data = h5[k][epoch].get(epoch)[:]
+                data = readfile.read_hdf5_epoch(h5, k, epoch)
                 atr = h5[k][epoch].attrs
                 
                 dates = ptime.yyyymmdd(atr['DATE12'].split('-'))
@@ -80,7 +80,7 @@ def correct_lod_file(File, outFile=None):
                 data -= Ramp*dt
                  
                 gg = group.create_group(epoch)
-                dset = gg.create_dataset(epoch, data=data, compression='gzip')
+                dset = gg.create_dataset(epoch, data=data, **writefile.storage_option(shape=data.shape))
                 for key, value in atr.iteritems():
                     gg.attrs[key] = value
 
@@ -90,11 +90,11 @@ def correct_lod_file(File, outFile=None):
             for i in range(len(epochList)):
                 epoch = epochList[i]
                 print epoch
-                data = h5[k].get(epoch)[:]
+                data = readfile.read_hdf5_epoch(h5, k, epoch)
                 
                 data -= Ramp*tbase[i]
                 
-                dset = group.create_dataset(epoch, data=data, compression='gzip')
+                dset = group.create_dataset(epoch, data=data, **writefile.storage_option(shape=data.shape))
             for key, value in atr.iteritems():
                 group.attrs[key] = value
         else:
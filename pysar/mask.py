@@ -85,7 +85,7 @@ def mask_file(File, maskFile, outFile=None, inps_dict=None):
 
     if k in ['timeseries','interferograms','wrapped','coherence']:
         h5file = h5py.File(File,'r')
-        epochList = sorted(h5file[k].keys())
+        epochList = readfile.get_epoch_list(h5file, k)
 
         h5out = h5py.File(outFile,'w')
         print 'writing >>> '+outFile
@@ -96,11 +96,11 @@ def mask_file(File, maskFile, outFile=None, inps_dict=None):
         group = h5out.create_group(k)
         for d in epochList:
             print d
-            unw = h5file[k].get(d)[:]
+            unw = readfile.read_hdf5_epoch(h5file, k, d)
 
             unw = mask_matrix(unw,mask)
 
-            dset = group.create_dataset(d, data=unw, compression='gzip')
+            dset = group.create_dataset(d, data=unw, **writefile.storage_option(shape=unw.shape))
         for key,value in atr.iteritems():   group.attrs[key] = value
 
     elif k in ['interferograms','wrapped','coherence']:
@@ -110,7 +110,7 @@ def mask_file(File, maskFile, outFile=None, inps_dict=None):
         # Mask multi group file with multi group coherence file
         if km == 'coherence':
             h5mask = h5py.File(maskFile, 'r')
-            cohList = sorted(h5mask[km].keys())
+            cohList = readfile.get_epoch_list(h5mask, km)
             if len(cohList) != len(epochList):
                 sys.exit('ERROR: cohERROR: erence mask file has different\
                 number of interferograms than input file!')
@@ -118,19 +118,19 @@ def mask_file(File, maskFile, outFile=None, inps_dict=None):
         for i in range(len(epochList)):
             igram = epochList[i]
             print igram
-            unw = h5file[k][igram].get(igram)[:]
+            unw = readfile.read_hdf5_epoch(h5file, k, igram)
             
             if km == 'coherence':
                 coh = cohList[i]
                 print coh
-                mask = h5mask[km][coh].get(coh)[:]
+                mask = readfile.read_hdf5_epoch(h5mask, km, coh)
                 if not inps_dict:
                     mask = update_mask(mask, inps_dict)                
             
             unw = mask_matrix(unw,mask)
 
             group = gg.create_group(igram)
-            dset = group.create_dataset(igram, data=unw, compression='gzip')
+            dset = group.create_dataset(igram, data=unw, **writefile.storage_option(shape=unw.shape))
             for key, value in h5file[k][igram].attrs.iteritems():
                 group.attrs[key] = value
 
@@ -27,6 +27,7 @@ import pysar._datetime as ptime
 import pysar._network as pnet
 import pysar._pysar_utilities as ut
 import pysar._readfile as readfile
+import pysar._writefile as writefile
 import pysar.subset as subset
 from pysar._readfile import multi_group_hdf5_file, multi_dataset_hdf5_file, single_dataset_hdf5_file
 
@@ -51,10 +52,11 @@ def reset_pairs(File):
     print "set drop_ifgram to 'no' for all interferograms for file: "+File
     k = readfile.read_attribute(File)['FILE_TYPE']
     h5 = h5py.File(File,'r+')
-    ifgram_list = sorted(h5[k].keys())
+    ifgram_list = readfile.get_epoch_list(h5, k)
     for ifgram in ifgram_list:
         h5[k][ifgram].attrs['drop_ifgram'] = 'no'
     h5.close()
+    readfile.clear_metadata_cache(File)
     return File
 
 
@@ -125,13 +127,14 @@ def modify_file_date12_list(File, date12_to_rmv, mark_attribute=False, outFile=N
     if mark_attribute:
         print "set drop_ifgram to 'yes' for all interferograms to remove, and 'no' for all the others."
         h5 = h5py.File(File,'r+')
-        ifgram_list = sorted(h5[k].keys())
+        ifgram_list = readfile.get_epoch_list(h5, k)
         for ifgram in ifgram_list:
             if h5[k][ifgram].attrs['DATE12'] in date12_to_rmv:
                 h5[k][ifgram].attrs['drop_ifgram'] = 'yes'
             else:
                 h5[k][ifgram].attrs['drop_ifgram'] = 'no'
         h5.close()
+        readfile.clear_metadata_cache(File)
         outFile = File
 
     else:
@@ -150,7 +153,7 @@ def modify_file_date12_list(File, date12_to_rmv, mark_attribute=False, outFile=N
         gg = h5out.create_group(k)
 
         h5 = h5py.File(File, 'r')
-        igramList = sorted(h5[k].keys())
+        igramList = readfile.get_epoch_list(h5, k)
         date12_list = ptime.list_ifgram2date12(igramList)
         prog_bar = ptime.progress_bar(maxValue=date12Num, prefix='writing: ')
         for i in range(date12Num):
@@ -158,9 +161,9 @@ def modify_file_date12_list(File, date12_to_rmv, mark_attribute=False, outFile=N
             idx = date12_orig.index(date12)
             igram = igramList[idx]
     
-            data = h5[k][igram].get(igram)[:]
+            data = readfile.read_hdf5_epoch(h5, k, igram)
             group = gg.create_group(igram)
-            dset = group.create_dataset(igram, data=data, compression='gzip')
+            dset = group.create_dataset(igram, data=data, **writefile.storage_option(shape=data.shape))
             for key, value in h5[k][igram].attrs.iteritems():
                 group.attrs[key] = value
             prog_bar.update(i+1, suffix=date12_list[i])
@@ -558,7 +561,7 @@ def main(argv):
         # Get list of date12 of interferograms already been marked.
         k = readfile.read_attribute(inps.file[0])['FILE_TYPE']
         h5 = h5py.File(inps.file[0], 'r')
-        ifgram_list_all = sorted(h5[k].keys())
+        ifgram_list_all = readfile.get_epoch_list(h5, k)
         ifgram_list_keep = ut.check_drop_ifgram(h5, atr, ifgram_list_all, print_message=False)
         ifgram_list_dropped = sorted(list(set(ifgram_list_all) - set(ifgram_list_keep)))
         date12_list_dropped = ptime.list_ifgram2date12(ifgram_list_dropped)
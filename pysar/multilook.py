@@ -17,41 +17,76 @@ import os
 import argparse
 import warnings
 import re
+import multiprocessing
 
 import h5py
 import numpy as np
-#from joblib import Parallel, delayed
-#import multiprocessing
 
+import pysar
 import pysar._readfile as readfile
 import pysar._writefile as writefile
 import pysar._pysar_utilities as ut
 import pysar._datetime as ptime
+from pysar._readfile import multi_group_hdf5_file, multi_dataset_hdf5_file
 
 
 ######################################## Sub Functions ############################################
-def multilook_matrix(matrix,lks_y,lks_x):
-    rows,cols = matrix.shape
-    lks_x = int(lks_x)
+def multilook_matrix(matrix, lks_y, lks_x, method='mean', weight=None):
+    '''Multilook 2D matrix by averaging non-overlapping lks_y by lks_x blocks, ignoring NaN.
+    Blocks are formed by reshaping the matrix, so there is no loop over rows or columns. Edge
+    rows/columns that do not fill a whole block are dropped.
+    Inputs:
+        matrix - 2D np.array, real or complex
+        lks_y/x - int, number of looks in y/azimuth and x/range direction
+        method - string, mean  - average of values, coherent average for complex matrix
+                         phase - coherent average of wrapped phase in radian, angle(mean(exp(j*phase)))
+        weight - 2D np.array in the same size as matrix, i.e. coherence, for weighted average
+    Output:
+        matrix_mli - 2D np.array in the same data type as input, rounded for integer data type
+    Example:
+        data_mli = multilook_matrix(data, 10, 10)
+        pha_mli  = multilook_matrix(pha, 2, 2, method='phase', weight=coh)
+    '''
     lks_y = int(lks_y)
-    rows_mli=int(np.floor(rows/lks_y))
-    cols_mli=int(np.floor(cols/lks_x))
-    #thr = np.floor(lks_x*lks_y/2)
-    matrix_Cmli=np.zeros((rows,    cols_mli))
-    matrix_mli =np.zeros((rows_mli,cols_mli))
-
-    #for c in range(lks_x):   matrix_Cmli = matrix_Cmli + matrix[:,range(c,cols_mli*lks_x,lks_x)]
-    #for r in range(lks_y):   matrix_mli  = matrix_mli  + matrix_Cmli[  range(r,rows_mli*lks_y,lks_y),:]
-    #for c in range(int(cols_mli)):  matrix_Cmli[:,c]=np.nansum(matrix[:,(c)*lks_x:(c+1)*lks_x],1)
-    #for r in range(int(rows_mli)):  matrix_mli[r,:] =np.nansum(matrix_Cmli[(r)*lks_y:(r+1)*lks_y,:],0)
-    #matrix_mli=matrix_mli/(lks_y*lks_x)
-
-    with warnings.catch_warnings():
-        warnings.simplefilter("ignore", category=RuntimeWarning)
-        for c in range(cols_mli):  matrix_Cmli[:,c] = np.nanmean(matrix[:,(c)*lks_x:(c+1)*lks_x],1)
-        for r in range(rows_mli):  matrix_mli[r,:]  = np.nanmean(matrix_Cmli[(r)*lks_y:(r+1)*lks_y,:],0)
-  
-    return matrix_mli
+    lks_x = int(lks_x)
+    rows_mli = int(matrix.shape[0] / lks_y)
+    cols_mli = int(matrix.shape[1] / lks_x)
+    dtype = matrix.dtype
+    box_shape = (rows_mli, lks_y, cols_mli, lks_x)
+
+    data = matrix[:rows_mli*lks_y, :cols_mli*lks_x]
+    if method == 'phase':
+        data = np.exp(1j*data.astype(np.float32))
+    elif method != 'mean':
+        raise ValueError('Un-recognized multilook method: '+str(method))
+    elif not np.issubdtype(dtype, np.floating) and not np.issubdtype(dtype, np.complexfloating):
+        data = data.astype(np.float32)
+    data = data.reshape(box_shape)
+
+    # Sum and number/weight of valid pixels in each block
+    valid = ~np.isnan(data)
+    if weight is None and valid.all():
+        data_sum = data.sum(axis=3).sum(axis=1)
+        weight_sum = np.ones(data_sum.shape, np.float32) * (lks_y*lks_x)
+    elif weight is None:
+        data_sum = np.where(valid, data, 0).sum(axis=3).sum(axis=1)
+        weight_sum = valid.sum(axis=3).sum(axis=1)
+    else:
+        weight = np.array(weight[:rows_mli*lks_y, :cols_mli*lks_x], np.float32).reshape(box_shape)
+        valid &= ~np.isnan(weight)
+        weight = np.where(valid, weight, 0)
+        data_sum = (np.where(valid, data, 0) * weight).sum(axis=3).sum(axis=1)
+        weight_sum = weight.sum(axis=3).sum(axis=1)
+    del valid
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        matrix_mli = data_sum / weight_sum
+    matrix_mli[weight_sum == 0] = np.nan
+    if method == 'phase':
+        matrix_mli = np.angle(matrix_mli)
+    if np.issubdtype(dtype, np.integer) or dtype == np.bool_:
+        matrix_mli = np.rint(np.nan_to_num(matrix_mli))
+    return matrix_mli.astype(dtype)
 
 
 def multilook_attribute(atr_dict,lks_y,lks_x, print_message=True):
@@ -109,7 +144,86 @@ def multilook_attribute(atr_dict,lks_y,lks_x, print_message=True):
     return atr
 
 
-def multilook_file(infile,lks_y,lks_x,outfile=None):
+def read_weight(weight_file, weight_epoch=None):
+    '''Read weight for multilooking, of weight_epoch for multi-epoch weight file, i.e. coherence'''
+    if not weight_file:
+        return None
+    k = readfile.read_attribute(weight_file)['FILE_TYPE']
+    if k in multi_group_hdf5_file+multi_dataset_hdf5_file:
+        h5 = h5py.File(weight_file, 'r')
+        weight = readfile.read_hdf5_epoch(h5, k, weight_epoch)
+        h5.close()
+        return weight
+    return readfile.read(weight_file)[0]
+
+
+def match_weight_epoch(epoch_list, k, weight_file):
+    '''Get epoch of weight file for each epoch of multi-epoch file, matched by DATE12 for interferograms
+    and by date for timeseries; None for single-dataset weight file.
+    Inputs:
+        epoch_list  - list of string, epochs of input file
+        k           - string, file type of input file
+        weight_file - string, path of weight file, i.e. coherence.h5
+    Output:
+        weight_epoch_list - list of string, epoch in weight file for each input epoch
+    '''
+    if not weight_file:
+        return [None]*len(epoch_list)
+    k_weight = readfile.read_attribute(weight_file)['FILE_TYPE']
+    if k_weight not in multi_group_hdf5_file+multi_dataset_hdf5_file:
+        return [None]*len(epoch_list)
+
+    h5 = h5py.File(weight_file, 'r')
+    weight_list_all = readfile.get_epoch_list(h5, k_weight)
+    h5.close()
+    if k in multi_group_hdf5_file and k_weight in multi_group_hdf5_file:
+        key_list = ptime.list_ifgram2date12(epoch_list)
+        weight_key_list = ptime.list_ifgram2date12(weight_list_all)
+    else:
+        key_list = list(epoch_list)
+        weight_key_list = list(weight_list_all)
+    try:
+        weight_epoch_list = [weight_list_all[weight_key_list.index(i)] for i in key_list]
+    except ValueError:
+        raise ValueError('Not all epochs of '+k+' file have weight in file: '+weight_file)
+    return weight_epoch_list
+
+
+def multilook_epoch(infile, k, epoch, lks_y, lks_x, method='mean', weight_file=None, weight_epoch=None):
+    '''Read and multilook one epoch of multi-epoch file, weighted by weight_epoch of weight_file.
+    Each call opens input files by itself, so that it can run in a worker process.
+    '''
+    h5 = h5py.File(infile, 'r')
+    data = readfile.read_hdf5_epoch(h5, k, epoch)
+    h5.close()
+    return multilook_matrix(data, lks_y, lks_x, method, read_weight(weight_file, weight_epoch))
+
+
+def multilook_epoch_star(args):
+    '''Unpack arguments of multilook_epoch(), for multiprocessing.Pool.apply_async()'''
+    return multilook_epoch(*args)
+
+
+def multilook_file_star(args):
+    '''Unpack arguments of multilook_file(), for multiprocessing.Pool.map()'''
+    return multilook_file(*args)
+
+
+def multilook_file(infile, lks_y, lks_x, outfile=None, method=None, weight_file=None, parallel_num=1):
+    '''Multilook one file, epoch by epoch for multi-epoch file.
+    Inputs:
+        infile  - string, path of file to multilook
+        lks_y/x - int, number of looks in y/azimuth and x/range direction
+        outfile - string, path of output file
+        method  - string, mean or phase, see multilook_matrix(). Default is phase for wrapped
+                  interferograms and mean for the others.
+        weight_file  - string, path of weight file for weighted average, i.e. coherence. Multi-epoch
+                       weight file is matched with input file by DATE12 for interferograms, by date
+                       for timeseries.
+        parallel_num - int, number of processes to multilook epochs of multi-epoch file
+    Output:
+        outfile - string, path of output file
+    '''
     lks_y = int(lks_y)
     lks_x = int(lks_x)
 
@@ -119,6 +233,12 @@ def multilook_file(infile,lks_y,lks_x,outfile=None):
     print 'multilooking '+k+' file '+infile
     print 'number of looks in y / azimuth direction: %d' % lks_y
     print 'number of looks in x / range   direction: %d' % lks_x
+    if not method:
+        if k in ['wrapped','.int']:  method = 'phase'
+        else:                        method = 'mean'
+    print 'multilook method: '+method
+    if weight_file:
+        print 'weighted by: '+weight_file
 
     ## output file name
     if not outfile:
@@ -131,50 +251,54 @@ def multilook_file(infile,lks_y,lks_x,outfile=None):
 
     ###############################################################################
     ## Read/Write multi-dataset files
-    if k in ['interferograms','coherence','wrapped','timeseries']:
+    if k in multi_group_hdf5_file+multi_dataset_hdf5_file:
         h5 = h5py.File(infile,'r')
-        epochList = sorted(h5[k].keys())
+        epochList = readfile.get_epoch_list(h5, k)
         epoch_num = len(epochList)
-        prog_bar = ptime.progress_bar(maxValue=epoch_num)
+        if readfile.is_cube_hdf5(h5, k):  layout = 'cube'
+        else:  layout = 'split'
+        atr_mli = multilook_attribute(atr, lks_y, lks_x)
+        length = int(atr_mli['FILE_LENGTH'])
+        width = int(atr_mli['WIDTH'])
+        if k in multi_group_hdf5_file:
+            print 'number of interferograms: '+str(epoch_num)
+            atr_list = [multilook_attribute(h5[k][epoch].attrs, lks_y, lks_x, print_message=False)\
+                        for epoch in epochList]
+            suffix_list = ptime.list_ifgram2date12(epochList)
+        else:
+            print 'number of acquisitions: '+str(epoch_num)
+            atr_list = None
+            suffix_list = epochList
+        dtype = readfile.read_hdf5_epoch(h5, k, epochList[0], box=(0,0,1,1)).dtype
+        h5.close()
+
+        # Epochs are multilooked in worker processes and written in the main process
+        # pool is created before opening output HDF5 file, which is not fork-safe
+        num_cores = max(min(multiprocessing.cpu_count(), parallel_num, epoch_num), 1)
+        weight_epoch_list = match_weight_epoch(epochList, k, weight_file)
+        arg_list = [(infile, k, epochList[i], lks_y, lks_x, method, weight_file, weight_epoch_list[i])\
+                    for i in range(epoch_num)]
+        if num_cores > 1:
+            print 'parallel processing using %d cores ...' % (num_cores)
+            pool = multiprocessing.Pool(num_cores)
+        else:
+            pool = None
 
         h5out = h5py.File(outfile,'w')
-        group = h5out.create_group(k)
-
-        if k in ['interferograms','coherence','wrapped']:
-            date12_list = ptime.list_ifgram2date12(epochList)
-            print 'number of interferograms: '+str(len(epochList))
-            for i in range(epoch_num):
-                epoch = epochList[i]
-                data = h5[k][epoch].get(epoch)[:]
-                atr = h5[k][epoch].attrs
-
-                data_mli = multilook_matrix(data,lks_y,lks_x)
-                atr_mli = multilook_attribute(atr,lks_y,lks_x,print_message=False)
-
-                gg = group.create_group(epoch)
-                dset = gg.create_dataset(epoch, data=data_mli, compression='gzip')
-                for key, value in atr_mli.iteritems():
-                    gg.attrs[key] = value
-                prog_bar.update(i+1, suffix=date12_list[i])
-
-        elif k == 'timeseries':
-            print 'number of acquisitions: '+str(len(epochList))
-            for i in range(epoch_num):
-                epoch = epochList[i]
-                data = h5[k].get(epoch)[:]
-
-                data_mli = multilook_matrix(data,lks_y,lks_x)
-                
-                dset = group.create_dataset(epoch, data=data_mli, compression='gzip')
-                prog_bar.update(i+1, suffix=epoch)
-            atr = h5[k].attrs
-            atr_mli = multilook_attribute(atr,lks_y,lks_x)
-            for key, value in atr_mli.iteritems():
-                group.attrs[key] = value
+        writefile.create_hdf5_stack(h5out, k, epochList, length, width, atr_mli, atr_list=atr_list,\
+                                    layout=layout, dtype=dtype)
 
-        h5.close()
-        h5out.close()
+        prog_bar = ptime.progress_bar(maxValue=epoch_num)
+        # keep at most 2*num_cores epochs multilooked ahead of writing
+        epoch_results = ut.bounded_imap(pool, multilook_epoch_star, arg_list, 2*num_cores)
+        for i, data_mli in enumerate(epoch_results):
+            writefile.write_hdf5_block(h5out, k, data_mli.reshape(1, length, width), epoch_list=[epochList[i]])
+            prog_bar.update(i+1, suffix=suffix_list[i])
         prog_bar.close()
+        if pool:
+            pool.close()
+            pool.join()
+        h5out.close()
 
     ## Read/Write single-dataset files
     elif k == '.trans':        
@@ -185,7 +309,7 @@ def multilook_file(infile,lks_y,lks_x,outfile=None):
         writefile.write(rgmli,azmli,atr,outfile)
     else:
         data,atr = readfile.read(infile)
-        data_mli = multilook_matrix(data,lks_y,lks_x)
+        data_mli = multilook_matrix(data, lks_y, lks_x, method, read_weight(weight_file))
         atr = multilook_attribute(atr,lks_y,lks_x)
         writefile.write(data_mli,atr,outfile)
 
@@ -196,6 +320,10 @@ def multilook_file(infile,lks_y,lks_x,outfile=None):
 EXAMPLE='''example:
   multilook.py  velocity.h5  15 15
   multilook.py  srtm30m.dem  10 10  -o srtm30m_300m.dem
+  multilook.py  unwrapIfgram.h5  4 4  --weight coherence.h5  --parallel-epoch 8
+  multilook.py  wrapIfgram.h5    4 4  --method phase
+  multilook.py  timeseries*.h5   4 4
+  multilook.py  timeseries*.h5   4 4  --no-parallel  --parallel-epoch 4
 '''
 
 def cmdLineParse():
@@ -207,8 +335,18 @@ def cmdLineParse():
     parser.add_argument('lks_x', type=int, help='number of multilooking in azimuth/y direction')
     parser.add_argument('lks_y', type=int, help='number of multilooking in range  /x direction')
     parser.add_argument('-o','--outfile', help='Output file name. Disabled when more than 1 input files')
+    parser.add_argument('-m','--method', choices=['mean','phase'],\
+                        help='multilook method, default: phase for wrapped interferograms, mean for the others.\n'
+                             'mean  - average, coherent average for complex data\n'
+                             'phase - coherent average of wrapped phase in radian')
+    parser.add_argument('-w','--weight', dest='weight_file',\
+                        help='weight file for weighted average, i.e. coherence.h5 for interferograms')
+    parser.add_argument('--parallel-epoch', dest='parallel_num', type=int, default=1,\
+                        help='number of processes to multilook epochs of multi-epoch file, default: 1.\n'
+                             'Used for 1 input file, or with --no-parallel for more than 1 input files.')
     parser.add_argument('--no-parallel',dest='parallel',action='store_false',default=True,\
-                        help='Disable parallel processing. Diabled auto for 1 input file.')
+                        help='Disable parallel processing of files. Diabled auto for 1 input file.\n'
+                             'Files are multilooked with pysar.parallel_num processes by default.')
 
     inps = parser.parse_args()
     return inps
@@ -221,22 +359,27 @@ def main(argv):
     #print '\n**************** Multilook *********************'
     inps.file = ut.get_file_list(inps.file)
 
-    # check outfile and parallel option
-    if inps.parallel:
-        num_cores, inps.parallel, Parallel, delayed = ut.check_parallel(len(inps.file))
+    # check parallel option: files are multilooked in worker processes, epochs of each file in serial
+    num_cores = max(min(multiprocessing.cpu_count(), pysar.parallel_num, len(inps.file)), 1)
+    if num_cores <= 1:
+        inps.parallel = False
 
     # multilooking
     if len(inps.file) == 1:
-        multilook_file(inps.file[0], inps.lks_y, inps.lks_x, inps.outfile)
+        multilook_file(inps.file[0], inps.lks_y, inps.lks_x, inps.outfile, inps.method, inps.weight_file,\
+                       inps.parallel_num)
 
     elif inps.parallel:
-        #num_cores = min(multiprocessing.cpu_count(), len(inps.file))
-        #print 'parallel processing using %d cores ...'%(num_cores)
-        Parallel(n_jobs=num_cores)(delayed(multilook_file)(file, inps.lks_y, inps.lks_x) for file in inps.file)
+        print 'parallel processing of files using %d cores ...' % (num_cores)
+        arg_list = [(File, inps.lks_y, inps.lks_x, None, inps.method, inps.weight_file) for File in inps.file]
+        pool = multiprocessing.Pool(num_cores)
+        pool.map(multilook_file_star, arg_list)
+        pool.close()
+        pool.join()
     else:
         for File in inps.file:
             print '-------------------------------------------'
-            multilook_file(File, inps.lks_y, inps.lks_x)
+            multilook_file(File, inps.lks_y, inps.lks_x, None, inps.method, inps.weight_file, inps.parallel_num)
 
     print 'Done.'
     return
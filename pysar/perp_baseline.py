@@ -59,7 +59,7 @@ def main(argv):
     length = int(atr['FILE_LENGTH'])
     
     h5 = h5py.File(File, 'r')
-    epochList = sorted(h5[k].keys())
+    epochList = readfile.get_epoch_list(h5, k)
     epoch = ptime.yyyymmdd(epoch)
     epoch_idx = epochList.index(epoch)
     
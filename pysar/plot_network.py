@@ -131,7 +131,7 @@ def main(argv):
     date12_list_drop = []
     if ext in ['.h5','.he5']:
         h5 = h5py.File(inps.file, 'r')
-        ifgram_list_all = sorted(h5[k].keys())
+        ifgram_list_all = readfile.get_epoch_list(h5, k)
         ifgram_list_keep = ut.check_drop_ifgram(h5, atr, ifgram_list_all)
         date12_list_keep = ptime.list_ifgram2date12(ifgram_list_keep)
         # Get date12_list_drop
@@ -243,6 +243,9 @@ pysar.corFiles           = auto  #[filt*.cor]
 pysar.transFile          = auto  #[geomap*.trans / sim*.UTM_TO_RDC]
 pysar.demFile.radarCoord = auto  #[radar*.hgt]
 pysar.demFile.geoCoord   = auto  #[*.dem]
+pysar.hdf5.compression   = auto  #[none / lzf / gzip / gzip1-9], auto for gzip, compression of output HDF5 files
+pysar.hdf5.shuffle       = auto  #[yes / no], auto for no, shuffle filter before HDF5 compression
+pysar.hdf5.chunks        = auto  #[16,128,128 / auto], auto for 16,128,128, chunk shape in [epoch, y, x] of HDF5 datasets
 
 
 ## 1.1 Subset (optional, --subset to exit after this step)
@@ -529,6 +532,13 @@ def main(argv):
     try:    inps.trop_file = ut.get_file_list(inps.trop_model+'.h5', abspath=True)[0]
     except: inps.trop_file = None
 
+    # HDF5 compression and chunking of output files, passed to all sub-commands by environment variable
+    for key, env_key in [('pysar.hdf5.compression', 'PYSAR_HDF5_COMPRESSION'),\
+                         ('pysar.hdf5.shuffle',     'PYSAR_HDF5_SHUFFLE'),\
+                         ('pysar.hdf5.chunks',      'PYSAR_HDF5_CHUNKS')]:
+        if key in template.keys() and template[key] != 'auto':
+            os.environ[env_key] = template[key]
+
 
     #########################################
     # Loading Data
@@ -667,7 +677,7 @@ def main(argv):
     #########################################
     atr = readfile.read_attribute(inps.ifgram_file)
     h5 = h5py.File(inps.ifgram_file, 'r')
-    ifgram_list_all = h5[atr['FILE_TYPE']].keys()
+    ifgram_list_all = readfile.get_epoch_list(h5, atr['FILE_TYPE'])
     ifgram_list_keep = ut.check_drop_ifgram(h5, atr, ifgram_list_all)
     h5.close()
     ifgram_num_drop = len(ifgram_list_all) - len(ifgram_list_keep)
@@ -740,7 +750,10 @@ def main(argv):
     ########################################
     print '\n**********  Network Inversion to Time Series  ********************'
     inps.timeseries_file = 'timeseries.h5'
-    invertCmd = 'igram_inversion.py '+inps.ifgram_file
+    inps.temp_coh_file = 'temporalCoherence.h5'
+    # temporal coherence is calculated in the same pass as the inversion
+    invertCmd = 'igram_inversion.py -f '+inps.ifgram_file+' -o '+inps.timeseries_file+\
+                ' --temp-coh '+inps.temp_coh_file+' --residual residualIfgram.txt'
     print invertCmd
     if ut.update_file(inps.timeseries_file, inps.ifgram_file):
         os.system(invertCmd)
@@ -771,7 +784,6 @@ def main(argv):
     #   of timeseries with the interferograms
     ##############################################
     print '\n********** Temporal Coherence file  *********'
-    inps.temp_coh_file = 'temporalCoherence.h5'
     tempCohCmd = 'temporal_coherence.py '+inps.ifgram_file+' '+inps.timeseries_file+' '+inps.temp_coh_file
     print tempCohCmd
     if ut.update_file(inps.temp_coh_file, inps.timeseries_file):
@@ -1045,9 +1057,6 @@ def main(argv):
             inps.geo_vel_file        = inps.vel_file
             inps.geo_temp_coh_file   = inps.temp_coh_file
             inps.geo_timeseries_file = inps.timeseries_file
-        elif not ut.which('geocode.pl'):
-            print 'Can not find executable geocode.pl from ROI_PAC, skip geocoding.'
-            template[key] = 'no'
 
     # Geocoding
     if template[key] in ['yes','auto']: 
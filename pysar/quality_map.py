@@ -14,6 +14,9 @@ import matplotlib.pyplot as plt
 #from scipy.sparse.csgraph import laplacian
 from scipy.ndimage.filters import laplace
 
+import pysar._readfile as readfile
+import pysar._writefile as writefile
+
 
 ##############################################################################
 def usage():
@@ -40,7 +43,7 @@ def main(argv):
   
     h5file=h5py.File(file,'r')
     kh5=h5file.keys()
-    ifgramList=h5file['interferograms'].keys()
+    ifgramList=readfile.get_epoch_list(h5file, 'interferograms')
   
     try:    OutName=argv[1]
     except: OutName='Laplacian.h5'
@@ -50,22 +53,22 @@ def main(argv):
     print 'Calculating the Discrete Laplacian Transform'   
     for ifgram in  ifgramList:
         print ifgram
-        dset=h5file['interferograms'][ifgram].get(ifgram)
+        dset=readfile.read_hdf5_epoch(h5file, 'interferograms', ifgram)
         unw=dset[0:dset.shape[0],0:dset.shape[1]]
         Lunw=laplace(unw)
         g=group.create_group(ifgram)
-        g.create_dataset(ifgram,data=Lunw,compression='gzip')
+        g.create_dataset(ifgram,data=Lunw,**writefile.storage_option(shape=Lunw.shape))
         for key, value in h5file['interferograms'][ifgram].attrs.iteritems():
             g.attrs[key] = value
   
     gm = h5laplace.create_group('mask')
     mask = h5file['mask'].get('mask')
-    dset = gm.create_dataset('mask', data=mask, compression='gzip')
+    dset = gm.create_dataset('mask', data=mask, **writefile.storage_option(shape=mask.shape))
   
     try:
         meanCoherence = h5file['meanCoherence'].get('meanCoherence')
         gc = h5laplace.create_group('meanCoherence')
-        dset = gc.create_dataset('meanCoherence', data=meanCoherence, compression='gzip')
+        dset = gc.create_dataset('meanCoherence', data=meanCoherence, **writefile.storage_option(shape=meanCoherence.shape))
     except:
         print ''   
   
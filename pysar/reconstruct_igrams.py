@@ -15,6 +15,8 @@ from numpy import shape,zeros,ones,hstack,dot,float32,reshape
 import h5py
 
 import pysar._pysar_utilities as ut
+import pysar._readfile as readfile
+import pysar._writefile as writefile
 
 
 #####################################################################################
@@ -22,17 +24,17 @@ def reconstruct_igrams_from_timeseries(tsFile, igramFile):
     h5igrams     = h5py.File(igramFile,'r')
     h5timeseries = h5py.File(tsFile,'r')
     
-    dateList = h5timeseries['timeseries'].keys()
+    dateList = readfile.get_epoch_list(h5timeseries, 'timeseries')
   
     dateIndex={}
     for ni in range(len(dateList)):
         dateIndex[dateList[ni]]=ni
   
-    dset = h5timeseries['timeseries'].get(h5timeseries['timeseries'].keys()[0])
+    dset = readfile.read_hdf5_epoch(h5timeseries, 'timeseries', dateList[0])
     nrows,ncols=shape(dset)
-    timeseries = zeros((len(h5timeseries['timeseries'].keys()),shape(dset)[0]*shape(dset)[1]),float32)
+    timeseries = zeros((len(dateList),shape(dset)[0]*shape(dset)[1]),float32)
     for date in dateList:
-        dset = h5timeseries['timeseries'].get(date)
+        dset = readfile.read_hdf5_epoch(h5timeseries, 'timeseries', date)
         d = dset[0:dset.shape[0],0:dset.shape[1]]
         timeseries[dateIndex[date]][:]=d.flatten(0)
     del d
@@ -91,13 +93,13 @@ def main(argv):
     
     h5igrams = h5py.File(igramFile,'r')
     h5estIgram = h5py.File(outName,'w')
-    igramList=h5igrams['interferograms'].keys()
+    igramList=readfile.get_epoch_list(h5igrams, 'interferograms')
     gg = h5estIgram.create_group('interferograms')
     for i in range(len(igramList)):
         print igramList[i]
         data=reshape(estData[i,:],(nrows,ncols))
         group = gg.create_group(igramList[i])
-        dset = group.create_dataset(igramList[i], data=data, compression='gzip')
+        dset = group.create_dataset(igramList[i], data=data, **writefile.storage_option(shape=data.shape))
         for key, value in h5igrams['interferograms'][igramList[i]].attrs.iteritems():
             group.attrs[key] = value     
     
@@ -15,6 +15,7 @@ import matplotlib as mpl; mpl.use('Agg')
 import matplotlib.pyplot as plt
 
 import pysar._readfile as readfile
+import pysar._writefile as writefile
 import pysar._datetime as ptime
 import pysar._network as pnet
 import pysar._pysar_utilities as ut
@@ -72,7 +73,7 @@ def ref_date_file(inFile, ref_date, outFile=None):
 
     # Input reference date
     h5 = h5py.File(inFile, 'r')
-    date_list = sorted(h5[k].keys())
+    date_list = readfile.get_epoch_list(h5, k)
     date_num = len(date_list)
 
     ref_date = ptime.yyyymmdd(ref_date)
@@ -82,7 +83,7 @@ def ref_date_file(inFile, ref_date, outFile=None):
         return None
 
     # Referencing in time
-    ref_data = h5[k].get(ref_date)[:]
+    ref_data = readfile.read_hdf5_epoch(h5, k, ref_date)
 
     print 'writing >>> '+outFile
     h5out = h5py.File(outFile,'w')
@@ -90,8 +91,8 @@ def ref_date_file(inFile, ref_date, outFile=None):
     prog_bar = ptime.progress_bar(maxValue=date_num)
     for i in range(date_num):
         date = date_list[i]
-        data = h5[k].get(date)[:]
-        dset = group.create_dataset(date, data=data-ref_data, compression='gzip')
+        data = readfile.read_hdf5_epoch(h5, k, date)
+        dset = group.create_dataset(date, data=data-ref_data, **writefile.storage_option(shape=data.shape))
         prog_bar.update(i+1, suffix=date)
     prog_bar.close()
     h5.close()
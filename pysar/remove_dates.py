@@ -12,6 +12,9 @@
 import h5py
 import sys
 
+import pysar._readfile as readfile
+import pysar._writefile as writefile
+
 
 def usage():
     print '''
@@ -38,14 +41,14 @@ def main(argv):
     if not 'timeseries' in k:
         sys.exit(1)
   
-    dateList = h5file['timeseries'].keys()
+    dateList = readfile.get_epoch_list(h5file, 'timeseries')
     
     h5modified=h5py.File('modified_'+tsFile,'w')
     group=h5modified.create_group('timeseries')
     for d in dateList:
         if not d in dates2rmv:
-            dataSet=h5file['timeseries'].get(d)
-            dset = group.create_dataset(d, data=dataSet, compression='gzip')
+            dataSet=readfile.read_hdf5_epoch(h5file, 'timeseries', d)
+            dset = group.create_dataset(d, data=dataSet, **writefile.storage_option(shape=dataSet.shape))
         else:
             print 'removing '+ d
   
@@ -55,7 +58,7 @@ def main(argv):
     try:
         dataSet=h5file['mask'].get('mask')
         group=h5modified.create_group('mask')
-        dset = group.create_dataset('mask', data=dataSet, compression='gzip')
+        dset = group.create_dataset('mask', data=dataSet, **writefile.storage_option(shape=dataSet.shape))
     except:
         print 'mask not found!'
 
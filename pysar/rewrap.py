@@ -12,6 +12,9 @@ import sys
 import h5py
 from numpy import pi,round
 
+import pysar._readfile as readfile
+import pysar._writefile as writefile
+
 
 def usage():
     print '''
@@ -39,21 +42,21 @@ def main(argv):
     except:  OutName='rewrapped_'+file
     h5file_rewarap=h5py.File(OutName,'w')
     gg = h5file_rewarap.create_group('interferograms')
-    ifgramList = h5file['interferograms'].keys()
+    ifgramList = readfile.get_epoch_list(h5file, 'interferograms')
     for ifgram in ifgramList:
         print ifgram
-        unwset=h5file['interferograms'][ifgram].get(ifgram)
+        unwset=readfile.read_hdf5_epoch(h5file, 'interferograms', ifgram)
         unw=unwset[0:unwset.shape[0],0:unwset.shape[1]]
         rewrapped=rewrap(unw)
         group = gg.create_group(ifgram)
-        dset = group.create_dataset(ifgram, data=rewrapped, compression='gzip')
+        dset = group.create_dataset(ifgram, data=rewrapped, **writefile.storage_option(shape=rewrapped.shape))
         for key, value in h5file['interferograms'][ifgram].attrs.iteritems():
             group.attrs[key] = value
  
     try:
         gm = h5file_rewarap.create_group('mask')
         mask = h5file['mask'].get('mask')
-        dset = gm.create_dataset('mask', data=mask, compression='gzip')
+        dset = gm.create_dataset('mask', data=mask, **writefile.storage_option(shape=mask.shape))
     except:
         print 'mask not found'
 
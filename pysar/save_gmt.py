@@ -66,20 +66,17 @@ def main(argv):
         if 'interferograms' in k: k[0] = 'interferograms'
         elif 'coherence'    in k: k[0] = 'coherence'
         elif 'timeseries'   in k: k[0] = 'timeseries'
-        if k[0] in ('interferograms','coherence','wrapped'):
-            atr  = h5[k[0]][h5[k[0]].keys()[0]].attrs
-        elif k[0] in ('dem','velocity','mask','temporal_coherence','rmse','timeseries'):
-            atr  = h5[k[0]].attrs
+        atr = readfile.read_attribute(file)
    
         if 'timeseries' in k:
             try:
                 d=sys.argv[2]
             except:
                 print 'No input date... continue to convert the last date of timeseries'
-                dateList=h5['timeseries'].keys()
+                dateList=readfile.get_epoch_list(h5, 'timeseries')
                 d=dateList[-1]
             print 'reading '+d + ' ... '
-            dset=h5['timeseries'].get(d)
+            dset=readfile.read_hdf5_epoch(h5, 'timeseries', d)
    
         elif k[0] in ['interferograms','coherence','wrapped']:
            print 'interferograms is not supported currently.'; sys.exit(1)
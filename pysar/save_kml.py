@@ -139,7 +139,7 @@ def main(argv):
         outName=File.split('.')[0]
 
         if k in ('interferograms','wrapped','coherence'):
-            ifgramList=h5file[k].keys()
+            ifgramList=readfile.get_epoch_list(h5file, k)
             for i in range(len(ifgramList)):
                 if epoch_date in ifgramList[i]:
                     epoch_number = i
@@ -147,7 +147,7 @@ def main(argv):
             outName = ifgramList[epoch_number]
             #outName=epoch_date
 
-            dset = h5file[k][ifgramList[epoch_number]].get(ifgramList[epoch_number])
+            dset = readfile.read_hdf5_epoch(h5file, k, ifgramList[epoch_number])
             data = dset[0:dset.shape[0],0:dset.shape[1]]
 
             if k == 'wrapped':
@@ -157,7 +157,7 @@ def main(argv):
                 Vmax = np.pi
 
         elif 'timeseries' in k:
-            epochList=h5file['timeseries'].keys()
+            epochList=readfile.get_epoch_list(h5file, 'timeseries')
             for i in range(len(epochList)):
                 if epoch_date in epochList[i]:
                     epoch_number = i
@@ -169,7 +169,7 @@ def main(argv):
             if len(epoch_date)==8:  outName=ref_date[2:]+'-'+epoch_date[2:]
             else:                   outName=ref_date[2:]+'-'+epoch_date
 
-            dset = h5file['timeseries'].get(epochList[epoch_number])
+            dset = readfile.read_hdf5_epoch(h5file, 'timeseries', epochList[epoch_number])
             data = dset[0:dset.shape[0],0:dset.shape[1]]
 
         ### one dataset format: velocity, mask, temporal_coherence, rmse, std, etc.
@@ -67,11 +67,11 @@ def main(argv):
         writefile.write(data,atr,outname)
   
     elif k == 'timeseries':
-        dateList=h5file['timeseries'].keys() 
+        dateList=readfile.get_epoch_list(h5file, 'timeseries') 
         ## Input
         if   len(sys.argv)==2:
             print 'No input date specified >>> continue with the last date'
-            dateList=h5file['timeseries'].keys()
+            dateList=readfile.get_epoch_list(h5file, 'timeseries')
             d=dateList[-1]
         elif len(sys.argv)==3:
             d=sys.argv[2]
@@ -86,10 +86,10 @@ def main(argv):
     
         ## Data
         print 'reading '+d+' ... '
-        data = h5file['timeseries'].get(d)[:]
+        data = readfile.read_hdf5_epoch(h5file, 'timeseries', d)
         try:
             print 'reading '+d_ref+' ... '
-            data_ref = h5file['timeseries'].get(d_ref)[:]
+            data_ref = readfile.read_hdf5_epoch(h5file, 'timeseries', d_ref)
             data = data - data_ref
         except: pass
         wvl=float(atr['WAVELENGTH'])
@@ -117,7 +117,7 @@ def main(argv):
 
     elif k in ['interferograms','coherence','wrapped']:
         ## Check input
-        igramList=h5file[k].keys()
+        igramList=readfile.get_epoch_list(h5file, k)
         try:
             d = sys.argv[2]
             for i in range(len(igramList)):
@@ -127,7 +127,7 @@ def main(argv):
             igram = igramList[-1];   print 'No input date specified >>> continue with the last date'
         ## Read and Write
         print 'reading '+igram+' ... '
-        data = h5file[k][igram].get(igram)[:]
+        data = readfile.read_hdf5_epoch(h5file, k, igram)
         atr = h5file[k][igram].attrs
         outname = igram
         
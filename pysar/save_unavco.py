@@ -16,6 +16,7 @@ import h5py
 import numpy as np
 
 import pysar._readfile as readfile
+import pysar._writefile as writefile
 import pysar.info as info
 
 
@@ -120,7 +121,7 @@ def get_unavco_filename(timeseriesFile):
     pysar_meta_dict = readfile.read_attribute(timeseriesFile)
     k = pysar_meta_dict['FILE_TYPE']
     h5_timeseries = h5py.File(timeseriesFile,'r')
-    dateList = sorted(h5_timeseries[k].keys())
+    dateList = readfile.get_epoch_list(h5_timeseries, k)
     unavco_meta_dict = metadata_pysar2unavco(pysar_meta_dict, dateList)
     h5_timeseries.close()
 
@@ -174,7 +175,7 @@ def main(argv):
     pysar_meta_dict = readfile.read_attribute(inps.timeseries)
     k = pysar_meta_dict['FILE_TYPE']
     h5_timeseries = h5py.File(inps.timeseries,'r')
-    dateList = sorted(h5_timeseries[k].keys())
+    dateList = readfile.get_epoch_list(h5_timeseries, k)
     unavco_meta_dict = metadata_pysar2unavco(pysar_meta_dict, dateList)
     print '## UNAVCO Metadata:'
     print '-----------------------------------------'
@@ -214,8 +215,8 @@ def main(argv):
     print 'reading file: '+inps.timeseries
     for date in dateList:
         print date
-        data = h5_timeseries[k].get(date)[:,:]
-        dset = group.create_dataset(date, data=data, compression='gzip')
+        data = readfile.read_hdf5_epoch(h5_timeseries, k, date)
+        dset = group.create_dataset(date, data=data, **writefile.storage_option(shape=data.shape))
         dset.attrs['Title'] = 'Time series displacement'
         dset.attrs['MissingValue'] = FLOAT_ZERO
         dset.attrs['Units'] = 'meters'
@@ -225,7 +226,7 @@ def main(argv):
     if os.path.isfile(inps.incidence_angle):
         print 'reading file: '+inps.incidence_angle
         inc_angle, inc_angle_meta = readfile.read(inps.incidence_angle)
-        dset = group.create_dataset('incidence_angle', data=inc_angle, compression='gzip')
+        dset = group.create_dataset('incidence_angle', data=inc_angle, **writefile.storage_option(shape=inc_angle.shape))
         dset.attrs['Title'] = 'Incidence angle'
         dset.attrs['MissingValue'] = FLOAT_ZERO
         dset.attrs['Units'] = 'degrees'
@@ -235,7 +236,7 @@ def main(argv):
     if os.path.isfile(inps.dem):
         print 'reading file: '+inps.dem
         dem, dem_meta = readfile.read(inps.dem)
-        dset = group.create_dataset('dem', data=dem, compression='gzip')
+        dset = group.create_dataset('dem', data=dem, **writefile.storage_option(shape=dem.shape))
         dset.attrs['Title'] = 'Digital elevatino model'
         dset.attrs['MissingValue'] = INT_ZERO
         dset.attrs['Units'] = 'meters'
@@ -245,7 +246,7 @@ def main(argv):
     if os.path.isfile(inps.coherence):
         print 'reading file: '+inps.coherence
         coherence, coherence_meta = readfile.read(inps.coherence)
-        dset = group.create_dataset('coherence', data=coherence, compression='gzip')
+        dset = group.create_dataset('coherence', data=coherence, **writefile.storage_option(shape=coherence.shape))
         dset.attrs['Title'] = 'Temporal Coherence'
         dset.attrs['MissingValue'] = FLOAT_ZERO
         dset.attrs['Units'] = 'None'
@@ -255,7 +256,7 @@ def main(argv):
     if os.path.isfile(inps.mask):
         print 'reading file: '+inps.mask
         mask, mask_meta = readfile.read(inps.mask)
-        dset = group.create_dataset('mask', data=mask, compression='gzip')
+        dset = group.create_dataset('mask', data=mask, **writefile.storage_option(shape=mask.shape))
         dset.attrs['Title'] = 'Mask'
         dset.attrs['MissingValue'] = INT_ZERO
         dset.attrs['Units'] = 'None'
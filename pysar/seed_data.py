@@ -56,7 +56,7 @@ def seed_file_reference_value(File, outName, refList, ref_y='', ref_x=''):
     if k in ['timeseries','interferograms','wrapped','coherence']:
         ##### Input File Info
         h5file = h5py.File(File,'r')
-        epochList = sorted(h5file[k].keys())
+        epochList = readfile.get_epoch_list(h5file, k)
         epochNum  = len(epochList)
 
         ##### Check Epoch Number
@@ -78,9 +78,9 @@ def seed_file_reference_value(File, outName, refList, ref_y='', ref_x=''):
         print 'number of acquisitions: '+str(epochNum)
         for i in range(epochNum):
             epoch = epochList[i]
-            data = h5file[k].get(epoch)[:]
+            data = readfile.read_hdf5_epoch(h5file, k, epoch)
             data -= refList[i]
-            dset = group.create_dataset(epoch, data=data, compression='gzip')
+            dset = group.create_dataset(epoch, data=data, **writefile.storage_option(shape=data.shape))
             prog_bar.update(i+1, suffix=epoch)
         atr  = seed_attributes(atr,ref_x,ref_y)
         for key,value in atr.iteritems():
@@ -92,14 +92,14 @@ def seed_file_reference_value(File, outName, refList, ref_y='', ref_x=''):
         for i in range(epochNum):
             epoch = epochList[i]
             #print epoch
-            data = h5file[k][epoch].get(epoch)[:]
+            data = readfile.read_hdf5_epoch(h5file, k, epoch)
             atr  = h5file[k][epoch].attrs
 
             data -= refList[i]
             atr  = seed_attributes(atr,ref_x,ref_y)
 
             gg = group.create_group(epoch)
-            dset = gg.create_dataset(epoch, data=data, compression='gzip')
+            dset = gg.create_dataset(epoch, data=data, **writefile.storage_option(shape=data.shape))
             for key, value in atr.iteritems():
                 gg.attrs[key] = value
 
@@ -16,6 +16,9 @@ import getopt
 import random
 import matplotlib.pyplot as plt
 
+import pysar._readfile as readfile
+import pysar._writefile as writefile
+
 
 def usage():
     print '''
@@ -61,7 +64,7 @@ def main(argv):
     vset=h5vel[kv[0]].get(kv[0])
     rate=vset[0:vset.shape[0],0:vset.shape[1]]
     #####################################################
-    igramList=h5file['interferograms'].keys()
+    igramList=readfile.get_epoch_list(h5file, 'interferograms')
     km=h5mask.keys()
     mset=h5mask[km[0]].get(km[0])
     mask=mset[0:mset.shape[0],0:mset.shape[1]]
@@ -107,7 +110,8 @@ def main(argv):
             unw=unw+unwrapError
   
         
-        dset = group.create_dataset(igram, data=unw[ysub[0]:ysub[1],xsub[0]:xsub[1]], compression='gzip')
+        dset = group.create_dataset(igram, data=unw[ysub[0]:ysub[1],xsub[0]:xsub[1]],\
+                                    **writefile.storage_option(shape=(ysub[1]-ysub[0], xsub[1]-xsub[0])))
         for key, value in h5file['interferograms'][igram].attrs.iteritems():
             group.attrs[key] = value
         if igram in unw_err_list:
@@ -56,7 +56,7 @@ def main(argv):
         if inps.disp_fig and k == 'timeseries':
             # Get date list
             h5file = h5py.File(File)
-            dateList = sorted(h5file[k].keys())
+            dateList = readfile.get_epoch_list(h5file, k)
             h5file.close()
             dates, datevector = ptime.date_list2vector(dateList)
 
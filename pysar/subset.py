@@ -503,7 +503,7 @@ def subset_file(File, subset_dict_input, outFile=None):
     if k in ['timeseries','interferograms','wrapped','coherence']:
         ##### Open Input File 
         h5file = h5py.File(File,'r')
-        epochList = sorted(h5file[k].keys())
+        epochList = readfile.get_epoch_list(h5file, k)
         epochNum = len(epochList)
         if k in multi_dataset_hdf5_file:
             print 'number of acquisitions: '+str(epochNum)
@@ -519,13 +519,12 @@ def subset_file(File, subset_dict_input, outFile=None):
     if k == 'timeseries':
         for i in range(epochNum):
             epoch = epochList[i]
-            dset = h5file[k].get(epoch)
-            data_overlap = dset[pix_box4data[1]:pix_box4data[3],pix_box4data[0]:pix_box4data[2]]
+            data_overlap = readfile.read_hdf5_epoch(h5file, k, epoch, pix_box4data)
 
             data = np.ones((pix_box[3]-pix_box[1], pix_box[2]-pix_box[0]))*subset_dict['fill_value']
             data[pix_box4subset[1]:pix_box4subset[3], pix_box4subset[0]:pix_box4subset[2]] = data_overlap
 
-            dset = group.create_dataset(epoch, data=data, compression='gzip')
+            dset = group.create_dataset(epoch, data=data, **writefile.storage_option(shape=data.shape))
             prog_bar.update(i+1, suffix=epoch)
 
         atr_dict = subset_attribute(atr_dict, pix_box)
@@ -536,16 +535,15 @@ def subset_file(File, subset_dict_input, outFile=None):
         date12_list = ptime.list_ifgram2date12(epochList)
         for i in range(epochNum):
             epoch = epochList[i]
-            dset = h5file[k][epoch].get(epoch)
             atr_dict  = h5file[k][epoch].attrs
-            data_overlap = dset[pix_box4data[1]:pix_box4data[3],pix_box4data[0]:pix_box4data[2]]
+            data_overlap = readfile.read_hdf5_epoch(h5file, k, epoch, pix_box4data)
 
             data = np.ones((pix_box[3]-pix_box[1], pix_box[2]-pix_box[0]))*subset_dict['fill_value']
             data[pix_box4subset[1]:pix_box4subset[3], pix_box4subset[0]:pix_box4subset[2]] = data_overlap
 
             atr_dict  = subset_attribute(atr_dict, pix_box, print_message=False)
             gg = group.create_group(epoch)
-            dset = gg.create_dataset(epoch, data=data, compression='gzip')
+            dset = gg.create_dataset(epoch, data=data, **writefile.storage_option(shape=data.shape))
             for key, value in atr_dict.iteritems():
                 gg.attrs[key] = value
             prog_bar.update(i+1, suffix=date12_list[i])
@@ -16,6 +16,7 @@ import h5py
 import numpy as np
 
 import pysar._readfile as readfile
+import pysar._writefile as writefile
 import pysar._pysar_utilities as ut
 
 
@@ -55,7 +56,7 @@ def main(argv):
     k = atr['FILE_TYPE']
     print "Loading time series: " + timeSeriesFile
     h5timeseries=h5py.File(timeSeriesFile)
-    dateList = sorted(h5timeseries['timeseries'].keys())
+    dateList = readfile.get_epoch_list(h5timeseries, 'timeseries')
     date_num = len(dateList)
 
     dateIndex={}
@@ -69,7 +70,7 @@ def main(argv):
     prog_bar = ut.progress_bar(maxValue=date_num, prefix='loading: ')
     for i in range(date_num):
         date = dateList[i]
-        d = h5timeseries['timeseries'].get(date)[:]
+        d = readfile.read_hdf5_epoch(h5timeseries, 'timeseries', date)
         D[dateIndex[date]][:]=d.flatten(0)
         prog_bar.update(i+1, suffix=date)
     prog_bar.close()
@@ -98,7 +99,7 @@ def main(argv):
     for i in range(date_num):
         date = dateList[i]
         d = np.reshape(sumD[dateIndex[date]][:],[length,width])
-        dset = group.create_dataset(date, data=d, compression='gzip')
+        dset = group.create_dataset(date, data=d, **writefile.storage_option(shape=d.shape))
         prog_bar.update(i+1, suffix=date)
     prog_bar.close()
 
@@ -9,10 +9,13 @@
 
 import sys
 import os
+import getopt
+import multiprocessing
 
 import h5py
 import numpy as np
 
+import pysar
 import pysar._datetime as ptime
 import pysar._readfile as readfile
 import pysar._writefile as writefile
@@ -20,11 +23,67 @@ import pysar._pysar_utilities as ut
 
 
 ######################################################################################################
-def temporal_coherence(timeseriesFile, ifgramFile):
+def temporal_coherence_block(box, inps_dict):
+    '''Calculate temporal coherence of pixels within box.
+    Each call opens input files by itself, so that it can run in a worker process.
+    Inputs:
+        box       - 4-tuple of int, area to process, defined in (x0, y0, x1, y1) in pixel coordinate
+        inps_dict - dict, with the following items:
+                    timeseriesFile, date_list, ifgramFile, ifgram_list, A, ref_value, range2phase,
+                    maskFile - string, mask file, only pixels with non-zero value are calculated
+    Output:
+        box      - 4-tuple of int, same as input
+        temp_coh - 2D np.array in size of (box_length, box_width) in float32, NaN for masked out pixels
+    '''
+    box_length, box_width = box[3]-box[1], box[2]-box[0]
+    ifgram_num = len(inps_dict['ifgram_list'])
+
+    # Valid pixels, only them are calculated
+    if inps_dict['maskFile']:
+        pixel_idx = np.flatnonzero(readfile.read(inps_dict['maskFile'], box)[0] != 0)
+    else:
+        pixel_idx = np.arange(box_length*box_width)
+    if pixel_idx.size == 0:
+        return box, ut.scatter_pixel(np.zeros(0), pixel_idx, box_length*box_width).reshape(box_length, box_width)
+
+    h5timeseries = h5py.File(inps_dict['timeseriesFile'], 'r')
+    timeseries = readfile.read_hdf5_stack(h5timeseries, 'timeseries', inps_dict['date_list'], box)
+    h5timeseries.close()
+    timeseries = np.array(timeseries.reshape(len(inps_dict['date_list']), -1)[:, pixel_idx], np.float32)
+    timeseries *= inps_dict['range2phase']
+
+    h5ifgram = h5py.File(inps_dict['ifgramFile'], 'r')
+    data = readfile.read_hdf5_stack(h5ifgram, 'interferograms', inps_dict['ifgram_list'], box)
+    h5ifgram.close()
+    data = np.array(data.reshape(ifgram_num, -1)[:, pixel_idx], np.float32)
+    data -= inps_dict['ref_value']
+
+    # difference between observed and estimated data
+    data -= np.dot(inps_dict['A'], timeseries)
+    del timeseries
+    temp_coh = np.abs(np.sum(np.exp(1j*data), axis=0)) / ifgram_num
+    del data
+
+    temp_coh = ut.scatter_pixel(temp_coh, pixel_idx, box_length*box_width)
+    return box, temp_coh.reshape(box_length, box_width)
+
+
+def temporal_coherence_block_star(args):
+    '''Unpack arguments of temporal_coherence_block(), for multiprocessing.Pool.apply_async()'''
+    return temporal_coherence_block(*args)
+
+
+def temporal_coherence(timeseriesFile, ifgramFile, maskFile=None, max_memory=None, parallel_num=None):
     '''Calculate temporal coherence based on input timeseries file and interferograms file
+    Time series and interferograms are read in matching row blocks, which are calculated by a pool
+    of worker processes, so that memory is bounded by max_memory.
     Inputs:
         timeseriesFile - string, path of time series file
         ifgramFile     - string, path of interferograms file
+        maskFile       - string, mask file, only pixels with non-zero value are calculated,
+                         the others are filled with NaN, None for all pixels
+        max_memory     - float, max memory in GB shared by all workers, default is pysar.max_memory
+        parallel_num   - int, number of worker processes, default is pysar.parallel_num
     Output:
         temp_coh - 2D np.array, temporal coherence in float32
     '''
@@ -33,34 +92,22 @@ def temporal_coherence(timeseriesFile, ifgramFile):
     atr_ts = readfile.read_attribute(timeseriesFile)
     length = int(atr_ts['FILE_LENGTH'])
     width = int(atr_ts['WIDTH'])
-    pixel_num = length * width
 
-    # Read time series data
     h5timeseries = h5py.File(timeseriesFile, 'r')
-    date_list = sorted(h5timeseries['timeseries'].keys())
+    date_list = readfile.get_epoch_list(h5timeseries, 'timeseries')
+    h5timeseries.close()
     date_num = len(date_list)
-
-    print "load time series: "+timeseriesFile
+    print "time series file: "+timeseriesFile
     print 'number of acquisitions: '+str(date_num)
-    timeseries = np.zeros((date_num, pixel_num), np.float32)
-    prog_bar = ptime.progress_bar(maxValue=date_num, prefix='loading: ')
-    for i in range(date_num):
-        date = date_list[i]
-        d = h5timeseries['timeseries'].get(date)[:]
-        timeseries[i][:] = d.flatten(0)
-        prog_bar.update(i+1, suffix=date)
-    prog_bar.close()
-    h5timeseries.close()
 
     # Convert displacement from meter to radian
     range2phase = -4*np.pi/float(atr_ts['WAVELENGTH'])
-    timeseries *= range2phase
 
     # interferograms data
     print "interferograms file: " + ifgramFile
     atr_ifgram = readfile.read_attribute(ifgramFile)
     h5ifgram   = h5py.File(ifgramFile, 'r')
-    ifgram_list = sorted(h5ifgram['interferograms'].keys())
+    ifgram_list = readfile.get_epoch_list(h5ifgram, 'interferograms')
     ifgram_list = ut.check_drop_ifgram(h5ifgram, atr_ifgram, ifgram_list)
     ifgram_num = len(ifgram_list)
 
@@ -68,7 +115,8 @@ def temporal_coherence(timeseriesFile, ifgramFile):
     date12_list = ptime.list_ifgram2date12(ifgram_list)
     A1,B = ut.design_matrix(ifgramFile, date12_list)
     A0 = -1*np.ones([ifgram_num,1])
-    A = np.hstack((A0, A1))
+    # float32 design matrix, to keep the estimated interferograms in float32 in each block
+    A = np.array(np.hstack((A0, A1)), np.float32)
 
     # Get reference pixel
     try:
@@ -77,33 +125,58 @@ def temporal_coherence(timeseriesFile, ifgramFile):
         print 'find reference pixel in y/x: [%d, %d]'%(ref_y, ref_x)
     except ValueError:
         print 'No ref_x/y found! Can not calculate temporal coherence without it.'
-    
-    print 'calculating temporal coherence interferogram by interferogram ...'
-    print 'number of interferograms: '+str(ifgram_num)
-    temp_coh = np.zeros(pixel_num)+0j
-    prog_bar = ptime.progress_bar(maxValue=ifgram_num, prefix='calculating: ')
-    for i in range(ifgram_num):
-        ifgram = ifgram_list[i]
-        # read interferogram
-        data = h5ifgram['interferograms'][ifgram].get(ifgram)[:]
-        data -= data[ref_y, ref_x]
-        data = data.flatten(0)
-
-        # calculate difference between observed and estimated data
-        dataEst  = np.dot(A[i,:], timeseries)
-        dataDiff = data - dataEst
-        temp_coh += np.exp(1j*dataDiff)
-        prog_bar.update(i+1, suffix=date12_list[i])
-    prog_bar.close()
-    del timeseries, data, dataEst, dataDiff
+    ref_value = readfile.read_hdf5_stack(h5ifgram, 'interferograms', ifgram_list,\
+                                         box=(ref_x, ref_y, ref_x+1, ref_y+1)).reshape(ifgram_num, 1)
     h5ifgram.close()
 
-    temp_coh = (np.absolute(temp_coh)/ifgram_num).reshape((length,width))
+    # Row blocks, memory is shared by all workers and blocks waiting for writing
+    if not max_memory:
+        max_memory = pysar.max_memory
+    if not parallel_num:
+        parallel_num = pysar.parallel_num
+    num_cores = max(min(multiprocessing.cpu_count(), parallel_num), 1)
+    # time series and interferograms in float32, exp(1j*residual) in complex64
+    layer_num = date_num + 4*ifgram_num
+    box_list = ut.get_row_block_list(length, width, layer_num, max_memory/(2.*num_cores), min_block_num=4*num_cores)
+    block_num = len(box_list)
+    num_cores = min(num_cores, block_num)
+    if maskFile:
+        print 'only pixels with non-zero value in mask file: '+maskFile
+
+    print 'calculating temporal coherence block by block ...'
+    print 'number of interferograms: '+str(ifgram_num)
+    print 'number of row blocks    : '+str(block_num)
+    print 'number of processes     : '+str(num_cores)
+    inps_dict = {'timeseriesFile':timeseriesFile, 'date_list':date_list, 'ifgramFile':ifgramFile,\
+                 'ifgram_list':ifgram_list, 'A':A, 'ref_value':ref_value, 'range2phase':range2phase,\
+                 'maskFile':maskFile}
+    arg_list = [(box, inps_dict) for box in box_list]
+    if num_cores > 1:
+        pool = multiprocessing.Pool(num_cores)
+    else:
+        pool = None
+
+    temp_coh = np.zeros((length, width), np.float32)
+    prog_bar = ptime.progress_bar(maxValue=block_num, prefix='calculating: ')
+    # keep at most 2*num_cores blocks calculated ahead of collecting
+    block_results = ut.bounded_imap(pool, temporal_coherence_block_star, arg_list, 2*num_cores)
+    for i, (box, data) in enumerate(block_results):
+        temp_coh[box[1]:box[3], box[0]:box[2]] = data
+        prog_bar.update(i+1, suffix='rows %d-%d' % (box[1], box[3]))
+    prog_bar.close()
+    if pool:
+        pool.close()
+        pool.join()
     return temp_coh
     
 
 ######################################################################################################
-USAGE='''usage: temporal_coherence.py [-h] interferograms_file timeseries_file [ output_file ]'''
+USAGE='''usage: temporal_coherence.py [-h] interferograms_file timeseries_file [ output_file ] [ --mask mask_file ]
+                             [ --memory max_memory ] [ --parallel num ]
+
+  --mask     : mask file, only pixels with non-zero value are calculated
+  --memory   : max memory in GB used for block-wise calculation, default is pysar.max_memory
+  --parallel : number of processes, default is pysar.parallel_num'''
 
 DESCRIPTION='''Generates temporal coherence map.'''
 
@@ -117,6 +190,8 @@ California, investigated with the SBAS-InSAR approach, Remote Sens. Environ., 10
 EXAMPLE='''example:
 temporal_coherence.py  unwrapIfgram.h5  timeseries.h5
 temporal_coherence.py  unwrapIfgram.h5  timeseries.h5  temporalCoherence.h5
+temporal_coherence.py  unwrapIfgram.h5  timeseries.h5  --mask mask.h5
+temporal_coherence.py  unwrapIfgram.h5  timeseries.h5  --memory 16 --parallel 32
 '''
 
 def usage():
@@ -126,13 +201,22 @@ def usage():
 
 ######################################################################################################
 def main(argv):
+    maskFile = None
+    max_memory = None
+    parallel_num = None
     try:
+        opts, argv = getopt.gnu_getopt(argv, 'hm:', ['mask=','memory=','parallel='])
         ifgramFile     = argv[0]
         timeseriesFile = argv[1]
     except:
         usage(); sys.exit()
+    for opt, arg in opts:
+        if opt == '-h':  usage();  sys.exit()
+        elif opt in ['-m','--mask']:  maskFile = arg
+        elif opt == '--memory':       max_memory = float(arg)
+        elif opt == '--parallel':     parallel_num = int(arg)
 
-    temp_coherence = temporal_coherence(timeseriesFile, ifgramFile)
+    temp_coherence = temporal_coherence(timeseriesFile, ifgramFile, maskFile, max_memory, parallel_num)
 
     try:    tempCohFile = argv[2]
     except: tempCohFile = 'temporalCoherence.h5'
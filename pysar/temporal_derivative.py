@@ -15,6 +15,9 @@ import datetime
 import h5py
 from numpy import sum,remainder,zeros,dot,reshape, float32, array, hstack, vstack, linalg, eye, ones
 from scipy.stats import nanstd, nanmean
+
+import pysar._readfile as readfile
+import pysar._writefile as writefile
 ######################################
 ######################################
 def usage():
@@ -42,7 +45,7 @@ def main(argv):
     print '\n************ Temporal Derivative **************'
     print "Loading time series: " + timeSeriesFile
     h5timeseries = h5py.File(timeSeriesFile)
-    dateList = h5timeseries['timeseries'].keys()
+    dateList = readfile.get_epoch_list(h5timeseries, 'timeseries')
   
     tbase=[]
     d1 = datetime.datetime(*time.strptime(dateList[0],"%Y%m%d")[0:5])
@@ -73,7 +76,7 @@ def main(argv):
     timeseries = zeros((lt,npix),float32)
     for i in range(lt):
         date=dateList[i]
-        dset= h5timeseries['timeseries'].get(date)
+        dset= readfile.read_hdf5_epoch(h5timeseries, 'timeseries', date)
         d=dset[0:dset.shape[0],0:dset.shape[1]]
         timeseries[i][:]=d.flatten(0)
   
@@ -100,14 +103,16 @@ def main(argv):
     for i in range(lt-1):
         date=dateList[i+1]
         print date
-        dset = group1.create_dataset(date, data=reshape(timeseries_1st[i][:],[nrows,ncols]), compression='gzip')
+        dset = group1.create_dataset(date, data=reshape(timeseries_1st[i][:],[nrows,ncols]),\
+                                     **writefile.storage_option(shape=(nrows,ncols)))
     for key,value in h5timeseries['timeseries'].attrs.iteritems():
         group1.attrs[key] = value
     print 'writing second_derivative.h5'
     for i in range(lt-2):
         date=dateList[i+2]
         print date
-        dset = group2.create_dataset(date, data=reshape(timeseries_2nd[i][:],[nrows,ncols]), compression='gzip')
+        dset = group2.create_dataset(date, data=reshape(timeseries_2nd[i][:],[nrows,ncols]),\
+                                     **writefile.storage_option(shape=(nrows,ncols)))
     for key,value in h5timeseries['timeseries'].attrs.iteritems():
         group2.attrs[key] = value
   
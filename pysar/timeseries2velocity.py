@@ -18,6 +18,7 @@ import argparse
 import numpy as np
 import h5py
 
+import pysar
 import pysar._datetime as ptime
 import pysar._readfile as readfile
 import pysar._writefile as writefile
@@ -86,7 +87,7 @@ def get_velocity_filename(timeseries_file, template_file=None, vel_file='velocit
     inps.template_file = template_file
 
     h5 = h5py.File(timeseries_file, 'r')
-    date_list_all = sorted(h5['timeseries'].keys())
+    date_list_all = readfile.get_epoch_list(h5, 'timeseries')
     h5.close()
 
     ex_date = get_exclude_date(inps, date_list_all)
@@ -137,6 +138,7 @@ EXAMPLE='''example:
   timeseries2velocity.py  timeseries.h5  --start-date 20080201  --end-date 20100508
   timeseries2velocity.py  timeseries.h5  --exclude-date 20040502 20060708 20090103
   timeseries2velocity.py  timeseries.h5  --exclude-date exclude_date.txt
+  timeseries2velocity.py  timeseries.h5  --acceleration --annual --semi-annual --step-date 20110311
 '''
 
 TEMPLATE='''
@@ -167,6 +169,17 @@ def cmdLineParse():
     parser.add_argument('--template', dest='template_file',\
                         help='template file with the following items:'+TEMPLATE)
     parser.add_argument('-o','--output', dest='outfile', help='output file name')
+    parser.add_argument('--memory', dest='max_memory', type=float, default=pysar.max_memory,\
+                        help='max memory in GB used for block-wise processing, default = '+str(pysar.max_memory))
+
+    model = parser.add_argument_group('Deformation model', 'additional terms besides linear velocity,'+\
+                                      ' estimated in the same pass and written into velocity*.h5 files')
+    model.add_argument('--acceleration', action='store_true', help='add acceleration term -> *Acc.h5')
+    model.add_argument('--annual', action='store_true', help='add annual sinusoidal term -> *AnnualAmp.h5')
+    model.add_argument('--semi-annual', dest='semi_annual', action='store_true',\
+                       help='add semi-annual sinusoidal term -> *SemiAnnualAmp.h5')
+    model.add_argument('--step-date', dest='step_date', nargs='+', default=[],\
+                       help='date(s) of step function, i.e. earthquake/volcanic eruption -> *StepYYYYMMDD.h5')
 
     inps = parser.parse_args()
     if not inps.ex_date:
@@ -175,6 +188,54 @@ def cmdLineParse():
 
 
 ############################################################################
+def design_matrix(date_list, acceleration=False, periodic=[], step_date=[]):
+    '''Design matrix of temporal deformation model
+    Inputs:
+        date_list    - list of string in YYYYMMDD format
+        acceleration - bool, add acceleration term
+        periodic     - list of float, period in years of periodic terms, i.e. [1.0, 0.5] for annual and semi-annual
+        step_date    - list of string in YYYYMMDD format, date of step functions
+    Outputs:
+        B          - 2D np.array in size of (date_num, param_num), with velocity and intercept in the 1st/2nd column
+        param_list - list of string, name of each column
+    '''
+    datevector = np.array(ptime.date_list2vector(date_list)[1])
+    tbase = datevector - datevector[0]
+    B = [datevector, np.ones(len(datevector))]
+    param_list = ['velocity', 'intercept']
+    if acceleration:
+        B.append(0.5 * tbase**2)
+        param_list.append('acceleration')
+    for period in periodic:
+        B += [np.cos(2*np.pi/period*tbase), np.sin(2*np.pi/period*tbase)]
+        param_list += ['cos%g' % (period), 'sin%g' % (period)]
+    yy_list = np.array(ptime.yyyymmdd2years(list(date_list)))
+    for date in step_date:
+        B.append(np.array(yy_list >= ptime.yyyymmdd2years(date), np.float64))
+        param_list.append('step'+date)
+    return np.array(B).T, param_list
+
+
+def estimate_velocity_block(data, B_inv, B, std_scale):
+    '''Estimate temporal deformation model of pixels with precomputed projector
+    Inputs:
+        data      - 2D np.array in size of (date_num, pixel_num), time series
+        B_inv     - 2D np.array in size of (param_num, date_num), pseudo-inverse of design matrix
+        B         - 2D np.array in size of (date_num, param_num), design matrix
+        std_scale - 1D np.array in size of (param_num,), sqrt of diagonal of B_inv*B_inv'
+    Outputs:
+        X    - 2D np.array in size of (param_num, pixel_num), estimated parameters
+        rmse - 1D np.array in size of (pixel_num,), root mean square of residual
+        std  - 2D np.array in size of (param_num, pixel_num), standard deviation of parameters
+    '''
+    date_num, param_num = B.shape
+    X = np.dot(B_inv, data)
+    ss_res = np.sum(np.square(data - np.dot(B, X)), axis=0)
+    rmse = np.sqrt(ss_res / date_num)
+    std = np.sqrt(ss_res / (date_num - param_num)) * std_scale.reshape(-1,1)
+    return X, rmse, std
+
+
 def main(argv):
     inps = cmdLineParse()
 
@@ -184,11 +245,11 @@ def main(argv):
     print 'input '+k+' file: '+inps.timeseries_file
     if not k == 'timeseries':
         sys.exit('ERROR: input file is not timeseries!') 
-    h5file = h5py.File(inps.timeseries_file)
+    h5file = h5py.File(inps.timeseries_file, 'r')
 
     #####################################
     ## Date Info
-    dateListAll = sorted(h5file[k].keys())
+    dateListAll = readfile.get_epoch_list(h5file, k)
     print '--------------------------------------------'
     print 'Dates from input file: '+str(len(dateListAll))
     print dateListAll
@@ -209,41 +270,96 @@ def main(argv):
 
     #####################################
     ## Inversion
-    # Design matrix
-    B = np.ones([len(datevector),2])
-    B[:,0] = datevector
-    #B_inv = np.linalg.pinv(B)
-    B_inv = np.dot(np.linalg.inv(np.dot(B.T,B)), B.T)
+    # Design matrix and its projector, shared by all pixels
+    periodic = []
+    if inps.annual:       periodic.append(1.0)
+    if inps.semi_annual:  periodic.append(0.5)
+    step_date = [ptime.yyyymmdd(i) for i in inps.step_date]
+    for date in step_date:
+        if not dateList[0] < date <= dateList[-1]:
+            sys.exit('ERROR: step date '+date+' is out of the time span: '+dateList[0]+' - '+dateList[-1])
+    B, param_list = design_matrix(dateList, inps.acceleration, periodic, step_date)
+    print 'temporal deformation model: '+str(param_list)
+    B_inv = np.linalg.pinv(B)
+    std_scale = np.sqrt(np.sum(B_inv**2, axis=1))
     B_inv = np.array(B_inv, np.float32)
 
-    # Loading timeseries
-    print "Loading time series file: "+inps.timeseries_file+' ...'
+    #####################################
+    # Output file name
+    if not inps.outfile:
+        inps.outfile = 'velocity.h5'
+    fbase, fext = os.path.splitext(inps.outfile)
+    inps.outfile_rmse = fbase+'Rmse'+fext
+    inps.outfile_std = fbase+'Std'+fext
+    inps.outfile_r2 = fbase+'R2'+fext
+
+    # Output files, written block by block: (file name, file type, unit, parameter, product)
+    # with product of est for estimated parameter, std for its standard deviation, amp for amplitude of
+    # periodic term (cos/sin parameter pair) and rmse for residual; unit of None to keep the input unit.
+    out_list = [(inps.outfile,      'velocity', None, 'velocity', 'est'),\
+                (inps.outfile_rmse, 'rmse',     None, None,       'rmse'),\
+                (inps.outfile_std,  'rmse',     None, 'velocity', 'std')]
+    if inps.acceleration:
+        out_list.append((fbase+'Acc'+fext,    'velocity', 'm/yr^2', 'acceleration', 'est'))
+        out_list.append((fbase+'AccStd'+fext, 'velocity', 'm/yr^2', 'acceleration', 'std'))
+    for period in periodic:
+        name = {1.0:'Annual', 0.5:'SemiAnnual'}[period]
+        out_list.append((fbase+name+'Amp'+fext, 'velocity', 'm', 'cos%g' % (period), 'amp'))
+    for date in step_date:
+        out_list.append((fbase+'Step'+date+fext,       'velocity', 'm', 'step'+date, 'est'))
+        out_list.append((fbase+'Step'+date+'Std'+fext, 'velocity', 'm', 'step'+date, 'std'))
+
+    # Row blocks, with time series in float32 and residual in float64
     width = int(atr['WIDTH'])
     length = int(atr['FILE_LENGTH'])
     dateNum = len(dateList)
-    timeseries = np.zeros([dateNum,length*width],np.float32)
-    prog_bar = ptime.progress_bar(maxValue=dateNum, prefix='loading: ')
-    for i in range(dateNum):
-        date = dateList[i]
-        timeseries[i,:] = h5file[k].get(date)[:].flatten()
-        prog_bar.update(i+1, suffix=date)
+    param_num = len(param_list)
+    box_list = ut.get_row_block_list(length, width, 4*dateNum+2*param_num, inps.max_memory)
+
+    # Attributes
+    atr['date1'] = datevector[0]
+    atr['date2'] = datevector[dateNum-1]
+
+    print '--------------------------------------'
+    h5out_list = []
+    for outfile, k_out, unit, param, product in out_list:
+        print 'writing >>> '+outfile
+        atr_out = dict(atr)
+        atr_out['FILE_TYPE'] = k_out
+        if unit:
+            atr_out['UNIT'] = unit
+        h5out = h5py.File(outfile, 'w')
+        group = h5out.create_group(k_out)
+        group.create_dataset(k_out, shape=(length, width), dtype=np.float32,\
+                             **writefile.storage_option(shape=(length, width)))
+        for key, value in atr_out.iteritems():
+            group.attrs[key] = value
+        h5out_list.append(h5out)
+
+    print 'Calculating velocity, rmse and std from time series file: '+inps.timeseries_file
+    print 'number of row blocks: '+str(len(box_list))
+    prog_bar = ptime.progress_bar(maxValue=len(box_list), prefix='calculating: ')
+    for i in range(len(box_list)):
+        box = box_list[i]
+        data = readfile.read_hdf5_stack(h5file, k, dateList, box).reshape(dateNum, -1)
+        X, rmse, std = estimate_velocity_block(data, B_inv, B, std_scale)
+        del data
+        for j in range(len(out_list)):
+            outfile, k_out, unit, param, product = out_list[j]
+            if product == 'rmse':
+                data = rmse
+            else:
+                idx = param_list.index(param)
+                if product == 'est':    data = X[idx]
+                elif product == 'std':  data = std[idx]
+                elif product == 'amp':  data = np.hypot(X[idx], X[idx+1])
+            h5out_list[j][k_out][k_out][box[1]:box[3], box[0]:box[2]] = data.reshape(box[3]-box[1], -1)
+        prog_bar.update(i+1, suffix='rows %d-%d' % (box[1], box[3]))
     prog_bar.close()
     h5file.close()
-
-    # Velocity Inversion
-    print 'Calculating velocity ...'
-    X = np.dot(B_inv, timeseries)
-    velocity = np.reshape(X[0,:], [length,width])
-
-    print 'Calculating rmse ...'
-    timeseries_linear = np.dot(B, X)
-    timeseries_residual = timeseries - timeseries_linear
-    rmse = np.reshape(np.sqrt((np.sum((timeseries_residual)**2,0))/dateNum), [length,width])
-    
-    print 'Calculating the standard deviation of the estimated velocity ...'
-    s1 = np.sqrt(np.sum(timeseries_residual**2,0) / (dateNum-2))
-    s2 = np.sqrt(np.sum((datevector-np.mean(datevector))**2))
-    std = np.reshape(s1/s2, [length,width])
+    for j in range(len(out_list)):
+        h5out_list[j].close()
+        readfile.clear_metadata_cache(out_list[j][0])
 
     # SSt=np.sum((timeseries-np.mean(timeseries,0))**2,0)
     # SSres=np.sum(residual**2,0)
@@ -252,33 +368,6 @@ def main(argv):
     ######################################################  
     # covariance of the velocities
 
-    #####################################
-    # Output file name
-    if not inps.outfile:
-        inps.outfile = 'velocity.h5'
-
-    inps.outfile_rmse = os.path.splitext(inps.outfile)[0]+'Rmse'+os.path.splitext(inps.outfile)[1]
-    inps.outfile_std = os.path.splitext(inps.outfile)[0]+'Std'+os.path.splitext(inps.outfile)[1]
-    inps.outfile_r2 = os.path.splitext(inps.outfile)[0]+'R2'+os.path.splitext(inps.outfile)[1]
-
-    # Attributes
-    atr['date1'] = datevector[0]
-    atr['date2'] = datevector[dateNum-1]
-
-    # File Writing
-    print '--------------------------------------'
-    atr['FILE_TYPE'] = 'velocity'
-    print 'writing >>> '+inps.outfile
-    writefile.write(velocity, atr, inps.outfile)
-    
-    atr['FILE_TYPE'] = 'rmse'
-    print 'writing >>> '+inps.outfile_rmse
-    writefile.write(rmse, atr, inps.outfile_rmse)
-    
-    atr['FILE_TYPE'] = 'rmse'
-    print 'writing >>> '+inps.outfile_std
-    writefile.write(std, atr, inps.outfile_std)
-
     print 'Done.\n'
     return inps.outfile
 
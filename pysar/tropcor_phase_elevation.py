@@ -16,7 +16,75 @@ import h5py
 import numpy as np
 import matplotlib.pyplot as plt
 
+import pysar
+import pysar._datetime as ptime
 import pysar._readfile as readfile
+import pysar._writefile as writefile
+import pysar._pysar_utilities as ut
+
+
+######################################
+def design_matrix(dem, p=1):
+    '''Design matrix of polynomial of elevation, in [dem**p, ..., dem, 1]'''
+    dem = np.array(dem, np.float64).reshape(-1)
+    return np.vstack([dem**i for i in range(p,-1,-1)]).T
+
+
+def read_masked_pixels(h5file, k, mask, max_memory=None):
+    '''Read pixels marked by mask of all epochs, in one pass of row blocks
+    Inputs:
+        h5file - HDF5 file object
+        k      - string, file type / group name, i.e. timeseries
+        mask   - 2D np.array of bool in size of (length, width)
+    Output:
+        data   - 2D np.array in size of (epoch_num, pixel_num), pixels in row-major order of mask
+    '''
+    epoch_num = len(readfile.get_epoch_list(h5file, k))
+    length, width = mask.shape
+    data = np.zeros((epoch_num, np.sum(mask)), np.float32)
+    # row block and its masked pixels, both in float32
+    box_list = ut.get_row_block_list(length, width, 2*epoch_num, max_memory)
+    i0 = 0
+    for box in box_list:
+        mask_box = mask[box[1]:box[3],:]
+        i1 = i0 + np.sum(mask_box)
+        data[:,i0:i1] = readfile.read_hdf5_stack(h5file, k, box=box)[:,mask_box]
+        i0 = i1
+    return data
+
+
+def correlation_with_dem(data, dem, diff=False, max_memory=None):
+    '''Correlation coefficient of each row of data with dem, same as np.corrcoef([dem, data[i]])[0][1]
+    Rows are converted to float64 in chunks, so no copy of the whole data matrix is made.
+    Inputs:
+        data - 2D np.array in size of (epoch_num, pixel_num)
+        dem  - 1D np.array in size of (pixel_num,)
+        diff - bool, use differences of subsequent rows, i.e. rows of np.diff(data, axis=0)
+        max_memory - float, max memory in GB for each chunk of rows, default is pysar.max_memory
+    Output:
+        cor  - 1D np.array in size of (epoch_num,), or (epoch_num-1,) if diff is True
+    '''
+    dem = np.array(dem, np.float64) - np.mean(dem)
+    dem_norm = np.sqrt(np.dot(dem, dem))
+    row_num = data.shape[0] - int(diff)
+
+    # Chunk of rows, holding the float64 copy and the temporary of difference in float64
+    if not max_memory:
+        max_memory = pysar.max_memory
+    row_step = int(max_memory * 1024**3 / (2. * 8 * max(data.shape[1], 1)))
+    row_step = min(max(row_step, 1), max(row_num, 1))
+
+    cor = np.zeros(row_num)
+    for i0 in range(0, row_num, row_step):
+        i1 = min(i0+row_step, row_num)
+        if diff:
+            d = np.array(data[i0+1:i1+1], np.float64) - data[i0:i1]
+        else:
+            d = np.array(data[i0:i1], np.float64)
+        d -= np.mean(d, axis=1).reshape(-1,1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            cor[i0:i1] = np.dot(d, dem) / (np.sqrt(np.einsum('ij,ij->i', d, d)) * dem_norm)
+    return cor
 
 
 ######################################
@@ -96,7 +164,6 @@ def main(argv):
     #dset = h5Mask[kMask[0]].get(kMask[0])
     #Mask = dset[0:dset.shape[0],0:dset.shape[1]]
     kMask = Matr['FILE_TYPE']
-    Mask=Mask.flatten(1)
 
     #print maskThr
 
@@ -109,95 +176,57 @@ def main(argv):
     #print '\n************ Tropospheric Delay Correction - Topo-related *************'
 
     ###################################################
-    h5timeseries = h5py.File(timeSeriesFile)
-    yref=h5timeseries['timeseries'].attrs['ref_y']
-    xref=h5timeseries['timeseries'].attrs['ref_x']
+    h5timeseries = h5py.File(timeSeriesFile,'r')
+    k = 'timeseries'
+    atr = dict(h5timeseries[k].attrs)
+    yref = int(atr['ref_y'])
+    xref = int(atr['ref_x'])
     ###################################################
     dem,demRsc = readfile.read(demFile)
     dem -= dem[yref,xref]
 
     print 'considering the look angle of each resolution cell...'
-    near_LA=float(h5timeseries['timeseries'].attrs['LOOK_REF1'])
-    far_LA=float(h5timeseries['timeseries'].attrs['LOOK_REF2'])
+    near_LA=float(atr['LOOK_REF1'])
+    far_LA=float(atr['LOOK_REF2'])
     Length,Width=np.shape(dem)
     LA=np.linspace(near_LA,far_LA,Width)
-    LA=np.tile(LA,[Length,1])
-    dem=dem/np.cos(LA*np.pi/180.0)       
-       
-    dem=dem.flatten(1)
+    dem=dem/np.cos(LA*np.pi/180.0)
     print np.shape(dem)
     ###################################################
-    if p==1:
-        A=np.vstack((dem[ndx],np.ones(len(dem[ndx])))).T
-        B = np.vstack((dem,np.ones(len(dem)))).T
-    elif p==2: 
-        A=np.vstack((dem[ndx]**2,dem[ndx],np.ones(len(dem[ndx])))).T
-        B = np.vstack((dem**2,dem,np.ones(len(dem)))).T  
-    elif p==3:
-        A = np.vstack((dem[ndx]**3,dem[ndx]**2,dem[ndx],np.ones(len(dem[ndx])))).T
-        B = np.vstack((dem**3,dem**2,dem,np.ones(len(dem)))).T
+    A = design_matrix(dem[ndx], p)
     print np.shape(A)
-
     Ainv=np.linalg.pinv(A)
     ###################################################
     print 'Estimating the tropospheric effect using the differences of the subsequent epochs and DEM'
-    
-    dateList = sorted(h5timeseries['timeseries'].keys())
-    nrows,ncols=np.shape(h5timeseries['timeseries'].get(dateList[0]))
-    PAR_EPOCH_DICT_2={} 
-    par_diff_Dict={}
-    Correlation_Dict={}
+
+    dateList = readfile.get_epoch_list(h5timeseries, k)
+    date_num = len(dateList)
+    if readfile.is_cube_hdf5(h5timeseries, k):  layout = 'cube'
+    else:  layout = 'split'
+
+    ## 1st pass: masked pixels of all epochs
+    data = read_masked_pixels(h5timeseries, k, ndx)
+    cor = correlation_with_dem(data, dem[ndx])
+    cor_diff = correlation_with_dem(data, dem[ndx], diff=True)
+    Correlation_Dict = dict(zip(dateList, cor))
     Correlation_Dict[dateList[0]]=0
-    Correlation_diff_Dict={}
 
     print '%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%'
     print 'correlation of dem with :'
     print '******************************'
-
-    for i in range(len(dateList)-1):
-        dset1 = h5timeseries['timeseries'].get(dateList[i])
-        dset2 = h5timeseries['timeseries'].get(dateList[i+1])
-        data1 = dset1[0:dset1.shape[0],0:dset1.shape[1]]
-        data2 = dset2[0:dset2.shape[0],0:dset2.shape[1]]
-        d = dset2[0:dset2.shape[0],0:dset2.shape[1]] - dset1[0:dset1.shape[0],0:dset1.shape[1]]
-         
-        del dset1
-        del dset2
-        d=d.flatten(1)
-        data1=data1.flatten(1)
-        data2=data2.flatten(1)
-        ##############################
-        C1=np.zeros([2,len(dem[ndx])])
-        C1[0][:]=dem[ndx]
-        C1[1][:]=data1[ndx]
-        print dateList[i]+': '+str(np.corrcoef(C1)[0][1])
- 
-        C2=np.zeros([2,len(dem[ndx])])
-        C2[0][:]=dem[ndx]
-        C2[1][:]=data2[ndx]
-        print dateList[i+1]+': '+str(np.corrcoef(C2)[0][1])
-        Correlation_Dict[dateList[i+1]]=np.corrcoef(C2)[0][1]
- 
-        C=np.zeros([2,len(dem[ndx])])
-        C[0][:]=dem[ndx]
-        C[1][:]=d[ndx]
-        print dateList[i]+'-'+dateList[i+1]+': '+str(np.corrcoef(C)[0][1])
+    for i in range(date_num-1):
+        print dateList[i]+': '+str(cor[i])
+        print dateList[i+1]+': '+str(cor[i+1])
+        print dateList[i]+'-'+dateList[i+1]+': '+str(cor_diff[i])
         print '******************************'
-        Correlation_diff_Dict[dateList[i]+'-'+dateList[i+1]]=np.corrcoef(C)[0][1]
-
-        ##############################
-        par=np.dot(Ainv,d[ndx])
-        par_diff_Dict[dateList[i]+'-'+dateList[i+1]]=par  
- 
-        try:
-            if np.abs(np.corrcoef(C2)[0][1]) >= corThr:        
-                PAR2=np.dot(Ainv,data2[ndx])
-            else:
-                PAR2=list(np.zeros(p+1))
-        except:
-             PAR2=np.dot(Ainv,data2[ndx])
-  
-        PAR_EPOCH_DICT_2[dateList[i+1]]=PAR2
+
+    ## Polynomial coefficients of all epochs, 1st epoch is not corrected
+    # both in float32, so the product of all epochs makes no copy of data
+    par_epoch = np.zeros((date_num, p+1), np.float32)
+    par_epoch[1:] = np.dot(data[1:], Ainv.T.astype(np.float32))
+    try:
+        par_epoch[~(np.abs(cor) >= corThr)] = 0.
+    except NameError: pass
     ###################################################
     print'****************************************'
     print 'Correlation of DEM with each time-series epoch:'
@@ -217,52 +246,42 @@ def main(argv):
     if save_plot == 'yes':
         fig=plt.figure(1)
         ax = fig.add_subplot(3,1,1)
-        ax.plot(dem[ndx],data1[ndx],'o',ms=1)
+        ax.plot(dem[ndx],data[-2],'o',ms=1)
         ax = fig.add_subplot(3,1,2)
-        ax.plot(dem[ndx],data2[ndx],'o',ms=1)
+        ax.plot(dem[ndx],data[-1],'o',ms=1)
         ax = fig.add_subplot(3,1,3)
-        ax.plot(dem[ndx],d[ndx],'o',ms=1)
+        ax.plot(dem[ndx],data[-1]-data[-2],'o',ms=1)
         plt.show()
+    del data
 
     ###################################################
-    # print par_diff_Dict
-    par_epoch_Dict={}
-    par_epoch_Dict[dateList[1]]=par_diff_Dict[dateList[0]+'-'+dateList[1]]
-
-    for i in range(2,len(dateList)):
-        par_epoch_Dict[dateList[i]]=par_epoch_Dict[dateList[i-1]]+par_diff_Dict[dateList[i-1]+'-'+dateList[i]]
-
-    yref=h5timeseries['timeseries'].attrs['ref_y']
-    xref=h5timeseries['timeseries'].attrs['ref_x']
+    ## 2nd pass: remove the tropospheric delay from each row block of all epochs
     print 'removing the tropospheric delay from each epoch'
     print 'writing >>> '+outName
     h5tropCor = h5py.File(outName,'w')
-    group = h5tropCor.create_group('timeseries')
-    dset = group.create_dataset(dateList[0], data=h5timeseries['timeseries'].get(dateList[0]), compression='gzip')
-    for date in dateList:
-        if not date in h5tropCor['timeseries']:
-            print date
-            dset = h5timeseries['timeseries'].get(date) 
-            data = dset[0:dset.shape[0],0:dset.shape[1]]
-            par=PAR_EPOCH_DICT_2[date]
-   
-            tropo_effect = np.reshape(np.dot(B,par),[dset.shape[1],dset.shape[0]]).T
-            tropo_effect -= tropo_effect[yref,xref]
-            dset = group.create_dataset(date, data=data-tropo_effect, compression='gzip')
-
-    for key,value in h5timeseries['timeseries'].attrs.iteritems():
-        group.attrs[key] = value
-   
-    try: 
+    writefile.create_hdf5_stack(h5tropCor, k, dateList, Length, Width, atr, layout=layout)
+    B_ref = design_matrix(dem[yref,xref], p)
+    # time series and tropospheric delay in float32, design matrix and its temporaries in float64
+    box_list = ut.get_row_block_list(Length, Width, 2*date_num+4*(p+2))
+    prog_bar = ptime.progress_bar(maxValue=Length)
+    for box in box_list:
+        B = np.array(design_matrix(dem[box[1]:box[3],:].flatten(), p) - B_ref, np.float32)
+        tropo_effect = np.dot(par_epoch, B.T).reshape(date_num, box[3]-box[1], Width)
+        data = readfile.read_hdf5_stack(h5timeseries, k, box=box)
+        data -= tropo_effect
+        writefile.write_hdf5_block(h5tropCor, k, data, box=box)
+        prog_bar.update(box[3], suffix='line %d' % box[3])
+    prog_bar.close()
+
+    if 'mask' in h5timeseries.keys():
         dset1 = h5timeseries['mask'].get('mask')
         group=h5tropCor.create_group('mask')
-        dset = group.create_dataset('mask', data=dset1, compression='gzip')
-    except: pass
+        dset = group.create_dataset('mask', data=dset1, **writefile.storage_option(shape=dset1.shape))
 
     h5tropCor.close()
     h5timeseries.close()
 
-    
+
 ###################################################
 if __name__ == '__main__':
     main(sys.argv[1:])
@@ -13,6 +13,8 @@ import os
 import sys
 import argparse
 import re
+import hashlib
+import multiprocessing
 
 try:
     import pyaps as pa
@@ -22,6 +24,7 @@ except:
 import h5py
 import numpy as np
 
+import pysar
 import pysar._datetime as ptime
 import pysar._pysar_utilities as ut
 import pysar._readfile as readfile
@@ -54,9 +57,50 @@ def closest_weather_product_time(sar_acquisition_time, grib_source='ECMWF'):
     return grib_hr
 
 
-def get_delay(grib_file, atr, inps_dict):
-    # Get delay matrix using PyAPS
-    if 'X_FIRST' in atr.keys():
+# Checksum of DEM files, keyed by path, size and modification time
+file_checksum_cache = dict()
+
+def file_checksum(fname):
+    '''MD5 checksum of data file and its metadata file if existed, computed once per file version in a process'''
+    fname = os.path.abspath(fname)
+    stat = os.stat(fname)
+    file_key = (fname, stat.st_size, stat.st_mtime)
+    if file_key not in file_checksum_cache:
+        md5 = hashlib.md5()
+        for f_name in [fname, fname+'.rsc']:
+            if os.path.isfile(f_name):
+                with open(f_name, 'rb') as f:
+                    for chunk in iter(lambda: f.read(64*1024**2), b''):
+                        md5.update(chunk)
+        file_checksum_cache[file_key] = md5.hexdigest()
+    return file_checksum_cache[file_key]
+
+
+def get_zenith_delay(grib_file, inps_dict, geo_coord=False):
+    '''Get zenith delay matrix using PyAPS, cached on disk next to the grib file.
+    The cache file is keyed on the path, size and modification time of grib file, the checksum of DEM,
+    grib source, delay type and coordinate, so that re-running after adding new dates only computes delay
+    of the new dates, without reading the existing grib files.
+    Inputs:
+        grib_file - string, path of weather data file
+        inps_dict - dict, with dem_file, grib_source and delay_type
+        geo_coord - bool, DEM in geo coord (PyAPS_geo) or radar coord (PyAPS_rdr)
+    Output:
+        phs - 2D np.array, zenith delay
+    '''
+    grib_stat = os.stat(grib_file)
+    key = '%s_%d_%r_%s_%s_%s_%s' % (os.path.abspath(grib_file), grib_stat.st_size, grib_stat.st_mtime,\
+                                    file_checksum(inps_dict['dem_file']), inps_dict['grib_source'],\
+                                    inps_dict['delay_type'], str(geo_coord))
+    key = hashlib.md5(key).hexdigest()
+    delay_file = os.path.splitext(grib_file)[0]+'_delay_'+key[:16]+'.npy'
+    if os.path.isfile(delay_file):
+        try:
+            return np.load(delay_file)
+        except Exception:
+            print 'WARNING: can not read delay file: '+delay_file
+
+    if geo_coord:
         aps = pa.PyAPS_geo(grib_file, inps_dict['dem_file'], grib=inps_dict['grib_source'],\
                            verb=True, Del=inps_dict['delay_type'])
     else:
@@ -64,21 +108,43 @@ def get_delay(grib_file, atr, inps_dict):
                            verb=True, Del=inps_dict['delay_type'])
     phs = np.zeros((aps.ny, aps.nx))
     aps.getdelay(phs, inc=0.0)
-    
+
+    # Write to temporary file first, so that parallel processes never read a partial delay
+    try:
+        delay_file_tmp = delay_file+'.%d.tmp' % os.getpid()
+        with open(delay_file_tmp, 'wb') as f:
+            np.save(f, phs)
+        os.rename(delay_file_tmp, delay_file)
+    except (IOError, OSError):
+        print 'WARNING: can not write delay file: '+delay_file
+    return phs
+
+
+def get_zenith_delay_star(args):
+    return get_zenith_delay(*args)
+
+
+def los_delay(phs, atr, inps_dict):
+    '''Convert zenith delay into relative delay in LOS direction'''
     # Get relative phase delay in space
     yref = int(atr['ref_y'])
     xref = int(atr['ref_x'])
-    phs -= phs[yref, xref]
+    phs = phs - phs[yref, xref]
     
     # project into LOS direction
     phs /= np.cos(inps_dict['incidence_angle'])
     
     # reverse the sign for consistency between different phase correction steps/methods
     phs *= -1
-    
     return phs
 
 
+def get_delay(grib_file, atr, inps_dict):
+    # Get delay matrix using PyAPS
+    phs = get_zenith_delay(grib_file, inps_dict, geo_coord='X_FIRST' in atr.keys())
+    return los_delay(phs, atr, inps_dict)
+
+
 ###############################################################
 EXAMPLE='''example:
   tropcor_pyaps.py timeseries.h5 -d radar_8rlks.hgt
@@ -132,6 +198,8 @@ def cmdLineParse():
     parser.add_argument('--template', dest='template_file',\
                         help='template file with input options below:\n'+TEMPLATE)
     parser.add_argument('-o', dest='out_file', help='Output file name for trospheric corrected timeseries.')
+    parser.add_argument('--parallel', dest='parallel_num', type=int, default=pysar.parallel_num,\
+                        help='number of processes to calculate delay, default is pysar.parallel_num')
 
     inps = parser.parse_args()
 
@@ -197,7 +265,7 @@ def main(argv):
     inps.grib_file_list = []
     if not inps.date_list_file:
         h5timeseries = h5py.File(inps.timeseries_file, 'r')
-        dateList = sorted(h5timeseries['timeseries'].keys())
+        dateList = readfile.get_epoch_list(h5timeseries, 'timeseries')
         h5timeseries.close()
         print 'read date list info from: '+inps.timeseries_file
     else:
@@ -258,51 +326,67 @@ def main(argv):
         inps.incidence_angle = ut.incidence_angle(atr)
     inps.incidence_angle = inps.incidence_angle*np.pi/180.0
     
-    ## Create delay hdf5 file
+    ## Calculate phase delay on reference date
+    if 'ref_date' in atr.keys():
+        ref_idx = dateList.index(atr['ref_date'])
+    else:
+        ref_idx = 0
+    print 'calculating phase delay on reference date: '+dateList[ref_idx]
+    inps_dict = dict([(key, vars(inps)[key]) for key in ['dem_file','grib_source','delay_type']])
+    geo_coord = 'X_FIRST' in atr.keys()
+    phs_ref = get_zenith_delay(inps.grib_file_list[ref_idx], inps_dict, geo_coord)
+
+    ## Calculate phase delay on the other dates in worker processes, write in the main process
+    # pool is created before opening HDF5 files, which are not fork-safe
+    date_num = len(dateList)
+    num_cores = max(min(multiprocessing.cpu_count(), inps.parallel_num, date_num-1), 1)
+    arg_list = [(inps.grib_file_list[i], inps_dict, geo_coord) for i in range(date_num) if not i == ref_idx]
+    if num_cores > 1:
+        print 'parallel processing using %d cores ...' % (num_cores)
+        pool = multiprocessing.Pool(num_cores)
+    else:
+        pool = None
+
+    ## Create delay hdf5 file and tropospheric corrected timeseries hdf5 file
+    h5timeseries = h5py.File(inps.timeseries_file, 'r')
+    if readfile.is_cube_hdf5(h5timeseries, 'timeseries'):  layout = 'cube'
+    else:  layout = 'split'
+    length = int(atr['FILE_LENGTH'])
+    width = int(atr['WIDTH'])
+
     tropFile = inps.grib_source+'.h5'
     print 'writing >>> '+tropFile
     h5trop = h5py.File(tropFile, 'w')
-    group_trop = h5trop.create_group('timeseries')
+    writefile.create_hdf5_stack(h5trop, 'timeseries', dateList, length, width, atr, layout=layout)
     
-    ## Create tropospheric corrected timeseries hdf5 file
     if not inps.out_file:
         ext = os.path.splitext(inps.timeseries_file)[1]
         inps.out_file = os.path.splitext(inps.timeseries_file)[0]+'_'+inps.grib_source+'.h5'
     print 'writing >>> '+inps.out_file
     h5timeseries_tropCor = h5py.File(inps.out_file, 'w')
-    group_tropCor = h5timeseries_tropCor.create_group('timeseries')
+    writefile.create_hdf5_stack(h5timeseries_tropCor, 'timeseries', dateList, length, width, atr, layout=layout)
 
-    ## Calculate phase delay on reference date
-    if 'ref_date' in atr.keys():
-        ref_idx = dateList.index(atr['ref_date'])
-    else:
-        ref_idx = 0
-    print 'calculating phase delay on reference date: '+dateList[ref_idx]
-    phs_ref = get_delay(inps.grib_file_list[ref_idx], atr, vars(inps))
-
-    ## Loop to calculate phase delay on the other dates
-    h5timeseries = h5py.File(inps.timeseries_file, 'r')
-    for i in range(len(inps.grib_file_list)):
+    # keep at most 2*num_cores dates calculated ahead of writing
+    delay_results = ut.bounded_imap(pool, get_zenith_delay_star, arg_list, 2*num_cores)
+    for i in range(date_num):
         # Get phase delay
-        grib_file = inps.grib_file_list[i] 
         if not i == ref_idx:
             print dateList[i]
-            phs = get_delay(grib_file, atr, vars(inps))
+            phs = next(delay_results)
         else:
             phs = np.copy(phs_ref)
         # Get relative phase delay in time
-        phs -= phs_ref
+        phs = los_delay(phs - phs_ref, atr, vars(inps))
         
         # Write dataset
         print 'writing hdf5 file ...'
-        data = h5timeseries['timeseries'].get(dateList[i])[:]
-        dset  = group_tropCor.create_dataset(dateList[i], data=data-phs, compression='gzip')
-        dset  = group_trop.create_dataset(dateList[i], data=phs, compression='gzip')
-    
-    ## Write Attributes
-    for key,value in atr.iteritems():
-        group_tropCor.attrs[key] = value
-        group_trop.attrs[key] = value
+        data = readfile.read_hdf5_epoch(h5timeseries, 'timeseries', dateList[i])
+        writefile.write_hdf5_block(h5timeseries_tropCor, 'timeseries', (data-phs).reshape(1,length,width),\
+                                   epoch_list=[dateList[i]])
+        writefile.write_hdf5_block(h5trop, 'timeseries', phs.reshape(1,length,width), epoch_list=[dateList[i]])
+    if pool:
+        pool.close()
+        pool.join()
     
     h5timeseries.close()
     h5timeseries_tropCor.close()
@@ -85,7 +85,7 @@ if __name__ == '__main__':
         raise ValueError('Only timeseries file is supported!')
 
     h5 = h5py.File(inps.timeseries_file,'r')
-    dateList = sorted(h5[k].keys())
+    dateList = readfile.get_epoch_list(h5, k)
     dates, tims = ptime.date_list2vector(dateList)
 
     # Read exclude dates
@@ -158,9 +158,9 @@ if __name__ == '__main__':
         print 'No mask used.'
 
     # Initial Map
-    d_v = h5[k].get(dateList[inps.epoch_num])[:]*inps.unit_fac
+    d_v = readfile.read_hdf5_epoch(h5, k, dateList[inps.epoch_num])*inps.unit_fac
     if inps.ref_date:
-        inps.ref_d_v = h5[k].get(inps.ref_date)[:]*inps.unit_fac
+        inps.ref_d_v = readfile.read_hdf5_epoch(h5, k, inps.ref_date)*inps.unit_fac
         d_v -= inps.ref_d_v
     if mask is not None:
         d_v = mask_matrix(d_v, mask)
@@ -249,7 +249,7 @@ if __name__ == '__main__':
         timein = tslider.val
         idx_nearest = np.argmin(np.abs(np.array(tims)-timein))
         ax_v.set_title('N = %d, Time = %s' % (idx_nearest, dates[idx_nearest].strftime('%Y-%m-%d')))
-        d_v = h5[k].get(dateList[idx_nearest])[:]*inps.unit_fac
+        d_v = readfile.read_hdf5_epoch(h5, k, dateList[idx_nearest])*inps.unit_fac
         if inps.ref_date:
             d_v -= inps.ref_d_v
         if mask is not None:
@@ -269,12 +269,11 @@ if __name__ == '__main__':
     def update_timeseries(y, x):
         '''Plot point time series displacement at pixel [y, x]'''
         global fig_ts,ax_ts,inps,dates
-        d_ts = []
-        for date in dateList:
-            d = h5[k].get(date)[y,x]
-            if inps.ref_yx:
-                d -= h5[k].get(date)[inps.ref_yx[0], inps.ref_yx[1]]
-            d_ts.append(d*inps.unit_fac)
+        d_ts = readfile.read_hdf5_stack(h5, k, dateList, box=(x,y,x+1,y+1)).flatten()
+        if inps.ref_yx:
+            ref_y, ref_x = inps.ref_yx
+            d_ts -= readfile.read_hdf5_stack(h5, k, dateList, box=(ref_x,ref_y,ref_x+1,ref_y+1)).flatten()
+        d_ts *= inps.unit_fac
         
         if inps.zero_first:
             d_ts -= d_ts[0]
@@ -11,11 +11,14 @@
 import sys
 import os
 import getopt
+import multiprocessing
 
 import h5py
 import numpy as np
 from scipy.linalg import pinv
 
+import pysar
+import pysar._datetime as ptime
 import pysar._pysar_utilities as ut
 import pysar._readfile as readfile
 import pysar._writefile as writefile
@@ -42,6 +45,104 @@ def phase_bonding(data,mask,x,y):
   
     return data
 
+
+##########################################################################################
+# Cache of closure inversion matrix for each pattern of interferograms constrained to zero correction,
+# shared by all blocks processed in the same (worker) process.
+closure_inv_cache = dict()
+
+def closure_inverse_matrix(C, fix_ifgram):
+    '''Matrix mapping phase closure to integer ambiguity of interferograms, with Tikhonov regularization.
+    Inputs:
+        C          - 2D np.array in size of (triangle_num, ifgram_num), closure matrix
+        fix_ifgram - 1D np.array of bool in size of (ifgram_num,), interferograms only in triangles
+                     with closure below threshold, whose ambiguity is constrained to zero
+    Output:
+        K - 2D np.array in size of (ifgram_num, ifgram_num), ambiguity = round(K * phase)
+    '''
+    ifgram_num = C.shape[1]
+    D = np.eye(ifgram_num)[fix_ifgram]
+    AAAA = np.vstack([-2*np.pi*C, D, 0.25*np.eye(ifgram_num)])
+    # only closure part of observation is non-zero: [C*phase; 0; 0]
+    return np.dot(pinv(AAAA)[:, :C.shape[0]], C)
+
+
+def unwrap_error_closure(data, C, curls, thr=0.5):
+    '''Estimate phase unwrapping error of pixels based on triangular consistency / phase closure
+    Pixels are grouped by the pattern of interferograms fixed by triangles with small closure, which
+    fully determines the inversion system, so the pseudo-inverse is computed once per unique pattern
+    and cached, and applied to all pixels of the pattern at once.
+    Inputs:
+        data  - 2D np.array in size of (ifgram_num, pixel_num), unwrapped phase
+        C     - 2D np.array in size of (triangle_num, ifgram_num), closure matrix
+        curls - 2D np.array of int in size of (triangle_num, 3), interferogram index of each triangle
+        thr   - float, threshold of closure phase in radian
+    Output:
+        data_cor - 2D np.array in size of (ifgram_num, pixel_num), phase with unwrapping error corrected
+    '''
+    global closure_inv_cache
+    ifgram_num, pixel_num = data.shape
+    triangle_num = curls.shape[0]
+    C_key = C.tostring()
+
+    # Closure phase and interferograms in triangles with/without large closure
+    curl = data[curls[:,0]] + data[curls[:,2]] - data[curls[:,1]]
+    tri2ifgram = np.zeros((ifgram_num, triangle_num), np.float32)
+    for i in range(3):
+        tri2ifgram[curls[:,i], np.arange(triangle_num)] = 1.
+    with np.errstate(invalid='ignore'):
+        ifgram_bad  = np.dot(tri2ifgram, np.abs(curl) >= thr) > 0
+        ifgram_good = np.dot(tri2ifgram, np.abs(curl) <  thr) > 0
+    fix_ifgram = ifgram_good & ~ifgram_bad
+    del ifgram_bad, ifgram_good
+
+    # Group pixels with the same fixed interferograms
+    pattern, idx_first, idx_inv, pixel_order, group_bound = ut.group_pixel_pattern(fix_ifgram)
+
+    cache_max = 0.25 * pysar.max_memory * 1024**3 / (ifgram_num**2 * 8)
+    data_cor = np.array(data, np.float32)
+    for i in range(len(idx_first)):
+        key = (C_key, pattern[idx_first[i]].tostring())
+        if key not in closure_inv_cache:
+            if len(closure_inv_cache) > cache_max:
+                closure_inv_cache.clear()
+            closure_inv_cache[key] = closure_inverse_matrix(C, fix_ifgram[:, idx_first[i]])
+        pixel_idx = pixel_order[group_bound[i]:group_bound[i+1]]
+        data_cor[:, pixel_idx] += np.round(np.dot(closure_inv_cache[key], data[:, pixel_idx])) * 2.*np.pi
+    return data_cor
+
+
+def unwrap_error_closure_block(box, inps_dict):
+    '''Correct phase unwrapping error of interferograms within box based on phase closure
+    Each call opens input files by itself, so that it can run in a worker process.
+    Inputs:
+        box       - 4-tuple of int, area to process, defined in (x0, y0, x1, y1) in pixel coordinate
+        inps_dict - dict, with the following items:
+                    ifgramFile, ifgram_list, C, curls, thr
+                    maskFile - string, mask file, only pixels with value 1 are corrected
+    Output:
+        box      - 4-tuple of int, same as input
+        data_cor - 3D np.array in size of (ifgram_num, box_length, box_width), corrected phase
+    '''
+    ifgram_num = len(inps_dict['ifgram_list'])
+    h5ifgram = h5py.File(inps_dict['ifgramFile'], 'r')
+    data = readfile.read_hdf5_stack(h5ifgram, 'interferograms', inps_dict['ifgram_list'], box)
+    h5ifgram.close()
+    data_shape = data.shape
+    data = np.array(data.reshape(ifgram_num, -1), np.float32)
+
+    pixel_idx = np.flatnonzero(readfile.read(inps_dict['maskFile'], box)[0] == 1)
+    if pixel_idx.size > 0:
+        data[:, pixel_idx] = unwrap_error_closure(data[:, pixel_idx], inps_dict['C'], inps_dict['curls'],\
+                                                  inps_dict['thr'])
+    return box, data.reshape(data_shape)
+
+
+def unwrap_error_closure_block_star(args):
+    '''Unpack arguments of unwrap_error_closure_block(), for multiprocessing.Pool.apply_async()'''
+    return unwrap_error_closure_block(*args)
+
+
 ####################################################################################################
 def usage():
     print '''
@@ -67,11 +168,14 @@ def usage():
       -f : unwrapped interferograms, i.e. Seeded_LoadedData.h5
       -m : mask file to specify those pixels which user wants to correct for unwrapping errors.
       -o : output file name [default is interferogram_file_unwCor.h5]
+      --memory   : max memory in GB used for block-wise correction, default is pysar.max_memory
+      --parallel : number of processes, default is pysar.parallel_num
 
   Examples:
       unwrap_error.py Seeded_unwrapIfgram.h5 mask.h5
       unwrap_error.py -f Seeded_unwrapIfgram.h5 -m mask.h5
       unwrap_error.py Seeded_unwrapIfgram.h5
+      unwrap_error.py -f Seeded_unwrapIfgram.h5 -m mask.h5 --memory 16 --parallel 32
 
 
   -------------------------------------------------------------------
@@ -131,10 +235,12 @@ def main(argv):
     ramp_type = 'plane'
     save_rampCor = 'yes'
     plot_bonding_points = 'yes'
+    max_memory   = pysar.max_memory
+    parallel_num = pysar.parallel_num
   
     ##### Check Inputs
     if len(sys.argv)>2:
-        try: opts, args = getopt.getopt(argv,'h:f:m:x:y:o:t:',['ramp=','no-ramp-save'])
+        try: opts, args = getopt.getopt(argv,'h:f:m:x:y:o:t:',['ramp=','no-ramp-save','memory=','parallel='])
         except getopt.GetoptError:  print 'Error while getting args';  usage(); sys.exit(1)
   
         for opt,arg in opts:
@@ -147,6 +253,8 @@ def main(argv):
             elif opt in '-t':    templateFile = arg
             elif opt in '--ramp'         :  ramp_type    = arg.lower()
             elif opt in '--no-ramp-save' :  save_rampCor = 'no'
+            elif opt in '--memory'       :  max_memory   = float(arg)
+            elif opt in '--parallel'     :  parallel_num = int(arg)
   
     elif len(sys.argv)==2:
         if argv[0] in ['-h','--help']:    usage();  sys.exit()
@@ -192,135 +300,68 @@ def main(argv):
     if method == 'triangular_consistency':
         print 'Phase unwrapping error correction using Triangular Consistency / Phase Closure'
   
-        h5file=h5py.File(File)
-        ifgramList = h5file['interferograms'].keys()
-        sx = int(h5file['interferograms'][ifgramList[0]].attrs['WIDTH'])
-        sy = int(h5file['interferograms'][ifgramList[0]].attrs['FILE_LENGTH'])
+        h5file = h5py.File(File, 'r')
+        ifgramList = readfile.get_epoch_list(h5file, 'interferograms')
+        atr = readfile.read_attribute(File)
+        sx = int(atr['WIDTH'])
+        sy = int(atr['FILE_LENGTH'])
         curls,Triangles,C=ut.get_triangles(h5file)
-        A,B = ut.design_matrix(File)
-        ligram,lv=np.shape(B)
-        lcurls=np.shape(curls)[0]
+        # closure system is inverted in dense form, once per pattern of fixed interferograms
+        C = C.toarray()
+        ligram = len(ifgramList)
+        lcurls = curls.shape[0]
         print 'Number of all triangles: '+  str(lcurls)
         print 'Number of interferograms: '+ str(ligram)
-        #print curls
-  
-        curlfile='curls.h5'
-        if not os.path.isfile(curlfile):
-            ut.generate_curls(curlfile,h5file,Triangles,curls)
-         
-        thr=0.50
-        curls=np.array(curls);   n1=curls[:,0];   n2=curls[:,1];   n3=curls[:,2]
-  
-        numPixels=sy*sx
-        print 'reading interferograms...'   
-        data = np.zeros((ligram,numPixels),np.float32)
-        for ni in range(ligram):
-            dset=h5file['interferograms'][ifgramList[ni]].get(ifgramList[ni])
-            d = dset[0:dset.shape[0],0:dset.shape[1]]
-            data[ni] = d.flatten(1)   
-  
-        print np.shape(data)
-        print 'reading curls ...' 
-        h5curl=h5py.File(curlfile)
-        curlList=h5curl['interferograms'].keys()
-        curlData = np.zeros((lcurls,numPixels),np.float32)
-        for ni in range(lcurls):
-            dset=h5curl['interferograms'][curlList[ni]].get(curlList[ni])
-            d = dset[0:dset.shape[0],0:dset.shape[1]]
-            curlData[ni] = d.flatten(1)
-        pi=np.pi
-        EstUnwrap=np.zeros((ligram,numPixels),np.float32)
-  
-        #try:
-        #    maskFile=argv[1]
-        #    h5Mask=h5py.File(maskFile)
-        #    dset = h5Mask['mask'].get('mask')
-        #    Mask=dset[0:dset.shape[0],0:dset.shape[1]]
-        #except:
-        #    dset = h5file['mask'].get('mask')
-        #    Mask=dset[0:dset.shape[0],0:dset.shape[1]]
-        
-        Mask=Mask.flatten(1)
-
-        for ni in range(numPixels):
-            #dU = np.zeros([ligram,1])
-            #print np.shape(dU)
-            #print np.shape(data[:,ni])
-  
-            if Mask[ni]==1:
-                dU = data[:,ni]
-                #nan_ndx = dataPoint == 0.
-                unwCurl = np.array(curlData[:,ni])
-                #print unwCurl
-  
-                ind  = np.abs(unwCurl)>=thr;      N1 =n1[ind];      N2 =n2[ind];      N3 =n3[ind]
-                indC = np.abs(unwCurl)< thr;      Nc1=n1[indC];     Nc2=n2[indC];     Nc3=n3[indC]
-  
-                N =np.hstack([N1, N2, N3]);       UniN =np.unique(N)
-                Nc=np.hstack([Nc1,Nc2,Nc3]);      UniNc=np.unique(Nc)
-  
-                inter=list(set(UniNc) & set(UniN)) # intersetion
-                UniNc= list(UniNc)
-                for x in inter:
-                    UniNc.remove(x)
-  
-                D=np.zeros([len(UniNc),ligram])
-                for i in range(len(UniNc)):
-                    D[i,UniNc[i]]=1
-  
-                AAA=np.vstack([-2*pi*C,D])
-                #AAA1=np.hstack([AAA,np.zeros([AAA.shape[0],lv])])
-                #AAA2=np.hstack([-2*pi*np.eye(ligram),B]) 
-                #AAAA=np.vstack([AAA1,AAA2])
-                AAAA=np.vstack([AAA,0.25*np.eye(ligram)])
-  
-                #print '************************'
-                #print np.linalg.matrix_rank(C)
-                #print np.linalg.matrix_rank(AAA) 
-                #print np.linalg.matrix_rank(AAAA)
-                #print '************************'
-  
-                #LLL=list(np.dot(C,dU)) + list(np.zeros(np.shape(UniNc)[0]))# + list(dU)
-                #ind=np.isnan(AAA)
-                #M1=pinv(AAA)      
-                #M=np.dot(M1,LLL)
-                #EstUnwrap[:,ni]=np.round(M[0:ligram])*2.0*np.pi
-  
-                ##########
-                # with Tikhonov regularization:
-                AAAA=np.vstack([AAA,0.25*np.eye(ligram)])
-                LLL=list(np.dot(C,dU)) + list(np.zeros(np.shape(UniNc)[0])) + list(np.zeros(ligram))
-                ind=np.isnan(AAAA)
-                M1=pinv(AAAA)
-                M=np.dot(M1,LLL)
-                EstUnwrap[:,ni]=np.round(M[0:ligram])*2.0*np.pi
-                #print M[0:ligram]
-                #print np.round(M[0:ligram])
-  
-            else:
-                EstUnwrap[:,ni]=np.zeros([ligram])
-                if not np.remainder(ni,10000): print 'Processing point: %7d of %7d ' % (ni,numPixels)
-
-        ##### Output
-        dataCor = data+EstUnwrap
-        unwCorFile=File.replace('.h5','')+'_unwCor.h5';  print 'writing >>> '+unwCorFile
-        h5unwCor=h5py.File(unwCorFile,'w') 
-        gg = h5unwCor.create_group('interferograms') 
-        for i in range(ligram):
-            group = gg.create_group(ifgramList[i])
-            dset = group.create_dataset(ifgramList[i], data=np.reshape(dataCor[i,:],[sx,sy]).T, compression='gzip')
-            for key, value in h5file['interferograms'][ifgramList[i]].attrs.iteritems():
-                group.attrs[key] = value
-  
+
+        ##### Output file with the same layout and attributes as input
+        atr_list = [dict(h5file['interferograms'][ifgram].attrs) for ifgram in ifgramList]
+        if readfile.is_cube_hdf5(h5file, 'interferograms'):  layout = 'cube'
+        else:  layout = 'split'
+        h5file.close()
+
+        ##### Row blocks, memory is shared by all workers and blocks waiting for writing
+        num_cores = max(min(multiprocessing.cpu_count(), parallel_num), 1)
+        # phase, closure phase and their patterns, correction in float32
+        layer_num = 3*ligram + 2*lcurls
+        box_list = ut.get_row_block_list(sy, sx, layer_num, max_memory/(2.*num_cores), min_block_num=4*num_cores)
+        block_num = len(box_list)
+        num_cores = min(num_cores, block_num)
+        print 'number of row blocks: '+str(block_num)
+        print 'number of processes : '+str(num_cores)
+
+        inps_dict = {'ifgramFile':File, 'ifgram_list':ifgramList, 'C':C, 'curls':curls, 'thr':0.50,\
+                     'maskFile':maskFile}
+        arg_list = [(box, inps_dict) for box in box_list]
+        # pool is created before opening output HDF5 file, which is not fork-safe
+        if num_cores > 1:
+            pool = multiprocessing.Pool(num_cores)
+        else:
+            pool = None
+
+        print 'writing >>> '+outName
+        h5unwCor = h5py.File(outName, 'w')
+        writefile.create_hdf5_stack(h5unwCor, 'interferograms', ifgramList, sy, sx, atr_list=atr_list, layout=layout)
+
+        prog_bar = ptime.progress_bar(maxValue=block_num, prefix='correcting: ')
+        # keep at most 2*num_cores blocks corrected ahead of writing
+        block_results = ut.bounded_imap(pool, unwrap_error_closure_block_star, arg_list, 2*num_cores)
+        for i, (box, dataCor) in enumerate(block_results):
+            writefile.write_hdf5_block(h5unwCor, 'interferograms', dataCor, box)
+            prog_bar.update(i+1, suffix='rows %d-%d' % (box[1], box[3]))
+        prog_bar.close()
+        if pool:
+            pool.close()
+            pool.join()
+
+        h5file = h5py.File(File, 'r')
         try:
             MASK=h5file['mask'].get('mask')
             gm = h5unwCor.create_group('mask')
-            dset = gm.create_dataset('mask', data=MASK, compression='gzip')
+            dset = gm.create_dataset('mask', data=MASK, **writefile.storage_option(shape=MASK.shape))
         except: pass
-  
+
         h5unwCor.close()
         h5file.close()
-        h5curl.close() 
 
 
     ####################  Bonding Points (Spatial Continuity)  ####################
@@ -380,7 +421,7 @@ def main(argv):
             k=h5file.keys()
             if 'interferograms' in k: k[0] = 'interferograms';  print 'Input file is '+k[0]
             else: print 'Input file - '+File+' - is not interferograms.';  usage();  sys.exit(1)
-            igramList = sorted(h5file[k[0]].keys())
+            igramList = readfile.get_epoch_list(h5file, k[0])
   
             #### Write
             h5out = h5py.File(outName,'w')
@@ -396,7 +437,7 @@ def main(argv):
             print 'Number of interferograms: '+str(len(igramList))
             for igram in igramList:
                 print igram
-                data = h5file[k[0]][igram].get(igram)[:]
+                data = readfile.read_hdf5_epoch(h5file, k[0], igram)
   
                 data_ramp,ramp = rm.remove_data_surface(data,ramp_mask,ramp_type)
                 #ramp = data_ramp - data
@@ -404,20 +445,21 @@ def main(argv):
                 dataCor = data_rampCor - ramp
   
                 group = gg.create_group(igram)
-                dset = group.create_dataset(igram, data=dataCor, compression='gzip')
+                dset = group.create_dataset(igram, data=dataCor, **writefile.storage_option(shape=dataCor.shape))
                 for key, value in h5file[k[0]][igram].attrs.iteritems():
                     group.attrs[key]=value
   
                 if save_rampCor == 'yes':
                     group_ramp = gg_ramp.create_group(igram)
-                    dset = group_ramp.create_dataset(igram, data=data_rampCor, compression='gzip')
+                    dset = group_ramp.create_dataset(igram, data=data_rampCor, **writefile.storage_option(shape=data_rampCor.shape))
                     for key, value in h5file[k[0]][igram].attrs.iteritems():
                         group_ramp.attrs[key]=value
   
             try:
                 mask = h5file['mask'].get('mask');
                 gm = h5out.create_group('mask')
-                dset = gm.create_dataset('mask', data=mask[0:mask.shape[0],0:mask.shape[1]], compression='gzip')
+                dset = gm.create_dataset('mask', data=mask[0:mask.shape[0],0:mask.shape[1]],\
+                                         **writefile.storage_option(shape=mask.shape))
             except: print 'no mask group found.'
   
             h5file.close()
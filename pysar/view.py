@@ -1129,7 +1129,7 @@ def main(argv):
     if k in multi_group_hdf5_file+multi_dataset_hdf5_file:
         # Read Epoch List
         h5file = h5py.File(inps.file,'r')
-        epochList = sorted(h5file[k].keys())
+        epochList = readfile.get_epoch_list(h5file, k)
         h5file.close()
 
         # Epochs to display
@@ -1349,8 +1349,7 @@ def main(argv):
                 # Read Data
                 h5file = h5py.File(inps.file, 'r')
                 if k in multi_dataset_hdf5_file:
-                    dset = h5file[k].get(epoch)
-                    data = dset[inps.pix_box[1]:inps.pix_box[3], inps.pix_box[0]:inps.pix_box[2]]
+                    data = readfile.read_hdf5_epoch(h5file, k, epoch, inps.pix_box)
                     if inps.ref_date:
                         data -= ref_data
                     subplot_title = dt.strptime(epoch, '%Y%m%d').isoformat()[0:10]
@@ -1359,8 +1358,7 @@ def main(argv):
                         subplot_title = str(epochList.index(epoch)+1)
                     else:
                         subplot_title = str(epochList.index(epoch)+1)+'\n'+h5file[k][epoch].attrs['DATE12']
-                    dset = h5file[k][epoch].get(epoch)
-                    data = dset[inps.pix_box[1]:inps.pix_box[3], inps.pix_box[0]:inps.pix_box[2]]
+                    data = readfile.read_hdf5_epoch(h5file, k, epoch, inps.pix_box)
                 # mask
                 if inps.mask_file:
                     data = mask.mask_matrix(data, msk)